@@ -1,18 +1,253 @@
+import asyncio
+import time
+
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    TypeVar,
+)
+from pydantic import BaseModel, ConfigDict
+
+from async_adbc.device import Device, Status
+from async_adbc.plugins.pm import ApkSource
+from async_adbc.pool import ConnectionPool
 from async_adbc.protocol import Connection, create_connection
+from async_adbc.registry import DeviceRegistry
 
 
-from async_adbc.service.host import HostService
+from async_adbc.service.host import DeviceNotFoundError, HostService
+from async_adbc.service.local import ProgressCallback
 
 
 DEFAULT_HOST = "127.0.0.1"
 DEFAULT_PORT = 5037
 
+T = TypeVar("T")
+
+
+class FanoutResult(BaseModel, Generic[T]):
+    """
+    fanout中单台设备的执行结果，成功时error为None
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    serialno: str
+    result: Optional[T] = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0  # 耗时，单位秒
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
 class ADBClient(HostService):
-    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        pool_size: int = 4,
+        pool_idle_timeout: float = 30,
+        pool_prewarm: int = 1,
+        max_connecting: int = 32,
+    ) -> None:
+        """
+        Args:
+            host (str, optional): adb server地址. Defaults to DEFAULT_HOST.
+            port (int, optional): adb server端口. Defaults to DEFAULT_PORT.
+            pool_size (int, optional): 每个设备连接池最多保留的预热连接数. Defaults to 4.
+            pool_idle_timeout (float, optional): 预热连接空闲超时，单位秒. Defaults to 30.
+            pool_prewarm (int, optional): 每个设备保持的预热连接数，0表示关闭预热. Defaults to 1.
+            max_connecting (int, optional): 同时发起的连接数上限，避免塞满adb server的accept队列. Defaults to 32.
+        """
         super().__init__()
         self.host = host
         self.port = port
+        self.pool = ConnectionPool(
+            self.create_connection,
+            max_size=pool_size,
+            idle_timeout=pool_idle_timeout,
+            prewarm=pool_prewarm,
+        )
+        self.max_connecting = max_connecting
+        self._connecting: Optional[asyncio.Semaphore] = None
+        self.registry = DeviceRegistry(self)
 
     async def create_connection(self) -> Connection:
-        conn = await create_connection(self.host, self.port)
+        # 信号量要在事件循环里创建，python3.8/3.9的Semaphore会绑定创建时的事件循环
+        if self._connecting is None:
+            self._connecting = asyncio.Semaphore(self.max_connecting)
+
+        async with self._connecting:
+            conn = await create_connection(self.host, self.port)
         return conn
+
+    async def transport(self, serialno: str) -> Connection:
+        """
+        获取一条切换到设备转发模式的连接，优先用连接池里预热好的连接
+
+        Args:
+            serialno (str): 设备序列号
+
+        Returns:
+            Connection: 连接，用完直接关闭即可
+        """
+        return await self.pool.acquire(serialno)
+
+    async def devices(self, status: Status = Status.DEVICE) -> List[Device]:
+        """
+        获取设备列表
+
+        调用过 `track()` 之后直接从注册表里取，不再请求adb server，返回的Device对象是同一个。
+
+        Args:
+            status (Status, optional): 设备状态. Defaults to Status.DEVICE.
+
+        Returns:
+            List[Device]: 设备列表
+        """
+        if self.registry.running:
+            return self.registry.devices(status)
+        return await super().devices(status)
+
+    async def device(
+        self, serialno: Optional[str] = None, status: Status = Status.DEVICE
+    ) -> Device:
+        if not self.registry.running:
+            return await super().device(serialno, status)
+
+        if serialno is not None and status == Status.DEVICE:
+            device = self.registry.get(serialno)
+        else:
+            devices = self.registry.devices(status)
+            if serialno is not None:
+                devices = [dev for dev in devices if dev.serialno == serialno]
+            device = devices[0] if devices else None
+
+        if device is None:
+            raise DeviceNotFoundError(serialno or "default")
+        return device
+
+    async def track(self) -> DeviceRegistry:
+        """
+        启动设备注册表，之后 `devices()` 、 `device()` 都从注册表里取
+
+        Returns:
+            DeviceRegistry: 设备注册表
+        """
+        await self.registry.start()
+        return self.registry
+
+    async def close(self):
+        """
+        停止设备注册表，关闭连接池里所有的预热连接
+        """
+        await self.registry.close()
+        await self.pool.close()
+
+    async def fanout(
+        self,
+        fn: Callable[[Device], Awaitable[T]],
+        devices: Optional[Iterable[Device]] = None,
+        concurrency: int = 16,
+        timeout: Optional[float] = None,
+    ) -> AsyncGenerator[FanoutResult[T], Any]:
+        """
+        在多台设备上并发执行同一个操作，按完成顺序返回每台设备的结果
+
+        单台设备的异常或超时只会记录在它自己的结果里，不会影响其他设备。
+        提前退出迭代会取消还没完成的设备。
+
+        Args:
+            fn (Callable[[Device], Awaitable[T]]): 对单台设备执行的操作
+            devices (Optional[Iterable[Device]], optional): 设备列表，默认是所有在线设备. Defaults to None.
+            concurrency (int, optional): 同时执行的设备数. Defaults to 16.
+            timeout (Optional[float], optional): 单台设备的超时，单位秒. Defaults to None.
+
+        Yields:
+            FanoutResult[T]: 单台设备的结果
+        """
+        if devices is None:
+            devices = await self.devices()
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _run(device: Device) -> FanoutResult[T]:
+            async with semaphore:
+                start = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(fn(device), timeout)
+                    return FanoutResult(
+                        serialno=device.serialno,
+                        result=result,
+                        elapsed=time.monotonic() - start,
+                    )
+                except Exception as e:
+                    return FanoutResult(
+                        serialno=device.serialno,
+                        error=e,
+                        elapsed=time.monotonic() - start,
+                    )
+
+        tasks = [asyncio.ensure_future(_run(device)) for device in devices]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def install_many(
+        self,
+        apk: str,
+        devices: Optional[Iterable[Device]] = None,
+        args: str = "rd",
+        concurrency: int = 16,
+        timeout: Optional[float] = None,
+        progress_cb: Optional[ProgressCallback] = None,
+    ) -> AsyncGenerator[FanoutResult[bool], Any]:
+        """
+        同时在多台设备上安装同一个apk，按完成顺序返回每台设备的结果
+
+        apk只做一次内存映射，所有设备共享同一份数据，用 `PMPlugin.install_stream`
+        直接流式写给 `pm install -S` ，设备上不产生临时文件。
+
+        Args:
+            apk (str): apk文件路径
+            devices (Optional[Iterable[Device]], optional): 设备列表，默认是所有在线设备. Defaults to None.
+            args (str, optional): lrtsdg 等同 adb install的参数. Defaults to "rd".
+            concurrency (int, optional): 同时安装的设备数. Defaults to 16.
+            timeout (Optional[float], optional): 单台设备的超时，单位秒. Defaults to None.
+            progress_cb (Optional[ProgressCallback], optional): 进度回调，第一个参数是设备序列号. Defaults to None.
+
+        Yields:
+            FanoutResult[bool]: 单台设备的结果，安装失败时error是 `InstallError`
+        """
+        loop = asyncio.get_event_loop()
+        source = await loop.run_in_executor(None, ApkSource, apk)
+
+        def install(device: Device) -> Awaitable[bool]:
+            device_cb = None
+            if progress_cb:
+
+                def device_cb(_path: str, size: int, has_send: int):
+                    progress_cb(device.serialno, size, has_send)
+
+            return device.pm.install_stream(source, args, device_cb)
+
+        results = self.fanout(install, devices, concurrency, timeout)
+        try:
+            async for result in results:
+                yield result
+        finally:
+            # 先等所有设备的任务结束，再解除映射
+            await results.aclose()
+            source.close()
@@ -0,0 +1,211 @@
+"""
+设备端常驻agent
+
+每次读取 /proc 等文件都要经过一次adb请求，adbd还要fork一个 `sh` 和 `cat` 。
+agent模式把一个很小的shell循环脚本推到设备上，通过一条长连接的shell v2流跟它通信：
+主机往stdin写读取请求，agent把文件内容和分隔行写回stdout。
+
+agent不可用的时候（不支持shell v2、启动失败、连接断开），`Device.read_files` 会退回到 `shell_batch` 。
+"""
+import asyncio
+import os
+import typing
+import uuid
+
+from asyncio import StreamReader
+from importlib import resources
+from typing import List, Optional, Sequence
+
+from async_adbc.protocol import (
+    SHELL_CLOSE_STDIN,
+    SHELL_EXIT,
+    SHELL_STDIN,
+    SHELL_STDOUT,
+    Connection,
+    ProtocolError,
+    pack_shell_packet,
+    read_shell_packet,
+)
+from async_adbc.service.local import ShellResult
+
+if typing.TYPE_CHECKING:
+    from async_adbc.device import Device
+
+with resources.path("async_adbc", "vendor") as path:
+    AGENT_SCRIPT = os.path.join(path, "agent", "adbc_agent.sh")
+
+# 单个文件最大长度，超过会导致读取失败
+AGENT_READ_LIMIT = 16 * 1024 * 1024
+
+
+class AgentChannel(typing.Protocol):
+    """
+    agent的通信通道，stdin写入、stdout读取
+    """
+
+    def write(self, data: bytes) -> None:
+        ...
+
+    async def drain(self) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class ShellV2Channel:
+    """
+    把shell v2连接包装成普通的读写流：stdout数据包转发到reader，写入的数据打包成stdin数据包
+    """
+
+    def __init__(self, conn: Connection) -> None:
+        self._conn = conn
+        self.reader = StreamReader(limit=AGENT_READ_LIMIT)
+        self._pump_task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        try:
+            while True:
+                packet_id, data = await read_shell_packet(self._conn.reader)
+                if packet_id == SHELL_STDOUT:
+                    self.reader.feed_data(data)
+                elif packet_id == SHELL_EXIT:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.reader.feed_eof()
+
+    def write(self, data: bytes):
+        self._conn.writer.write(pack_shell_packet(SHELL_STDIN, data))
+
+    async def drain(self):
+        await self._conn.writer.drain()
+
+    def close(self):
+        if not self._conn.closed:
+            self._conn.writer.write(pack_shell_packet(SHELL_CLOSE_STDIN))
+        self._conn.close()
+        self._pump_task.cancel()
+
+
+class Agent:
+    """
+    设备端常驻agent
+
+    Args:
+        device (Device): 设备
+        timeout (float, optional): 一次read_files的超时，单位秒，超时后关闭通道退回到 `shell_batch` . Defaults to 5.
+    """
+
+    REMOTE_PATH = "/data/local/tmp/adbc_agent.sh"
+
+    def __init__(self, device: "Device", timeout: float = 5) -> None:
+        self._device = device
+        self.timeout = timeout
+        self._reader: Optional[StreamReader] = None
+        self._channel: Optional[AgentChannel] = None
+        self._delimiter = b""
+        self._lock = asyncio.Lock()
+        self._request_id = 0
+
+    @property
+    def running(self) -> bool:
+        return self._channel is not None
+
+    async def start(self) -> bool:
+        """
+        推送agent脚本并启动
+
+        Returns:
+            bool: 启动成功返回True，设备不支持时返回False
+        """
+        if self.running:
+            return True
+
+        try:
+            if not await self._device.supports_shell_v2():
+                return False
+
+            await self._device.push(AGENT_SCRIPT, self.REMOTE_PATH)
+
+            delimiter = f"__ADBC_{uuid.uuid4().hex}__"
+            conn = await self._device.create_connection()
+            await conn.request(f"shell,v2,raw:sh {self.REMOTE_PATH} {delimiter}")
+        except Exception:
+            return False
+
+        channel = ShellV2Channel(conn)
+        self.attach(channel.reader, channel, delimiter)
+        return True
+
+    def attach(self, reader: StreamReader, channel: AgentChannel, delimiter: str):
+        """
+        接管一个已经运行agent脚本的通道，`start` 内部使用，也可以用来接本地进程做测试
+
+        Args:
+            reader (StreamReader): agent的stdout
+            channel (AgentChannel): agent的stdin
+            delimiter (str): 启动agent时传入的分隔符
+        """
+        self._reader = reader
+        self._channel = channel
+        self._delimiter = delimiter.encode()
+
+    async def read_files(self, paths: Sequence[str]) -> List[ShellResult]:
+        """
+        读取多个文件，所有请求一次写入，再按顺序读取响应
+
+        Args:
+            paths (Sequence[str]): 文件路径列表
+
+        Raises:
+            ConnectionError: agent没有运行、通道已经断开或者读取超时
+
+        Returns:
+            List[ShellResult]: 与paths一一对应的结果，exit_code非0表示读取失败
+        """
+        async with self._lock:
+            if self._channel is None or self._reader is None:
+                raise ConnectionError("agent没有运行")
+
+            ids = []
+            requests = []
+            for path in paths:
+                self._request_id += 1
+                ids.append(self._request_id)
+                requests.append(f"{self._request_id} {path}\n")
+
+            try:
+                self._channel.write("".join(requests).encode())
+                # 读不完的文件（比如没有写入端的管道）会一直占着锁，超时后关闭通道
+                return await asyncio.wait_for(self._read_responses(ids), self.timeout)
+            except Exception as e:
+                self.close()
+                raise ConnectionError("agent通道已断开") from e
+
+    async def _read_responses(self, ids: List[int]) -> List[ShellResult]:
+        assert self._channel is not None
+        await self._channel.drain()
+        return [await self._read_response(i) for i in ids]
+
+    async def _read_response(self, request_id: int) -> ShellResult:
+        assert self._reader is not None
+        marker = b"\n" + self._delimiter + b" "
+
+        data = await self._reader.readuntil(marker)
+        fields = (await self._reader.readuntil(b"\n")).split()
+
+        if int(fields[0]) != request_id:
+            raise ProtocolError(f"agent响应错位，期望{request_id}，收到{fields[0]!r}")
+
+        return ShellResult(stdout=data[: -len(marker)], exit_code=int(fields[1]))
+
+    def close(self):
+        """
+        关闭通道，设备端agent读到stdin结束后会自行退出
+        """
+        if self._channel is not None:
+            self._channel.close()
+        self._channel = None
+        self._reader = None
@@ -1,10 +1,16 @@
 import enum
+import inspect
 import re
 import typing
 
 from async_lru import alru_cache
+from async_adbc.agent import Agent
+from async_adbc.plugin import Plugin
+from async_adbc.processes import PROCESSES_CMD, ProcessTable, parse_processes
 from async_adbc.protocol import Connection
-from async_adbc.service.local import LocalService
+from async_adbc.sampling import Metric, Sampler
+from async_adbc.screenrecord import SCREENRECORD_MAX_TIME, stream_screenrecord
+from async_adbc.service.local import LocalService, ShellResult
 
 from async_adbc.plugins import (
     PMPlugin,
@@ -30,11 +36,29 @@ if typing.TYPE_CHECKING:
     from async_adbc.adbclient import ADBClient
 
 
+def _invalidate_alru_caches(obj: typing.Any):
+    """
+    清掉对象上所有 `alru_cache` 缓存的方法和属性里属于这个对象的缓存
+    """
+    for name, attr in inspect.getmembers(type(obj)):
+        if isinstance(attr, property):
+            cached = attr.fget
+            if hasattr(cached, "cache_invalidate"):
+                cached.cache_invalidate(obj)  # type: ignore
+        elif hasattr(attr, "cache_invalidate"):
+            getattr(obj, name).cache_invalidate()
+
+
 class Status(enum.Enum):
     DEVICE = "device"
     OFFLINE = "offline"
     UNKNOWN = "unknown"
 
+    @classmethod
+    def _missing_(cls, value):
+        # unauthorized、recovery、bootloader等其他状态都当作UNKNOWN
+        return cls.UNKNOWN
+
 
 class Device(LocalService):
     def __init__(self, adbc: "ADBClient", serialno: str) -> None:
@@ -58,10 +82,16 @@ class Device(LocalService):
         self.wm = WMPlugin(self)
         self.input = InputPlugin(self)
 
+        self.agent = Agent(self)
+
     async def create_connection(self) -> Connection:
-        conn = await self.adbc.create_connection()
-        await conn.transport_mode(self.serialno)
-        return conn
+        """
+        从ADBClient的连接池里取一条已经处于转发模式的连接，参考 `ADBClient.transport`
+
+        Returns:
+            Connection: 连接
+        """
+        return await self.adbc.transport(self.serialno)
 
     @property
     @alru_cache
@@ -84,6 +114,160 @@ class Device(LocalService):
 
         return properties
 
+    @property
+    @alru_cache
+    async def features(self) -> typing.List[str]:
+        """
+        获取设备adbd支持的特性列表
+
+        特性在设备连接期间不会变化，所以做了缓存
+
+        Returns:
+            List[str]: 特性列表
+        """
+        return await self.adbc.features(self.serialno)
+
+    @property
+    @alru_cache
+    async def page_size(self) -> int:
+        """
+        内核页大小，/proc/<pid>/statm 等按页计数的数据的单位
+
+        arm64设备可能是16K页，不能按4096算，页大小在设备运行期间不会变化，所以做了缓存
+
+        Returns:
+            int: 页大小，单位字节，获取失败时为4096
+        """
+        output = await self.shell("getconf PAGESIZE")
+        try:
+            return int(output.strip())
+        except ValueError:
+            return 4096
+
+    def invalidate_caches(self):
+        """
+        清掉设备和所有插件上缓存的数据（props、cpu核心数、温度传感器表等等），
+        并丢弃连接池里的预热连接、关闭agent。
+
+        设备断开或者重启之后这些缓存都可能失效，`DeviceRegistry` 会自动调用。
+        """
+        _invalidate_alru_caches(self)
+        for attr in vars(self).values():
+            if isinstance(attr, Plugin):
+                _invalidate_alru_caches(attr)
+
+        self.agent.close()
+        self.adbc.pool.discard(self.serialno)
+
+    async def supports_shell_v2(self) -> bool:
+        return "shell_v2" in await self.features
+
+    async def read_files(self, paths: typing.Sequence[str]) -> typing.List[ShellResult]:
+        """
+        读取多个设备文件，主要用于 /proc、/sys 下的性能数据
+
+        agent已经启动的时候通过agent读取，否则（或者agent断开后）用一次 `shell_batch` 读取。
+
+        Args:
+            paths (Sequence[str]): 文件路径列表
+
+        Returns:
+            List[ShellResult]: 与paths一一对应的结果，exit_code非0表示读取失败
+        """
+        if self.agent.running:
+            try:
+                return await self.agent.read_files(paths)
+            except ConnectionError:
+                pass
+
+        return await self.shell_batch([f"cat {path}" for path in paths])
+
+    async def read_file(self, path: str) -> ShellResult:
+        """
+        读取单个设备文件，参考 `read_files`
+
+        Args:
+            path (str): 文件路径
+
+        Returns:
+            ShellResult: 读取结果
+        """
+        results = await self.read_files([path])
+        return results[0]
+
+    def sampler(
+        self,
+        interval: float = 1,
+        metrics: typing.Optional[typing.Iterable[Metric]] = None,
+        package_name: typing.Optional[str] = None,
+        heap_interval: float = 10,
+    ) -> Sampler:
+        """
+        创建周期采样器，用 `async for` 迭代采样记录
+
+        Args:
+            interval (float, optional): 采样间隔，单位秒. Defaults to 1.
+            metrics (Optional[Iterable[Metric]], optional): 要采集的指标，默认全部. Defaults to None.
+            package_name (Optional[str], optional): 包名，不传就不采集应用相关的指标. Defaults to None.
+            heap_interval (float, optional): 获取heap信息（dumpsys meminfo）的间隔，单位秒. Defaults to 10.
+
+        Returns:
+            Sampler: 采样器
+        """
+        return Sampler(self, interval, metrics, package_name, heap_interval)
+
+    async def processes(self) -> ProcessTable:
+        """
+        一次shell读取所有进程的cpu时间和RSS
+
+        两次快照用 `diff` 相减得到每个进程的cpu占用和RSS变化：
+
+            last = await device.processes()
+            ...
+            for p in (await device.processes()).diff(last, top=10):
+                print(p.pid, p.name, p.cpu, p.rss)
+
+        Returns:
+            ProcessTable: 进程表
+        """
+        output = await self.shell(PROCESSES_CMD)
+        return parse_processes(output, await self.page_size)
+
+    def screenrecord_stream(
+        self,
+        bit_rate: typing.Optional[int] = None,
+        size: typing.Optional[str] = None,
+        time_limit: typing.Optional[float] = None,
+        segment_time: float = SCREENRECORD_MAX_TIME,
+        overlap: float = 1,
+    ) -> typing.AsyncGenerator[bytes, typing.Any]:
+        """
+        持续录屏，按NAL单元输出H.264裸流（Annex B），直接写进 `.h264` 文件就能播放：
+
+            with open("record.h264", "wb") as f:
+                async for nal in device.screenrecord_stream(bit_rate=4000000):
+                    f.write(nal)
+
+        screenrecord单次最多录3分钟，每段结束前overlap秒会提前启动下一段，段与段之间没有空档。
+        画面静止的时候screenrecord不出帧，迭代会一直等待。
+
+        Args:
+            bit_rate (Optional[int], optional): 码率，单位bps，默认由screenrecord决定（4Mbps）. Defaults to None.
+            size (Optional[str], optional): 视频大小，比如 `720x1280` ，默认是屏幕分辨率. Defaults to None.
+            time_limit (Optional[float], optional): 总录制时长，单位秒，默认一直录到停止迭代. Defaults to None.
+            segment_time (float, optional): 每一段的时长，单位秒，最多180. Defaults to SCREENRECORD_MAX_TIME.
+            overlap (float, optional): 提前启动下一段的时间，单位秒. Defaults to 1.
+
+        Raises:
+            RuntimeError: screenrecord启动失败（设备不支持h264输出等）
+
+        Returns:
+            AsyncGenerator[bytes, Any]: NAL单元，带起始码
+        """
+        return stream_screenrecord(
+            self, bit_rate, size, time_limit, segment_time, overlap
+        )
+
     async def get_pid_by_pkgname(self, package_name: str) -> int:
         result = await self.shell(f"pidof {package_name}")
         if result:
@@ -100,5 +284,5 @@ class Device(LocalService):
         Returns:
             bool: true 存在， false不存在
         """
-        res = await self.shell("ls", file_path)
-        return "No such file or directory" not in res
+        res = await self.shell_v2("ls", file_path)
+        return res.ok
@@ -1,3 +1,9 @@
 from async_adbc.plugins.fps import SurfaceNotFoundError  # noqa
 from async_adbc.plugins.pm import InstallError, UninstallError, ClearError  # noqa
 from async_adbc.service.host import DeviceNotFoundError  # noqa
+from async_adbc.protocol import (  # noqa
+    ADBError,
+    ConnectionClosedError,
+    DeviceError,
+    ProtocolError,
+)
@@ -0,0 +1,491 @@
+"""
+logcat归档
+
+`LogcatRecorder` 把 `LogcatStream` 的记录写成按大小、时间轮转的压缩分段文件：
+
+1. 每个分段由多个独立压缩的块拼成（gzip的多member、zstd的多frame），
+   整个文件仍然可以直接用 `zcat` / `zstdcat` 查看
+2. 每个分段旁边有一个 `.idx` 索引，每行一个JSON，记录块在文件里的位置、时间范围、tag和最高优先级
+3. 格式化、压缩和写文件都在单独的工作线程里，不占用事件循环
+
+`LogArchive` 按索引跳过不相关的块，只解压时间范围、tag匹配的块。
+
+块里每行一条记录，字段用tab分隔：
+`秒.纳秒  pid  tid  优先级  log_id  uid  tag  消息` ，tag和消息里的 `\\` 、tab、换行会被转义。
+"""
+import asyncio
+import concurrent.futures
+import gzip
+import os
+import time
+
+from typing import (
+    TYPE_CHECKING,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from pydantic import BaseModel
+
+from async_adbc.plugins.logcat import (
+    LogcatStream,
+    LogEntry,
+    LogPriority,
+    OverflowPolicy,
+)
+
+try:
+    import zstandard as zstd
+except ImportError:  # zstandard是可选依赖，没有的时候只能用gzip
+    zstd = None  # type: ignore
+
+if TYPE_CHECKING:
+    from async_adbc.device import Device
+
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+INDEX_SUFFIX = ".idx"
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_UNESCAPES = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r"}
+
+
+class BlockIndex(BaseModel):
+    """
+    分段里一个压缩块的索引
+    """
+
+    offset: int  # 块在分段文件里的字节偏移
+    length: int  # 压缩后的字节数
+    start: float  # 第一条记录的时间戳
+    end: float  # 最后一条记录的时间戳
+    count: int  # 记录数
+    max_priority: int  # 块里最高的优先级
+    tags: List[str]  # 块里出现过的tag
+
+
+def _escape(text: str) -> str:
+    return text.translate(_ESCAPES)
+
+
+def _unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+
+    chars = []
+    it = iter(text)
+    for char in it:
+        if char == "\\":
+            escaped = next(it, "\\")
+            chars.append(_UNESCAPES.get(escaped, escaped))
+        else:
+            chars.append(char)
+    return "".join(chars)
+
+
+def format_entry(entry: LogEntry) -> str:
+    """
+    把记录格式化成归档里的一行
+
+    Args:
+        entry (LogEntry): 记录
+
+    Returns:
+        str: 一行文本，带换行符
+    """
+    return (
+        f"{entry.sec}.{entry.nsec:09d}\t{entry.pid}\t{entry.tid}\t{entry.priority}\t"
+        f"{entry.log_id}\t{entry.uid}\t{_escape(entry.tag)}\t{_escape(entry.message)}\n"
+    )
+
+
+def parse_entry(line: str) -> LogEntry:
+    """
+    解析归档里的一行，参考 `format_entry`
+
+    Args:
+        line (str): 一行文本
+
+    Returns:
+        LogEntry: 记录
+    """
+    timestamp, pid, tid, priority, log_id, uid, tag, message = line.rstrip(
+        "\n"
+    ).split("\t", 7)
+    sec, _, nsec = timestamp.partition(".")
+    return LogEntry(
+        int(pid),
+        int(tid),
+        int(sec),
+        int(nsec),
+        int(priority),
+        _unescape(tag),
+        _unescape(message),
+        int(log_id),
+        int(uid),
+    )
+
+
+def compress(data: bytes, compression: str, level: int) -> bytes:
+    """
+    把一个块压缩成独立的gzip member或者zstd frame
+
+    Args:
+        data (bytes): 原始数据
+        compression (str): `gzip` 或者 `zstd`
+        level (int): 压缩等级
+
+    Raises:
+        RuntimeError: 没有安装zstandard
+
+    Returns:
+        bytes: 压缩后的数据
+    """
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if zstd is None:
+        raise RuntimeError("zstd压缩需要安装zstandard")
+    return zstd.ZstdCompressor(level=level).compress(data)
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    """
+    解压一个块，参考 `compress`
+    """
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if zstd is None:
+        raise RuntimeError("zstd解压需要安装zstandard")
+    return zstd.ZstdDecompressor().decompress(data)
+
+
+class SegmentWriter:
+    """
+    同步的分段写入器，只在工作线程里使用
+
+    Args:
+        path (str): 归档目录
+        compression (str, optional): `gzip` 或者 `zstd`. Defaults to "gzip".
+        level (int, optional): 压缩等级. Defaults to 6.
+        max_bytes (int, optional): 分段压缩后超过这个大小就轮转. Defaults to 64MiB.
+        max_seconds (float, optional): 分段创建超过这个时间就轮转，单位秒. Defaults to 3600.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compression: str = "gzip",
+        level: int = 6,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_seconds: float = 3600,
+    ) -> None:
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"不支持的压缩格式 {compression}")
+        if compression == "zstd" and zstd is None:
+            raise RuntimeError("zstd压缩需要安装zstandard")
+
+        self.path = path
+        self.compression = compression
+        self.level = level
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.segments: List[str] = []  # 写过的分段文件
+
+        self._file = None
+        self._index = None
+        self._size = 0
+        self._created = 0.0
+        self._seq = 0
+
+    def _open(self):
+        os.makedirs(self.path, exist_ok=True)
+        suffix = COMPRESSION_SUFFIXES[self.compression]
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        while True:
+            name = os.path.join(self.path, f"logcat-{stamp}-{self._seq:04d}.log{suffix}")
+            self._seq += 1
+            try:
+                self._file = open(name, "xb")
+                break
+            except FileExistsError:
+                continue
+
+        self._index = open(name + INDEX_SUFFIX, "w", encoding="utf-8")
+        self._size = 0
+        self._created = time.monotonic()
+        self.segments.append(name)
+
+    def _should_rotate(self) -> bool:
+        return (
+            self._size >= self.max_bytes
+            or time.monotonic() - self._created >= self.max_seconds
+        )
+
+    def write_block(self, entries: List[LogEntry]):
+        """
+        把一批记录压缩成一个块写入当前分段，需要的时候先轮转
+
+        Args:
+            entries (List[LogEntry]): 记录
+        """
+        if not entries:
+            return
+
+        if self._file is None or self._should_rotate():
+            self.close()
+            self._open()
+        assert self._file is not None and self._index is not None
+
+        data = compress(
+            "".join(map(format_entry, entries)).encode(), self.compression, self.level
+        )
+        self._file.write(data)
+        self._file.flush()
+
+        # logcat -B 从多个缓冲区合并输出，时间不是严格递增的，首尾不一定是最早、最晚的记录
+        timestamps = [entry.timestamp for entry in entries]
+        index = BlockIndex(
+            offset=self._size,
+            length=len(data),
+            start=min(timestamps),
+            end=max(timestamps),
+            count=len(entries),
+            max_priority=max(entry.priority for entry in entries),
+            tags=sorted({entry.tag for entry in entries}),
+        )
+        self._index.write(index.model_dump_json() + "\n")
+        self._index.flush()
+        self._size += len(data)
+
+    def close(self):
+        """
+        关闭当前分段
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+
+class LogcatRecorder:
+    """
+    把logcat持续写进压缩归档
+
+        async with device.logcat.record("logs/serial") as recorder:
+            await run_test()
+
+    默认用 `OverflowPolicy.BLOCK` ，归档不丢日志，写盘跟不上时压力会传回设备。
+
+    Args:
+        device (Device): 设备
+        path (str): 归档目录
+        args (Iterable[str], optional): 额外的logcat参数. Defaults to ().
+        tags (Optional[Iterable[str]], optional): 只记录这些tag. Defaults to None.
+        min_priority (int, optional): 只记录优先级不低于它的记录. Defaults to LogPriority.VERBOSE.
+        compression (str, optional): `gzip` 或者 `zstd`. Defaults to "gzip".
+        level (int, optional): 压缩等级. Defaults to 6.
+        max_bytes (int, optional): 分段轮转大小. Defaults to 64MiB.
+        max_seconds (float, optional): 分段轮转时间，单位秒. Defaults to 3600.
+        block_size (int, optional): 每个压缩块最多多少条记录，越大压缩率越高、查找粒度越粗. Defaults to 4096.
+        flush_interval (float, optional): 记录少的时候最多隔多久写一个块，单位秒. Defaults to 5.
+    """
+
+    def __init__(
+        self,
+        device: "Device",
+        path: str,
+        args: Iterable[str] = (),
+        tags: Optional[Iterable[str]] = None,
+        min_priority: int = LogPriority.VERBOSE,
+        compression: str = "gzip",
+        level: int = 6,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_seconds: float = 3600,
+        block_size: int = 4096,
+        flush_interval: float = 5,
+    ) -> None:
+        self.stream = LogcatStream(
+            device,
+            args,
+            tags,
+            min_priority,
+            maxsize=block_size * 8,
+            policy=OverflowPolicy.BLOCK,
+        )
+        self.writer = SegmentWriter(path, compression, level, max_bytes, max_seconds)
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.written = 0  # 已经写盘的记录数
+
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def start(self):
+        """
+        启动logcat并开始写归档
+        """
+        # 只有一个线程，保证块按顺序写入
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        await self.stream.start()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        pending: List[LogEntry] = []
+        deadline = loop.time() + self.flush_interval
+        # get_batch不取消，超时只是先去写块，下一轮继续等同一个任务，不会丢记录
+        getter: Optional["asyncio.Task[List[LogEntry]]"] = None
+
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(self.stream.get_batch(self.block_size))
+            done, _ = await asyncio.wait([getter], timeout=max(0, deadline - loop.time()))
+
+            if getter in done:
+                batch = getter.result()
+                getter = None
+                if not batch:
+                    break
+                pending.extend(batch)
+
+            if len(pending) >= self.block_size or loop.time() >= deadline:
+                await self._write(pending)
+                pending = []
+                deadline = loop.time() + self.flush_interval
+
+        await self._write(pending)
+
+    async def _write(self, entries: List[LogEntry]):
+        if not entries:
+            return
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self._executor, self.writer.write_block, entries)
+        self.written += len(entries)
+
+    async def close(self):
+        """
+        停止logcat，把缓冲区里剩下的记录写完并关闭分段
+        """
+        await self.stream.close()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self._executor is not None:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(self._executor, self.writer.close)
+            self._executor.shutdown()
+            self._executor = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+class LogArchive:
+    """
+    读取 `LogcatRecorder` 写的归档目录
+
+    按索引跳过时间范围、tag、优先级不匹配的块，只解压可能有结果的块。
+    读的是本地文件，所以是同步接口，数据量大的时候可以放到线程里执行。
+
+    Args:
+        path (str): 归档目录
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def segments(self) -> List[str]:
+        """
+        列出有索引的分段文件，按创建时间排序
+
+        Returns:
+            List[str]: 分段文件路径
+        """
+        suffixes = tuple(COMPRESSION_SUFFIXES.values())
+        names = sorted(
+            name
+            for name in os.listdir(self.path)
+            if name.endswith(suffixes)
+            and os.path.exists(os.path.join(self.path, name + INDEX_SUFFIX))
+        )
+        return [os.path.join(self.path, name) for name in names]
+
+    def blocks(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        tags: Optional[Iterable[str]] = None,
+        min_priority: int = 0,
+    ) -> Iterator[Tuple[str, BlockIndex]]:
+        """
+        按索引找出可能包含匹配记录的块
+
+        Args:
+            start (Optional[float], optional): 开始时间戳. Defaults to None.
+            end (Optional[float], optional): 结束时间戳. Defaults to None.
+            tags (Optional[Iterable[str]], optional): tag. Defaults to None.
+            min_priority (int, optional): 最低优先级. Defaults to 0.
+
+        Yields:
+            Tuple[str, BlockIndex]: 分段文件路径和块索引
+        """
+        wanted: Optional[Set[str]] = set(tags) if tags is not None else None
+        for segment in self.segments():
+            with open(segment + INDEX_SUFFIX, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    block = BlockIndex.model_validate_json(line)
+                    if start is not None and block.end < start:
+                        continue
+                    if end is not None and block.start > end:
+                        continue
+                    if block.max_priority < min_priority:
+                        continue
+                    if wanted is not None and wanted.isdisjoint(block.tags):
+                        continue
+                    yield segment, block
+
+    def search(
+        self,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        tags: Optional[Iterable[str]] = None,
+        min_priority: int = 0,
+    ) -> Iterator[LogEntry]:
+        """
+        查找记录，参数参考 `blocks`
+
+        Yields:
+            LogEntry: 按写入顺序的匹配记录
+        """
+        wanted: Optional[Set[str]] = set(tags) if tags is not None else None
+        for segment, block in self.blocks(start, end, wanted, min_priority):
+            compression = (
+                "zstd" if segment.endswith(COMPRESSION_SUFFIXES["zstd"]) else "gzip"
+            )
+            with open(segment, "rb") as f:
+                f.seek(block.offset)
+                data = decompress(f.read(block.length), compression)
+
+            # 消息里的换行已经转义，不能用splitlines，它还会按其他unicode换行符切
+            for line in data.decode().split("\n")[:-1]:
+                entry = parse_entry(line)
+                if start is not None and entry.timestamp < start:
+                    continue
+                if end is not None and entry.timestamp > end:
+                    continue
+                if entry.priority < min_priority:
+                    continue
+                if wanted is not None and entry.tag not in wanted:
+                    continue
+                yield entry
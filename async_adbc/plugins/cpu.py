@@ -1,12 +1,31 @@
-import asyncio
+import operator
 import re
 
-from typing import Dict, Tuple, overload
+from array import array
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    overload,
+)
 from pydantic import BaseModel, Field
 from async_lru import alru_cache
 
 from async_adbc.plugin import Plugin
 
+try:
+    import numpy as np
+except ImportError:  # numpy是可选依赖，没有的时候用array计算
+    np = None  # type: ignore
+
+if TYPE_CHECKING:
+    from async_adbc.service.local import ShellResult
+
 
 CPUStatMap = Dict[int, "CPUStat"]
 CPUUsageMap = Dict[int, "CPUUsage"]
@@ -134,10 +153,445 @@ class ProcessCPUStat(BaseModel):
 
     @property
     def total(self) -> float:
-        return self.utime + self.stime + self.cutime + self.stime
+        return self.utime + self.stime + self.cutime + self.cstime
+
+
+# /proc/stat 每行cpu的字段数，顺序和CPUStat的字段一致
+CPU_STAT_FIELDS = 10
+_USER, _SYSTEM = 0, 2
+
+
+def _usage(busy: float, total: float, normalize_factor: float) -> CPUUsage:
+    if total <= 0:
+        return CPUUsage()
+    usage = round(100 * busy / total, 2)
+    return CPUUsage(usage=usage, normalized=usage * normalize_factor)
+
+
+class CPUSnapshot:
+    """
+    /proc/stat 的一次快照，(核心数+1) x 10 的整数矩阵，第0行是总cpu，之后每行是一个核心
+
+    有numpy的时候数据是 `numpy.ndarray` ，否则是按行展开的 `array('q')` 。
+    差值和占用率一次算出所有行，只有调用 `to_stats` 、 `to_usages` 的时候才创建pydantic模型。
+
+    Args:
+        cores (Sequence[int]): 每行对应的核心号，不包含第0行
+        data (Any): 矩阵数据
+    """
+
+    __slots__ = ("cores", "data")
+
+    def __init__(self, cores: Sequence[int], data: Any) -> None:
+        self.cores = tuple(cores)
+        self.data = data
+
+    @classmethod
+    def from_rows(cls, cores: Sequence[int], values: List[int]) -> "CPUSnapshot":
+        if np is not None:
+            data = np.array(values, dtype=np.int64).reshape(-1, CPU_STAT_FIELDS)
+        else:
+            data = array("q", values)
+        return cls(cores, data)
+
+    def row(self, index: int) -> List[int]:
+        """
+        取出一行
+
+        Args:
+            index (int): 行号，0是总cpu，核心i在第 cores.index(i)+1 行
+        """
+        if np is not None:
+            return self.data[index].tolist()
+        start = index * CPU_STAT_FIELDS
+        return self.data[start : start + CPU_STAT_FIELDS].tolist()
+
+    @property
+    def total_jiffies(self) -> int:
+        """
+        总cpu的时间片合计
+        """
+        return sum(self.row(0))
+
+    def _select(self, cores: Sequence[int]) -> "CPUSnapshot":
+        # 只保留指定核心的行，核心热插拔的时候前后两次快照的核心可能不一样
+        rows = [0] + [self.cores.index(core) + 1 for core in cores]
+        if np is not None:
+            return CPUSnapshot(cores, self.data[rows])
+
+        values: List[int] = []
+        for row in rows:
+            values.extend(self.row(row))
+        return CPUSnapshot(cores, array("q", values))
+
+    def __sub__(self, other: "CPUSnapshot") -> "CPUSnapshot":
+        left, right = self, other
+        if self.cores != other.cores:
+            cores = [core for core in self.cores if core in other.cores]
+            left, right = self._select(cores), other._select(cores)
+
+        if np is not None:
+            return CPUSnapshot(left.cores, left.data - right.data)
+        return CPUSnapshot(
+            left.cores, array("q", map(operator.sub, left.data, right.data))
+        )
+
+    def busy_and_total(self) -> Tuple[List[int], List[int]]:
+        """
+        每行的 user+system 和所有字段合计
+
+        Returns:
+            Tuple[List[int], List[int]]: 忙碌时间片、总时间片，第0项是总cpu
+        """
+        if np is not None:
+            busy = self.data[:, _USER] + self.data[:, _SYSTEM]
+            return busy.tolist(), self.data.sum(axis=1).tolist()
+
+        data = self.data
+        width = CPU_STAT_FIELDS
+        busy = [data[i + _USER] + data[i + _SYSTEM] for i in range(0, len(data), width)]
+        total = [sum(data[i : i + width]) for i in range(0, len(data), width)]
+        return busy, total
+
+    def to_usages(self, normalize_factor: float = 1) -> Tuple[CPUUsage, CPUUsageMap]:
+        """
+        把差值快照转换成占用率
+
+        Args:
+            normalize_factor (float, optional): 标准化因子. Defaults to 1.
+
+        Returns:
+            Tuple[CPUUsage, CPUUsageMap]: 总cpu占用和每个核心的占用
+        """
+        busy, total = self.busy_and_total()
+        usages = [_usage(b, t, normalize_factor) for b, t in zip(busy, total)]
+        return usages[0], dict(zip(self.cores, usages[1:]))
+
+    def to_stats(self) -> Tuple[CPUStat, CPUStatMap]:
+        """
+        转换成pydantic模型
+
+        Returns:
+            Tuple[CPUStat, CPUStatMap]: 总cpu统计和每个核心的统计
+        """
+        names = list(CPUStat.model_fields)
+        stats = [
+            CPUStat(**dict(zip(names, self.row(i)))) for i in range(len(self.cores) + 1)
+        ]
+        return stats[0], dict(zip(self.cores, stats[1:]))
+
+
+def parse_cpu_snapshot(text: str) -> CPUSnapshot:
+    """
+    解析 /proc/stat 的cpu行
+
+    cpu行都在文件开头，读完cpu行就停止，不会去切分后面很长的intr行。
+
+    Args:
+        text (str): /proc/stat 的内容
+
+    Raises:
+        RuntimeError: 内容里没有cpu统计
+
+    Returns:
+        CPUSnapshot: 快照
+    """
+    cores: List[int] = []
+    values: List[int] = []
+    has_total = False
+    for line in text.splitlines():
+        if not line.startswith("cpu"):
+            if has_total:
+                break
+            continue
+
+        items = line.split(None, CPU_STAT_FIELDS + 1)
+        fields = items[1 : CPU_STAT_FIELDS + 1]
+        row = list(map(int, fields))
+        if len(row) < CPU_STAT_FIELDS:
+            row += [0] * (CPU_STAT_FIELDS - len(row))
+
+        if items[0] == "cpu":
+            has_total = True
+            values[0:0] = row
+        else:
+            cores.append(int(items[0][3:]))
+            values.extend(row)
+
+    if not has_total:
+        raise RuntimeError("无法从 /proc/stat 中获取cpu统计")
+
+    return CPUSnapshot.from_rows(cores, values)
+
+
+def parse_proc_stat(text: str) -> Tuple[CPUStat, CPUStatMap]:
+    """
+    解析 /proc/stat ，一次解析同时得到总cpu和每个核心的统计
+
+    Args:
+        text (str): /proc/stat 的内容
+
+    Raises:
+        RuntimeError: 内容里没有cpu统计
+
+    Returns:
+        Tuple[CPUStat, CPUStatMap]: 总cpu统计和每个核心的统计
+    """
+    return parse_cpu_snapshot(text).to_stats()
+
+
+class ProcessTimes(NamedTuple):
+    """
+    /proc/<pid>/stat 里的cpu时间，比ProcessCPUStat轻，持续采样的时候用这个计算差值
+    """
+
+    name: str
+    utime: int
+    stime: int
+    cutime: int
+    cstime: int
+
+    @property
+    def total(self) -> int:
+        return self.utime + self.stime + self.cutime + self.cstime
+
+    def __sub__(self, other: "ProcessTimes") -> "ProcessTimes":
+        return ProcessTimes(
+            self.name,
+            self.utime - other.utime,
+            self.stime - other.stime,
+            self.cutime - other.cutime,
+            self.cstime - other.cstime,
+        )
+
+    def to_stat(self) -> ProcessCPUStat:
+        return ProcessCPUStat(**self._asdict())
+
+
+def parse_pid_times(text: str) -> ProcessTimes:
+    """
+    解析 /proc/<pid>/stat
+
+    进程名可能带空格，所以以最后一个 `)` 为界切分字段
+
+    Args:
+        text (str): /proc/<pid>/stat 的内容
+
+    Returns:
+        ProcessTimes: 进程cpu时间
+    """
+    head, _, tail = text.rpartition(")")
+    name = head.partition("(")[2]
+    items = tail.split(None, 15)
+    return ProcessTimes(
+        name, int(items[11]), int(items[12]), int(items[13]), int(items[14])
+    )
+
+
+def parse_pid_stat(text: str) -> ProcessCPUStat:
+    """
+    解析 /proc/<pid>/stat
+
+    Args:
+        text (str): /proc/<pid>/stat 的内容
+
+    Returns:
+        ProcessCPUStat: 进程cpu统计
+    """
+    return parse_pid_times(text).to_stat()
+
+
+class ThreadCPUUsage(BaseModel):
+    """
+    线程cpu占用
+    """
+
+    pid: int  # 所属进程
+    tid: int
+    name: str  # 线程名，内核只保留前15个字符
+    process_name: str
+    usage: float = 0  # 占总cpu时间片的百分比
+    normalized: float = 0
+
+
+# 线程stat：tid (名字) 之后跳过state到cmajflt的11个字段就是utime、stime
+# 名字里可能有括号和空格，`.*` 是贪婪匹配，会匹配到这一行最后一个 `)`
+_TASK_STAT_PATTERN = re.compile(
+    r"^(?:(\d+) \((.*)\) (?:\S+ ){11}(\d+) (\d+)|pid (\d+) (.*)$)", re.M
+)
+
+
+class ThreadTable:
+    """
+    一个应用所有线程的cpu时间，按列保存
+
+    Args:
+        cpu (CPUSnapshot): 同一次读取的总cpu快照
+        processes (Dict[int, str]): pid到进程名
+    """
+
+    def __init__(self, cpu: CPUSnapshot, processes: Dict[int, str]) -> None:
+        self.cpu = cpu
+        self.processes = processes
+        self.pids = array("q")
+        self.tids = array("q")
+        self.jiffies = array("q")  # utime + stime
+        self.names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.tids)
+
+
+def parse_task_stats(text: str) -> ThreadTable:
+    """
+    解析 `CPUPlugin.threads` 的输出：第一行是 /proc/stat 的总cpu行，
+    之后每个进程先输出一行 `pid <pid> <进程名>` ，再输出它所有 /proc/<pid>/task/*/stat 。
+
+    整段文本用一个正则一次扫描，不逐行split。
+
+    Args:
+        text (str): 命令输出
+
+    Returns:
+        ThreadTable: 线程表
+    """
+    cpu_line, _, rest = text.partition("\n")
+    table = ThreadTable(parse_cpu_snapshot(cpu_line), {})
+
+    pid = 0
+    for tid, name, utime, stime, marker_pid, process_name in _TASK_STAT_PATTERN.findall(
+        rest
+    ):
+        if marker_pid:
+            pid = int(marker_pid)
+            table.processes[pid] = process_name
+            continue
+
+        table.pids.append(pid)
+        table.tids.append(int(tid))
+        table.jiffies.append(int(utime) + int(stime))
+        table.names.append(name)
+    return table
+
+
+class CPUSample(BaseModel):
+    """
+    CPUSampler一次采样的结果，都是与上一次采样之间的占用率
+    """
+
+    total: CPUUsage = Field(default_factory=CPUUsage)
+    cores: CPUUsageMap = Field(default_factory=dict)
+    processes: Dict[int, CPUUsage] = Field(default_factory=dict)  # key是pid
+
+
+class CPUSampler:
+    """
+    有状态的cpu采样器，保存上一次的 /proc/stat 和 /proc/<pid>/stat 快照，
+    每次采样返回与上一次采样之间的占用率，采样间隔由调用者决定，调用里不会sleep。
+
+    没有上一次快照的时候（第一次采样、新出现的pid）以开机为起点，返回的是开机以来的平均占用率。
+
+    Args:
+        plugin (CPUPlugin): cpu插件
+    """
+
+    def __init__(self, plugin: "CPUPlugin") -> None:
+        self._plugin = plugin
+        self._last_cpu: Optional[CPUSnapshot] = None
+        # pid -> (上次的进程cpu时间, 上次采样时的总时间片)
+        self._last_processes: Dict[int, Tuple[ProcessTimes, int]] = {}
+
+    def reset(self):
+        """
+        丢弃所有快照
+        """
+        self._last_cpu = None
+        self._last_processes = {}
+
+    async def sample(self, *pids: int) -> CPUSample:
+        """
+        采样一次，/proc/stat 和所有pid的stat合并成一次设备读取
+
+        Args:
+            pids (int): 要统计的进程
+
+        Returns:
+            CPUSample: 采样结果，读取失败（进程已经退出）的pid不会出现在processes里
+        """
+        results = await self._plugin._device.read_files(self.paths(*pids))
+        normalize_factor = await self._plugin.normalize_factor
+        return self.update(results, pids, normalize_factor)
+
+    @staticmethod
+    def paths(*pids: int) -> List[str]:
+        """
+        一次采样需要读取的文件，需要和其他文件合并读取的时候使用，结果交给 `update`
+
+        Args:
+            pids (int): 要统计的进程
+
+        Returns:
+            List[str]: /proc/stat 和每个pid的stat路径
+        """
+        return ["/proc/stat"] + [f"/proc/{pid}/stat" for pid in pids]
+
+    def update(
+        self,
+        results: Sequence["ShellResult"],
+        pids: Sequence[int],
+        normalize_factor: float,
+    ) -> CPUSample:
+        """
+        用已经读到的文件内容更新快照并计算占用率
+
+        Args:
+            results (Sequence[ShellResult]): `paths` 中每个文件的读取结果，顺序一致
+            pids (Sequence[int]): 要统计的进程
+            normalize_factor (float): 归一化系数
+
+        Returns:
+            CPUSample: 采样结果，读取失败（进程已经退出）的pid不会出现在processes里
+        """
+        snapshot = parse_cpu_snapshot(results[0].output)
+        if self._last_cpu is not None:
+            delta = snapshot - self._last_cpu
+        else:
+            delta = snapshot
+        total, cores = delta.to_usages(normalize_factor)
+        self._last_cpu = snapshot
+
+        total_jiffies = snapshot.total_jiffies
+        processes: Dict[int, CPUUsage] = {}
+        for pid, result in zip(pids, results[1:]):
+            if not result.ok:
+                self._last_processes.pop(pid, None)
+                continue
+
+            times = parse_pid_times(result.output)
+            last_times, last_total = self._last_processes.get(
+                pid, (ProcessTimes(times.name, 0, 0, 0, 0), 0)
+            )
+            self._last_processes[pid] = (times, total_jiffies)
+            processes[pid] = _usage(
+                (times - last_times).total,
+                total_jiffies - last_total,
+                normalize_factor,
+            )
+
+        return CPUSample(total=total, cores=cores, processes=processes)
 
 
 class CPUPlugin(Plugin):
+    def __init__(self, device) -> None:
+        super().__init__(device)
+        # cpu_usages、total_cpu_usage、get_pid_cpu_usage各自的采样器，交替调用互不影响采样区间
+        self._cores_sampler = CPUSampler(self)
+        self._total_sampler = CPUSampler(self)
+        self._pid_sampler = CPUSampler(self)
+        self._pids: Dict[str, int] = {}
+        # 包名 -> (tid到上次的cpu时间, 上次的总时间片)
+        self._last_threads: Dict[str, Tuple[Dict[int, int], int]] = {}
+
     @property
     @alru_cache
     async def count(self):
@@ -167,21 +621,20 @@ class CPUPlugin(Plugin):
         """
 
         count = await self.count
-        coroutines = []
+        cmds = []
         for index in range(count):
             # TODO: 模拟器可能没有这个路径，有没有兼容性更强的方案来获取CPU频率
             cmd_root = f"cat /sys/devices/system/cpu/cpu{index}/cpufreq"
-            min = self._device.shell(f"{cmd_root}/cpuinfo_min_freq")
-            cur = self._device.shell(f"{cmd_root}/scaling_cur_freq")
-            max = self._device.shell(f"{cmd_root}/cpuinfo_max_freq")
+            cmds.append(f"{cmd_root}/cpuinfo_min_freq")
+            cmds.append(f"{cmd_root}/scaling_cur_freq")
+            cmds.append(f"{cmd_root}/cpuinfo_max_freq")
 
-            coroutine = asyncio.gather(min, cur, max)
-            coroutines.append(coroutine)
-
-        freq_list = await asyncio.gather(*coroutines)
+        # 所有核心的频率文件一次读完
+        results = await self._device.shell_batch(cmds)
+        values = [int(res.output) for res in results]
         _freqs = [
-            CPUFreq(min=int(min), cur=int(cur), max=int(max))
-            for (min, cur, max) in freq_list
+            CPUFreq(min=values[i], cur=values[i + 1], max=values[i + 2])
+            for i in range(0, len(values), 3)
         ]
 
         return _freqs
@@ -220,6 +673,25 @@ class CPUPlugin(Plugin):
         _normalize_factor = cur_freq_sum / total_max_freq
         return _normalize_factor
 
+    def sampler(self) -> CPUSampler:
+        """
+        创建一个独立的cpu采样器，参考 `CPUSampler`
+
+        Returns:
+            CPUSampler: 采样器
+        """
+        return CPUSampler(self)
+
+    async def snapshot(self) -> CPUSnapshot:
+        """
+        读取一次 /proc/stat 快照，两次快照相减就是这段时间的cpu时间片
+
+        Returns:
+            CPUSnapshot: 快照
+        """
+        result = await self._device.read_file("/proc/stat")
+        return parse_cpu_snapshot(result.output)
+
     @property
     async def cpu_stats(self) -> CPUStatMap:
         """
@@ -228,28 +700,8 @@ class CPUPlugin(Plugin):
         Returns:
             CPUStatMap: key是核心号，value是CPUStat
         """
-        pattern = re.compile(
-            r"cpu(\d)\s+([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s"
-        )
-        cpu_state_info = await self._device.shell("cat /proc/stat")
-        matches = pattern.findall(cpu_state_info)
-
-        values = [list(map(lambda x: int(x), group[1:])) for group in matches]
-        all_cpu_state = {
-            index: CPUStat(
-                user=value[0],
-                nice=value[1],
-                system=value[2],
-                idle=value[3],
-                iowait=value[4],
-                irq=value[5],
-                softirq=value[6],
-                stealstolen=value[7],
-                guest=value[8],
-                guest_nice=value[9],
-            )
-            for index, value in enumerate(values)
-        }
+        cpu_state_info = await self._device.read_file("/proc/stat")
+        _, all_cpu_state = parse_proc_stat(cpu_state_info.output)
         return all_cpu_state
 
     @property
@@ -257,24 +709,17 @@ class CPUPlugin(Plugin):
         """
         获取每个核心cpu使用率
 
-        获取的是两次采样间隔的cpu使用率，第一获取到的永远是0，你需要再调用一次才能获取到使用率。
+        获取的是与上一次调用cpu_usages之间的使用率，第一次获取到的是开机以来的平均使用率。
+        需要固定间隔的使用率就按固定间隔调用，多个调用者各自采样用 `sampler` 。
 
         Returns:
-            CPUUsageMap: _description_
+            CPUUsageMap: key是核心号，value是使用率，下线的核心使用率为0
         """
-        normalize_factor = await self.normalize_factor
         cpu_count = await self.count
         cpu_usage = {i: CPUUsage() for i in range(cpu_count)}
 
-        last_cpu_stats = await self.cpu_stats
-        await asyncio.sleep(1)
-        cpu_stats = await self.cpu_stats
-        for index, stat in cpu_stats.items():
-            last_cpu_stat = last_cpu_stats[index]
-            cpu_diff: CPUStat = stat - last_cpu_stat
-            usage = round(cpu_diff.usage, 2)
-            normalized = usage * normalize_factor
-            cpu_usage[index] = CPUUsage(usage=usage, normalized=normalized)
+        sample = await self._cores_sampler.sample()
+        cpu_usage.update(sample.cores)
         return cpu_usage
 
     @property
@@ -285,55 +730,22 @@ class CPUPlugin(Plugin):
         Returns:
             Optional[CPUStat]: CPU状态
         """
-        pattern = re.compile(
-            r"cpu\s+([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s([\d]+)\s"
-        )
-
-        result = await self._device.shell("cat /proc/stat")
-        match = pattern.search(result)
-
-        cpu_stat = CPUStat()
-        if match is None or len(match.groups()) != 10:
-            raise RuntimeError("无法从 /proc/stat 中获取cpu统计")
-        else:
-            value = list(map(lambda x: int(x), match.groups()))
-            cpu_stat = CPUStat(
-                user=value[0],
-                nice=value[1],
-                system=value[2],
-                idle=value[3],
-                iowait=value[4],
-                irq=value[5],
-                softirq=value[6],
-                stealstolen=value[7],
-                guest=value[8],
-                guest_nice=value[9],
-            )
-
+        result = await self._device.read_file("/proc/stat")
+        cpu_stat, _ = parse_proc_stat(result.output)
         return cpu_stat
 
     @property
     async def total_cpu_usage(self) -> CPUUsage:
         """
         获取总cpu占用率
-         获取的是两次采样间隔的cpu使用率，第一获取到的永远是0，你需要再调用一次才能获取到使用率。
+
+        获取的是与上一次调用total_cpu_usage之间的使用率，第一次获取到的是开机以来的平均使用率。
 
         Returns:
             CPUUsage: CPU使用率
         """
-
-        last_total_cpu_stat = await self.total_cpu_stat
-
-        # 用sleep来间隔采样
-        # await asyncio.sleep(1)
-
-        total_cpu_stat = await self.total_cpu_stat
-        diff = total_cpu_stat - last_total_cpu_stat
-
-        normalize_factor = await self.normalize_factor
-        normalized = diff.usage * normalize_factor
-
-        return CPUUsage(usage=diff.usage, normalized=normalized)
+        sample = await self._total_sampler.sample()
+        return sample.total
 
     @overload
     async def get_pid_cpu_stat(self, pid_or_pkg_name: str) -> ProcessCPUStat:
@@ -370,19 +782,12 @@ class CPUPlugin(Plugin):
             except Exception:
                 return ProcessCPUStat()
 
-        result = await self._device.shell(f"cat /proc/{pid}/stat")
+        result = await self._device.read_file(f"/proc/{pid}/stat")
 
-        if "No such file or directory" in result:
+        if not result.ok:
             return ProcessCPUStat()
         else:
-            items = result.split()
-            return ProcessCPUStat(
-                name=items[1],
-                utime=int(items[13]),
-                stime=int(items[14]),
-                cutime=int(items[15]),
-                cstime=int(items[16]),
-            )
+            return parse_pid_stat(result.output)
 
     @overload
     async def get_pid_cpu_usage(self, pid_or_pkg_name: int) -> CPUUsage:
@@ -411,29 +816,88 @@ class CPUPlugin(Plugin):
         ...
 
     async def get_pid_cpu_usage(self, pid_or_pkg_name) -> CPUUsage:
+        """
+        获取的是与这个进程上一次采样之间的使用率，第一次获取到的是进程占开机以来总时间片的比例。
+        包名对应的pid会缓存，进程重启后自动重新查找。
+        """
         pid = pid_or_pkg_name
-        if isinstance(pid, str):
-            try:
-                pid = await self._device.get_pid_by_pkgname(pid_or_pkg_name)
-            except Exception:
-                return CPUUsage()
+        if isinstance(pid_or_pkg_name, str):
+            pid = self._pids.get(pid_or_pkg_name)
+            if pid is None:
+                try:
+                    pid = await self._device.get_pid_by_pkgname(pid_or_pkg_name)
+                except Exception:
+                    return CPUUsage()
+                self._pids[pid_or_pkg_name] = pid
+
+        sample = await self._pid_sampler.sample(pid)
+        if pid not in sample.processes:
+            # 进程已经退出
+            if isinstance(pid_or_pkg_name, str):
+                self._pids.pop(pid_or_pkg_name, None)
+            return CPUUsage()
+
+        return sample.processes[pid]
+
+    async def threads(self, package_name: str, top: int = 10) -> List[ThreadCPUUsage]:
+        """
+        获取应用所有进程（包括 `包名:xxx` 子进程）里cpu占用最高的线程
 
-        normalize_factor = await self.normalize_factor
+        一次shell读取总cpu和所有进程的 /proc/<pid>/task/*/stat ，
+        占用率是与这个包上一次调用之间的差值，第一次调用以开机为起点。
 
-        last_pid_cpu_stat, last_total_cpu_stat = await asyncio.gather(
-            self.get_pid_cpu_stat(pid), self.total_cpu_stat
-        )
+        需要 `ps -A -o` ，也就是Android 8.0以上。
+
+        Args:
+            package_name (str): 包名
+            top (int, optional): 返回前几个线程，0表示全部. Defaults to 10.
 
-        pid_stat, total_cpu_stat = await asyncio.gather(
-            self.get_pid_cpu_stat(pid), self.total_cpu_stat
+        Returns:
+            List[ThreadCPUUsage]: 按占用率从高到低排序，应用没有运行时为空
+        """
+        cmd = (
+            "head -n 1 /proc/stat;"
+            "ps -A -o PID,NAME | while read -r pid name; do "
+            f'case "$name" in {package_name}|{package_name}:*) '
+            'echo "pid $pid $name"; cat /proc/$pid/task/*/stat 2>/dev/null;; '
+            "esac; done"
         )
-        pid_diff = pid_stat - last_pid_cpu_stat
-        cpu_diff = total_cpu_stat - last_total_cpu_stat
+        output = await self._device.shell(cmd)
+        table = parse_task_stats(output)
+        normalize_factor = await self.normalize_factor
 
-        app_cpu_usage = pid_diff.total / cpu_diff.total * 100
+        last_jiffies, last_total = self._last_threads.get(package_name, ({}, 0))
+        total = table.cpu.total_jiffies - last_total
+        self._last_threads[package_name] = (
+            dict(zip(table.tids, table.jiffies)),
+            table.cpu.total_jiffies,
+        )
+        if total <= 0:
+            return []
 
-        normalized = app_cpu_usage * normalize_factor
-        return CPUUsage(usage=app_cpu_usage, normalized=normalized)
+        deltas = [
+            (jiffies - last_jiffies.get(tid, 0), i)
+            for i, (tid, jiffies) in enumerate(zip(table.tids, table.jiffies))
+        ]
+        deltas.sort(reverse=True)
+        if top:
+            deltas = deltas[:top]
+
+        result = []
+        for delta, i in deltas:
+            pid = table.pids[i]
+            usage = round(100 * delta / total, 2)
+            result.append(
+                ThreadCPUUsage(
+                    pid=pid,
+                    tid=table.tids[i],
+                    name=table.names[i],
+                    process_name=table.processes[pid],
+                    usage=usage,
+                    normalized=usage * normalize_factor,
+                )
+            )
+        return result
 
     @property
     @alru_cache
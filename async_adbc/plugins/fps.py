@@ -1,20 +1,350 @@
+import asyncio
+import enum
+import math
+
+from array import array
 from async_adbc.plugin import Plugin
-from typing import List, Optional
+from typing import Any, AsyncGenerator, Dict, List, Optional, Sequence, Tuple
 from pydantic import BaseModel, Field
 
+# --latency 表里还没有拿到present fence的帧，实际显示时间是INT64_MAX
+PENDING_FENCE_TIME = (1 << 63) - 1
+
+PROFILEDATA_MARK = "---PROFILEDATA---"
+
+# 帧的各个阶段，(名称, 开始列, 结束列)
+FRAMESTATS_STAGES = [
+    ("input", "HandleInputStart", "AnimationStart"),
+    ("animation", "AnimationStart", "PerformTraversalsStart"),
+    ("layout", "PerformTraversalsStart", "DrawStart"),
+    ("draw", "DrawStart", "SyncQueued"),
+    ("sync", "SyncStart", "IssueDrawCommandsStart"),
+    ("command", "IssueDrawCommandsStart", "SwapBuffers"),
+    ("swap", "SwapBuffers", "FrameCompleted"),
+]
+
+
+class FpsBackend(enum.Enum):
+    SURFACE_FLINGER = "surfaceflinger"  # dumpsys SurfaceFlinger --latency，只支持SurfaceView
+    GFXINFO = "gfxinfo"  # dumpsys gfxinfo <pkg> framestats，hwui渲染的普通界面
+
 
 class SurfaceNotFoundError(Exception):
     ...
 
 
+class FrameStages(BaseModel):
+    """
+    gfxinfo framestats里每一帧各个阶段的平均耗时，单位ms
+    """
+
+    input: float = 0  # 处理输入事件
+    animation: float = 0  # 动画回调
+    layout: float = 0  # measure、layout
+    draw: float = 0  # 录制绘制指令
+    sync: float = 0  # 同步到RenderThread
+    command: float = 0  # 提交绘制指令给GPU
+    swap: float = 0  # 交换缓冲区
+    total: float = 0  # IntendedVsync到FrameCompleted
+
+
 class FpsStat(BaseModel):
     fps: float = 0
     jank: float = 0
     big_jank: float = 0
     frametimes: List[float] = Field(default=list)  # type: ignore
+    # 以下字段只有monitor会填，单位ms
+    p50: float = 0
+    p90: float = 0
+    p95: float = 0
+    p99: float = 0
+    stages: Optional[FrameStages] = None  # 只有gfxinfo后端有
+
+
+def parse_latency(text: str, after: int = 0) -> Tuple[float, List[int]]:
+    """
+    解析 `dumpsys SurfaceFlinger --latency` 的输出，只返回比after新的帧
+
+    表是按时间升序排列的，从表尾往前扫描，遇到已经见过的帧就停止，
+    持续采样的时候每次只需要解析新增的几十行。
+
+    Args:
+        text (str): --latency 输出
+        after (int, optional): 上次见到的最新实际显示时间，单位ns. Defaults to 0.
+
+    Returns:
+        Tuple[float, List[int]]: 刷新周期(ns)和新帧的实际显示时间(ns，升序)，
+            SurfaceView已经不存在时刷新周期后面没有任何行，返回的列表为空
+    """
+    lines = text.strip().split("\n")
+    refresh_period = float(lines[0]) if lines[0] else -1
+
+    timestamps: List[int] = []
+    for line in reversed(lines[1:]):
+        fields = line.split()
+        if len(fields) < 2:
+            continue
+
+        present = int(fields[1])
+        if present == PENDING_FENCE_TIME:
+            # 最新的几帧可能还没显示，下次采样再算
+            if not timestamps:
+                continue
+            break
+        if present <= after:
+            break
+        timestamps.append(present)
+
+    timestamps.reverse()
+    return refresh_period, timestamps
+
+
+class FrameStats:
+    """
+    gfxinfo framestats的帧时间表，每一列是一个 `array('q')` ，单位ns
+
+    Args:
+        columns (Dict[str, array]): 列名到列数据
+    """
+
+    def __init__(self, columns: Dict[str, "array[int]"]) -> None:
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.columns["FrameCompleted"]) if self.columns else 0
+
+    def __getitem__(self, name: str) -> "array[int]":
+        return self.columns[name]
+
+    def stages(self) -> FrameStages:
+        """
+        计算各个阶段的平均耗时
+
+        Returns:
+            FrameStages: 各阶段平均耗时，单位ms
+        """
+        count = len(self)
+        if not count:
+            return FrameStages()
+
+        stages: Dict[str, float] = {}
+        for name, start, end in FRAMESTATS_STAGES + [
+            ("total", "IntendedVsync", "FrameCompleted")
+        ]:
+            if start not in self.columns or end not in self.columns:
+                continue
+            duration = sum(
+                max(e - s, 0) for s, e in zip(self.columns[start], self.columns[end])
+            )
+            stages[name] = round(duration / count / 1e6, 2)
+        return FrameStages(**stages)
+
+
+def parse_framestats(text: str, after: int = 0) -> FrameStats:
+    """
+    解析 `dumpsys gfxinfo <pkg> framestats` 的输出
+
+    所有PROFILEDATA段（每个窗口一段）的数据行拼成一个字符串一次切分，
+    一次性转换成 `array('q')` 再按步长切出每一列，不会为每一行创建列表。
+    Flags不为0的帧（比如窗口刚创建时的帧）和IntendedVsync不比after新的帧会被丢弃。
+
+    Args:
+        text (str): framestats输出
+        after (int, optional): 上次见到的最新IntendedVsync，单位ns. Defaults to 0.
+
+    Returns:
+        FrameStats: 按FrameCompleted升序排列的帧时间表
+    """
+    names: Optional[List[str]] = None
+    rows: List[str] = []
+    for section in text.split(PROFILEDATA_MARK)[1::2]:
+        lines = section.strip().splitlines()
+        if len(lines) < 2:
+            continue
+
+        header = lines[0].rstrip(",").split(",")
+        if names is None:
+            names = header
+        elif header != names:
+            continue
+        rows.extend(line.rstrip(",") for line in lines[1:] if line)
+
+    if not names or not rows:
+        return FrameStats({})
+
+    width = len(names)
+    flat = array("q", map(int, ",".join(rows).split(",")))
+    if len(flat) % width:
+        raise ValueError("framestats 数据列数与表头不一致")
+
+    columns = {name: flat[i::width] for i, name in enumerate(names)}
+
+    flags = columns["Flags"]
+    vsync = columns["IntendedVsync"]
+    keep = [i for i in range(len(flags)) if flags[i] == 0 and vsync[i] > after]
+    completed = columns["FrameCompleted"]
+    keep.sort(key=completed.__getitem__)
+
+    if keep != list(range(len(flags))):
+        columns = {
+            name: array("q", [column[i] for i in keep])
+            for name, column in columns.items()
+        }
+    return FrameStats(columns)
+
+
+def _percentile(sorted_values: Sequence[float], percent: float) -> float:
+    # nearest-rank百分位
+    if not sorted_values:
+        return 0
+    index = max(math.ceil(percent / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+class FpsMonitor:
+    """
+    持续采样一个应用的帧率
+
+    1. 缓存找到的SurfaceView，只有SurfaceView消失的时候才重新 `--list`
+    2. 记住上次见到的最新帧，每次只统计新帧，相邻两次采样不会重复计算同一帧
+    3. jank判断需要前三帧的帧耗时，跨采样保留最近三帧
+
+    没有指定后端的时候，先用SurfaceFlinger采样，拿不到帧再试gfxinfo，
+    哪个后端先拿到帧就记到插件里，这台设备上同一个包之后都用这个后端。
+
+    Args:
+        plugin (FpsPlugin): 帧率插件
+        package_name (str): 包名
+        backend (Optional[FpsBackend], optional): 指定后端. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        plugin: "FpsPlugin",
+        package_name: str,
+        backend: Optional[FpsBackend] = None,
+    ) -> None:
+        self._plugin = plugin
+        self.package_name = package_name
+        self.backend = backend
+        self.surface_view: Optional[str] = None
+        self._last_present = 0
+        self._last_vsync = 0
+        self._history: List[float] = []
+
+    def reset(self):
+        """
+        丢弃缓存的SurfaceView和帧记录
+        """
+        self.surface_view = None
+        self._last_present = 0
+        self._last_vsync = 0
+        self._history = []
+
+    async def poll(self) -> FpsStat:
+        """
+        采样一次，只统计上次采样之后的新帧
+
+        Returns:
+            FpsStat: 帧率数据，第一次采样统计的是设备上已有的帧
+        """
+        backend = self.backend or self._plugin._backends.get(self.package_name)
+        if backend == FpsBackend.GFXINFO:
+            return await self._poll_gfxinfo()
+
+        stat = await self._poll_surface_flinger()
+        if backend is None:
+            if self._last_present:
+                self._plugin._backends[self.package_name] = FpsBackend.SURFACE_FLINGER
+            else:
+                stat = await self._poll_gfxinfo()
+                if self._last_present:
+                    self._plugin._backends[self.package_name] = FpsBackend.GFXINFO
+        return stat
+
+    async def _poll_surface_flinger(self) -> FpsStat:
+        if self.surface_view is None:
+            self.surface_view = await self._plugin.get_surface_view(self.package_name)
+            if self.surface_view is None:
+                return FpsStat(fps=0, jank=0, big_jank=0, frametimes=[])
+
+        result: str = await self._plugin._device.shell(
+            f'dumpsys SurfaceFlinger --latency "{self.surface_view}"'
+        )
+        _, timestamps = parse_latency(result, self._last_present)
+
+        if not timestamps and len(result.strip().split("\n")) <= 1:
+            # SurfaceView已经销毁，下次重新查找
+            self.reset()
+            return FpsStat(fps=0, jank=0, big_jank=0, frametimes=[])
+
+        return self._update(timestamps)
+
+    async def _poll_gfxinfo(self) -> FpsStat:
+        # reset让下一次只输出这次之后的帧，IntendedVsync去重是为了防止多个窗口或者reset失效
+        result: str = await self._plugin._device.shell(
+            f"dumpsys gfxinfo {self.package_name} framestats reset"
+        )
+        frames = parse_framestats(result, self._last_vsync)
+        if not len(frames):
+            return FpsStat(fps=0, jank=0, big_jank=0, frametimes=[])
+
+        self._last_vsync = max(self._last_vsync, max(frames["IntendedVsync"]))
+        stat = self._update(list(frames["FrameCompleted"]))
+        stat.stages = frames.stages()
+        return stat
+
+    def _update(self, timestamps: List[int]) -> FpsStat:
+        if not timestamps:
+            return FpsStat(fps=0, jank=0, big_jank=0, frametimes=[])
+
+        if self._last_present:
+            presents = [self._last_present] + timestamps
+        else:
+            presents = timestamps
+
+        start = presents[0]
+        frame_count = len(presents) - 1
+        frametimes = [
+            round((cur - pre) / 1e6, 2) for pre, cur in zip(presents, presents[1:])
+        ]
+
+        jank, big_jank = 0.0, 0.0
+        history = self._history
+        for frametime in frametimes:
+            if len(history) >= 3:
+                pre_three_avg = (history[-1] + history[-2] + history[-3]) / 3
+                if frametime > 2 * pre_three_avg:
+                    if frametime > 83.33:
+                        jank += 1
+                    if frametime > 125:
+                        big_jank += 1
+            history.append(frametime)
+        self._history = history[-3:]
+        self._last_present = timestamps[-1]
+
+        duration = timestamps[-1] - start
+        fps = frame_count * 1e9 / duration if duration > 0 else 0
+
+        sorted_frametimes = sorted(frametimes)
+        return FpsStat(
+            fps=fps,
+            jank=jank,
+            big_jank=big_jank,
+            frametimes=frametimes,
+            p50=_percentile(sorted_frametimes, 50),
+            p90=_percentile(sorted_frametimes, 90),
+            p95=_percentile(sorted_frametimes, 95),
+            p99=_percentile(sorted_frametimes, 99),
+        )
 
 
 class FpsPlugin(Plugin):
+    def __init__(self, device) -> None:
+        super().__init__(device)
+        # 包名到自动选择的采样后端
+        self._backends: Dict[str, FpsBackend] = {}
+
     async def get_surface_view(self, package_name: str) -> Optional[str]:
         result: str = await self._device.shell(
             f'dumpsys SurfaceFlinger --list|grep "{package_name}"'
@@ -43,6 +373,38 @@ class FpsPlugin(Plugin):
 
         return target_surface_view.strip() if target_surface_view else None
 
+    async def monitor(
+        self,
+        package_name: str,
+        interval: float = 1,
+        backend: Optional[FpsBackend] = None,
+    ) -> AsyncGenerator[FpsStat, Any]:
+        """
+        按固定间隔持续采样帧率，每次只统计上次采样之后的新帧
+
+        --latency 表只保存最近127帧，gfxinfo framestats只保存最近120帧，
+        高刷新率设备上间隔不要超过 120/刷新率 秒，否则两次采样之间会丢帧。
+
+        Args:
+            package_name (str): 包名
+            interval (float, optional): 采样间隔，单位秒. Defaults to 1.
+            backend (Optional[FpsBackend], optional): 采样后端，默认自动选择. Defaults to None.
+
+        Yields:
+            FpsStat: 帧率数据，第一次返回的是设备上已有的帧
+        """
+        monitor = FpsMonitor(self, package_name, backend)
+        loop = asyncio.get_event_loop()
+        next_tick = loop.time()
+        while True:
+            yield await monitor.poll()
+
+            next_tick += interval
+            now = loop.time()
+            if next_tick < now:
+                next_tick += ((now - next_tick) // interval + 1) * interval
+            await asyncio.sleep(next_tick - now)
+
     async def stat(self, package_name: str) -> FpsStat:
         """
         采样
@@ -54,12 +416,24 @@ class FpsPlugin(Plugin):
             FpsStat: 帧率数据
         """
 
-        data = FpsStat(fps=0, jank=0, big_jank=0, frametimes=[])
-
         surface_view = await self.get_surface_view(package_name)
 
         if not surface_view:
-            return data
+            return FpsStat(fps=0, jank=0, big_jank=0, frametimes=[])
+
+        return await self.stat_surface(surface_view)
+
+    async def stat_surface(self, surface_view: str) -> FpsStat:
+        """
+        对已经找到的SurfaceView采样，持续采样时可以缓存SurfaceView避免每次都 `--list`
+
+        Args:
+            surface_view (str): SurfaceView名
+
+        Returns:
+            FpsStat: 帧率数据
+        """
+        data = FpsStat(fps=0, jank=0, big_jank=0, frametimes=[])
 
         result: str = await self._device.shell(
             f'dumpsys SurfaceFlinger --latency "{surface_view}"'
@@ -1,6 +1,332 @@
+"""
+logcat
+
+`logs` 按行输出文本日志，适合简单查看。
+
+日志量大的时候用 `stream` ：`logcat -B` 直接输出logd里的二进制 `logger_entry` 记录，
+不需要设备端格式化文本，主机端按块批量解析，先用tag、优先级过滤再解码，
+解析结果放进有界缓冲区，消费者跟不上时按 `OverflowPolicy` 丢弃或者阻塞。
+"""
+import asyncio
+import collections
+import enum
+import struct
+
 from asyncio import StreamReader
-from typing import Any, AsyncGenerator
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Deque,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
 from async_adbc.plugin import Plugin
+from async_adbc.protocol import Response
+
+if TYPE_CHECKING:
+    from async_adbc.device import Device
+    from async_adbc.logarchive import LogcatRecorder
+
+
+# len, hdr_size, pid, tid, sec, nsec，v1的hdr_size是0，
+# v2、v3的hdr_size都是24，后面的4字节v2是euid、v3是lid，v4的hdr_size是28，后面是lid、uid
+LOGGER_ENTRY = struct.Struct("<HHiIII")
+LOGGER_ENTRY_V1_SIZE = LOGGER_ENTRY.size
+LOGGER_ENTRY_V4_SIZE = LOGGER_ENTRY_V1_SIZE + 8
+LOGGER_ENTRY_LID = struct.Struct("<I")
+LOGGER_ENTRY_UID = struct.Struct("<I")
+
+
+class LogPriority(enum.IntEnum):
+    VERBOSE = 2
+    DEBUG = 3
+    INFO = 4
+    WARN = 5
+    ERROR = 6
+    FATAL = 7
+    SILENT = 8
+
+
+class LogId(enum.IntEnum):
+    MAIN = 0
+    RADIO = 1
+    EVENTS = 2
+    SYSTEM = 3
+    CRASH = 4
+    STATS = 5
+    SECURITY = 6
+    KERNEL = 7
+
+
+# 这几个缓冲区的负载是二进制事件，不是 优先级+tag+消息 的文本格式
+BINARY_LOG_IDS = {LogId.EVENTS, LogId.STATS, LogId.SECURITY}
+
+
+class LogEntry(NamedTuple):
+    pid: int
+    tid: int
+    sec: int
+    nsec: int
+    priority: int  # 参考 `LogPriority`
+    tag: str
+    message: str
+    log_id: int = LogId.MAIN
+    uid: int = -1  # v4以前的记录没有uid
+
+    @property
+    def timestamp(self) -> float:
+        return self.sec + self.nsec / 1e9
+
+
+def parse_logger_entries(
+    data: bytes,
+    tags: Optional[Set[bytes]] = None,
+    min_priority: int = 0,
+    header_v3: bool = False,
+) -> Tuple[List[LogEntry], int]:
+    """
+    批量解析 `logcat -B` 输出的 `logger_entry` 记录
+
+    过滤在解码之前：优先级直接比较字节，tag比较原始字节，没通过的记录不会解码字符串。
+
+    24字节的头可能是v2（最后4字节是euid）也可能是v3（最后4字节是lid），从数据上区分不了，
+    默认按v2处理，log_id为MAIN，确定设备是v3时传header_v3。
+
+    Args:
+        data (bytes): 二进制数据，可以是bytes或者bytearray
+        tags (Optional[Set[bytes]], optional): 只保留这些tag（utf-8编码），None表示全部. Defaults to None.
+        min_priority (int, optional): 只保留优先级不低于它的记录. Defaults to 0.
+        header_v3 (bool, optional): 24字节的头按v3解析. Defaults to False.
+
+    Returns:
+        Tuple[List[LogEntry], int]: 解析出的记录，以及已经消费的字节数（最后一条不完整的记录留给下一次）
+    """
+    entries: List[LogEntry] = []
+    offset = 0
+    total = len(data)
+    unpack_header = LOGGER_ENTRY.unpack_from
+    lid_size = LOGGER_ENTRY_V1_SIZE + 4 if header_v3 else LOGGER_ENTRY_V4_SIZE
+
+    while offset + LOGGER_ENTRY_V1_SIZE <= total:
+        length, hdr_size, pid, tid, sec, nsec = unpack_header(data, offset)
+        hdr_size = hdr_size or LOGGER_ENTRY_V1_SIZE
+        end = offset + hdr_size + length
+        if end > total:
+            break
+
+        start = offset + hdr_size
+        log_id = LogId.MAIN
+        uid = -1
+        if hdr_size >= lid_size:
+            (log_id,) = LOGGER_ENTRY_LID.unpack_from(data, offset + LOGGER_ENTRY_V1_SIZE)
+        if hdr_size >= LOGGER_ENTRY_V4_SIZE:
+            (uid,) = LOGGER_ENTRY_UID.unpack_from(data, offset + LOGGER_ENTRY_V1_SIZE + 4)
+        offset = end
+
+        if length < 2 or log_id in BINARY_LOG_IDS:
+            continue
+
+        priority = data[start]
+        if priority < min_priority:
+            continue
+
+        tag_end = data.find(b"\0", start + 1, end)
+        if tag_end < 0:
+            tag_end = end
+        tag = bytes(data[start + 1 : tag_end])
+        if tags is not None and tag not in tags:
+            continue
+
+        message = bytes(data[tag_end + 1 : end]).rstrip(b"\0\n")
+        entries.append(
+            LogEntry(
+                pid,
+                tid,
+                sec,
+                nsec,
+                priority,
+                tag.decode(errors="replace"),
+                message.decode(errors="replace"),
+                log_id,
+                uid,
+            )
+        )
+
+    return entries, offset
+
+
+class OverflowPolicy(enum.Enum):
+    BLOCK = "block"  # 停止读取，等消费者取走，adb连接会把压力传回设备
+    DROP_NEWEST = "drop_newest"  # 丢弃新解析的记录
+    DROP_OLDEST = "drop_oldest"  # 丢弃缓冲区里最早的记录
+
+
+class LogcatStream:
+    """
+    二进制logcat流
+
+        async with device.logcat.stream(tags=["ActivityManager"]) as stream:
+            async for entry in stream:
+                print(entry.tag, entry.message)
+
+    Args:
+        device (Device): 设备
+        args (Iterable[str], optional): 额外的logcat参数，比如 `-b all` 、 `-T 1`. Defaults to ().
+        tags (Optional[Iterable[str]], optional): 只保留这些tag，None表示全部. Defaults to None.
+        min_priority (int, optional): 只保留优先级不低于它的记录，参考 `LogPriority`. Defaults to LogPriority.VERBOSE.
+        maxsize (int, optional): 缓冲区最多保留的记录数. Defaults to 10000.
+        policy (OverflowPolicy, optional): 缓冲区满了之后的处理方式. Defaults to OverflowPolicy.DROP_OLDEST.
+        chunk_size (int, optional): 每次读取的字节数. Defaults to 65536.
+        header_v3 (bool, optional): 24字节的头按v3解析，参考 `parse_logger_entries`. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        device: "Device",
+        args: Iterable[str] = (),
+        tags: Optional[Iterable[str]] = None,
+        min_priority: int = LogPriority.VERBOSE,
+        maxsize: int = 10000,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        chunk_size: int = 65536,
+        header_v3: bool = False,
+    ) -> None:
+        self._device = device
+        self.args = list(args)
+        self.tags = {tag.encode() for tag in tags} if tags is not None else None
+        self.min_priority = min_priority
+        self.maxsize = maxsize
+        self.policy = policy
+        self.chunk_size = chunk_size
+        self.header_v3 = header_v3
+
+        self.received = 0  # 通过过滤的记录数
+        self.dropped = 0  # 缓冲区满了被丢弃的记录数
+
+        self._entries: Deque[LogEntry] = collections.deque()
+        self._res: Optional[Response] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._not_empty: Optional[asyncio.Event] = None
+        self._not_full: Optional[asyncio.Event] = None
+
+    async def start(self):
+        """
+        启动 `logcat -B` 并开始在后台解析
+        """
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        # 二进制输出经过pty会被改坏，老设备用exec:
+        service = "exec" if await self._device.utils.needs_crlf_fix() else "shell"
+        self._res = await self._device.request(
+            service, " ".join(["logcat", "-B", *self.args])
+        )
+        self._task = asyncio.ensure_future(self._pump(self._res.reader))
+
+    async def _pump(self, reader: StreamReader):
+        assert self._not_empty is not None
+        buffer = bytearray()
+        try:
+            while True:
+                chunk = await reader.read(self.chunk_size)
+                if not chunk:
+                    return
+                buffer += chunk
+                entries, consumed = parse_logger_entries(
+                    buffer, self.tags, self.min_priority, self.header_v3
+                )
+                del buffer[:consumed]
+                if entries:
+                    self.received += len(entries)
+                    await self._put(entries)
+        finally:
+            # 唤醒消费者，让它发现流已经结束
+            self._not_empty.set()
+
+    async def _put(self, entries: List[LogEntry]):
+        assert self._not_empty is not None and self._not_full is not None
+        queue = self._entries
+
+        if self.policy == OverflowPolicy.BLOCK:
+            for entry in entries:
+                while len(queue) >= self.maxsize:
+                    self._not_full.clear()
+                    self._not_empty.set()
+                    await self._not_full.wait()
+                queue.append(entry)
+        elif self.policy == OverflowPolicy.DROP_NEWEST:
+            space = max(0, self.maxsize - len(queue))
+            queue.extend(entries[:space])
+            self.dropped += len(entries) - min(space, len(entries))
+        else:
+            queue.extend(entries)
+            overflow = len(queue) - self.maxsize
+            if overflow > 0:
+                self.dropped += overflow
+                for _ in range(overflow):
+                    queue.popleft()
+
+        self._not_empty.set()
+
+    async def get_batch(self, max_size: int = 0) -> List[LogEntry]:
+        """
+        等待并取出缓冲区里的所有记录，比逐条 `async for` 开销小
+
+        Args:
+            max_size (int, optional): 最多取多少条，0表示全部. Defaults to 0.
+
+        Returns:
+            List[LogEntry]: 记录，流已经结束并且缓冲区为空时返回空列表
+        """
+        assert self._not_empty is not None and self._not_full is not None
+        queue = self._entries
+        while not queue:
+            if self._task is None or self._task.done():
+                if self._task is not None and not self._task.cancelled():
+                    # 把后台任务里的异常抛给消费者
+                    self._task.result()
+                return []
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        count = len(queue) if not max_size else min(max_size, len(queue))
+        batch = [queue.popleft() for _ in range(count)]
+        self._not_full.set()
+        return batch
+
+    async def __aiter__(self) -> AsyncGenerator[LogEntry, Any]:
+        while True:
+            batch = await self.get_batch()
+            if not batch:
+                return
+            for entry in batch:
+                yield entry
+
+    async def close(self):
+        """
+        停止logcat
+        """
+        if self._res is not None:
+            self._res.close()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except BaseException:
+                pass
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
 
 
 class LogcatPlugin(Plugin):
@@ -15,16 +341,97 @@ class LogcatPlugin(Plugin):
         reader = await self._device.shell_reader("logcat", *args)
         return reader
 
-    async def logs(self, *args: str) -> AsyncGenerator[Any, str]:
-        """将reader封装成一个异步迭代器，你可以通过async for迭代每一行
+    async def logs(self, *args: str) -> AsyncGenerator[str, Any]:
+        """将logcat封装成一个异步迭代器，你可以通过async for迭代每一行
 
-        Returns:
-            AsyncGenerator[Any, str]: _description_
+        每次读取一大块再切成行，停止迭代时会关闭连接。
+
+        Args:
+            args (str): logcat参数，比如 `-v` 、 `threadtime`
 
         Yields:
-            Iterator[AsyncGenerator[Any, str]]: _description_
+            str: 一行日志，不带换行符
+        """
+        res = await self._device.request("shell", " ".join(["logcat", *args]))
+        reader = res.reader
+        try:
+            rest = b""
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                lines = (rest + chunk).split(b"\n")
+                rest = lines.pop()
+                for line in lines:
+                    yield line.rstrip(b"\r").decode(errors="replace")
+            if rest:
+                yield rest.rstrip(b"\r").decode(errors="replace")
+        finally:
+            res.close()
+
+    def stream(
+        self,
+        *args: str,
+        tags: Optional[Iterable[str]] = None,
+        min_priority: int = LogPriority.VERBOSE,
+        maxsize: int = 10000,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        header_v3: bool = False,
+    ) -> LogcatStream:
+        """
+        创建二进制logcat流，用 `async with` 启动，参考 `LogcatStream`
+
+        Args:
+            args (str): 额外的logcat参数，比如 `-b` 、 `main,system`
+            tags (Optional[Iterable[str]], optional): 只保留这些tag，None表示全部. Defaults to None.
+            min_priority (int, optional): 只保留优先级不低于它的记录. Defaults to LogPriority.VERBOSE.
+            maxsize (int, optional): 缓冲区最多保留的记录数. Defaults to 10000.
+            policy (OverflowPolicy, optional): 缓冲区满了之后的处理方式. Defaults to OverflowPolicy.DROP_OLDEST.
+            header_v3 (bool, optional): 24字节的头按v3解析，参考 `parse_logger_entries`. Defaults to False.
+
+        Returns:
+            LogcatStream: 日志流
         """
-        reader = await self.reader()
-        while not reader.at_eof():
-            line = await reader.readline()
-            yield line
+        return LogcatStream(
+            self._device, args, tags, min_priority, maxsize, policy, header_v3=header_v3
+        )
+
+    def record(
+        self,
+        path: str,
+        *args: str,
+        tags: Optional[Iterable[str]] = None,
+        min_priority: int = LogPriority.VERBOSE,
+        compression: str = "gzip",
+        max_bytes: int = 64 * 1024 * 1024,
+        max_seconds: float = 3600,
+    ) -> "LogcatRecorder":
+        """
+        把logcat写进按大小、时间轮转的压缩归档，用 `async with` 启动，
+        读取用 `async_adbc.logarchive.LogArchive` ，参考 `LogcatRecorder`
+
+        Args:
+            path (str): 归档目录
+            args (str): 额外的logcat参数
+            tags (Optional[Iterable[str]], optional): 只记录这些tag. Defaults to None.
+            min_priority (int, optional): 只记录优先级不低于它的记录. Defaults to LogPriority.VERBOSE.
+            compression (str, optional): `gzip` 或者 `zstd` （需要安装zstandard）. Defaults to "gzip".
+            max_bytes (int, optional): 分段轮转大小. Defaults to 64MiB.
+            max_seconds (float, optional): 分段轮转时间，单位秒. Defaults to 3600.
+
+        Returns:
+            LogcatRecorder: 归档写入器
+        """
+        # logarchive依赖这个模块里的LogcatStream，放在这里导入避免循环导入
+        from async_adbc.logarchive import LogcatRecorder
+
+        return LogcatRecorder(
+            self._device,
+            path,
+            args,
+            tags,
+            min_priority,
+            compression=compression,
+            max_bytes=max_bytes,
+            max_seconds=max_seconds,
+        )
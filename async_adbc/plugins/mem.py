@@ -1,14 +1,42 @@
+import enum
 import re
+import time
+
+from typing import Dict, Optional
 from pydantic import BaseModel, Field
 from async_adbc.plugin import Plugin
 
 
 class MemInfo(BaseModel):
+    """
+    /proc/meminfo ，单位是 KB
+    """
+
     mem_total: int  # 内存大小
     swap_total: int  # 交换页大小
+    mem_free: int = 0
+    mem_available: int = 0
+    buffers: int = 0
+    cached: int = 0
+    swap_free: int = 0
+    shmem: int = 0
+    slab: int = 0
+
+
+class MemSource(enum.Enum):
+    SMAPS_ROLLUP = "smaps_rollup"  # /proc/<pid>/smaps_rollup
+    STATM = "statm"  # /proc/<pid>/statm ，只有rss
+    DUMPSYS = "dumpsys"  # dumpsys meminfo
 
 
 class MemStat(BaseModel):
+    """
+    应用内存，单位是 KB
+
+    heap_*只有 `dumpsys meminfo` 才有，rss、swap只有 /proc/<pid>/smaps_rollup 、statm 才有，
+    source是pss、private_*的来源
+    """
+
     pss: int = Field(default=0)
     private_dirty: int = Field(default=0)
     private_clean: int = Field(default=0)
@@ -16,44 +44,234 @@ class MemStat(BaseModel):
     heap_size: int = Field(default=0)
     heap_alloc: int = Field(default=0)
     heap_free: int = Field(default=0)
+    rss: int = Field(default=0)
+    swap: int = Field(default=0)
+    source: Optional[MemSource] = None
+
+
+# /proc/meminfo 字段到MemInfo字段
+_MEMINFO_FIELDS = {
+    "MemTotal": "mem_total",
+    "SwapTotal": "swap_total",
+    "MemFree": "mem_free",
+    "MemAvailable": "mem_available",
+    "Buffers": "buffers",
+    "Cached": "cached",
+    "SwapFree": "swap_free",
+    "Shmem": "shmem",
+    "Slab": "slab",
+}
+
+# smaps_rollup字段到MemStat字段，Swap和SwapPss都有的时候用SwapPss
+_SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+    "Swap": "swap",
+    "SwapPss": "swap",
+}
+
+_KB_LINE_PATTERN = re.compile(r"^(\w+):\s+(\d+)", re.M)
+
+
+def parse_kb_fields(text: str) -> Dict[str, int]:
+    """
+    解析 `Name:   123 kB` 格式的文件，/proc/meminfo 和 smaps_rollup 都是这种格式
+
+    Args:
+        text (str): 文件内容
+
+    Returns:
+        Dict[str, int]: 字段名到数值
+    """
+    return {name: int(value) for name, value in _KB_LINE_PATTERN.findall(text)}
+
+
+def parse_meminfo(text: str) -> MemInfo:
+    """
+    解析 /proc/meminfo
+
+    Args:
+        text (str): 文件内容
+
+    Returns:
+        MemInfo: 内存信息
+    """
+    fields = parse_kb_fields(text)
+    values = {
+        attr: fields.get(name, 0) for name, attr in _MEMINFO_FIELDS.items()
+    }
+    return MemInfo(**values)
+
+
+def parse_smaps_rollup(text: str) -> MemStat:
+    """
+    解析 /proc/<pid>/smaps_rollup
+
+    Args:
+        text (str): 文件内容
+
+    Returns:
+        MemStat: 应用内存，没有heap信息
+    """
+    fields = parse_kb_fields(text)
+    values = {
+        attr: fields[name] for name, attr in _SMAPS_FIELDS.items() if name in fields
+    }
+    return MemStat(source=MemSource.SMAPS_ROLLUP, **values)
+
+
+def parse_statm(text: str, page_size: int) -> MemStat:
+    """
+    解析 /proc/<pid>/statm ，只有rss，pss为0
+
+    Args:
+        text (str): 文件内容
+        page_size (int): 内核页大小，参考 `Device.page_size`
+
+    Returns:
+        MemStat: 应用内存
+    """
+    items = text.split()
+    return MemStat(rss=int(items[1]) * page_size // 1024, source=MemSource.STATM)
+
+
+class MemSampler:
+    """
+    持续采样一个应用的内存
+
+    每次采样读 /proc/<pid>/smaps_rollup（没有权限或者内核不支持时用statm），
+    `dumpsys meminfo` 很慢而且会让应用卡顿，只按heap_interval间隔获取heap信息，
+    两次dumpsys之间沿用上一次的heap数据。
+
+    没有root的设备上一般读不了其他应用的smaps_rollup，statm里没有pss，
+    这时pss、private_*也用最近一次dumpsys的结果，source为 `MemSource.DUMPSYS` 。
+
+    Args:
+        plugin (MemPlugin): 内存插件
+        package_name (str): 包名
+        heap_interval (float, optional): dumpsys meminfo的间隔，单位秒，0表示不获取heap. Defaults to 10.
+    """
+
+    def __init__(
+        self, plugin: "MemPlugin", package_name: str, heap_interval: float = 10
+    ) -> None:
+        self._plugin = plugin
+        self.package_name = package_name
+        self.heap_interval = heap_interval
+        self._pid: Optional[int] = None
+        self._heap: Optional[MemStat] = None
+        self._heap_time: Optional[float] = None
+
+    async def sample(self) -> MemStat:
+        """
+        采样一次
+
+        Returns:
+            MemStat: 应用内存，应用没有运行时全为0
+        """
+        if self._pid is None:
+            try:
+                self._pid = await self._plugin._device.get_pid_by_pkgname(
+                    self.package_name
+                )
+            except ValueError:
+                return MemStat()
+
+        stat = await self._plugin.process_stat(self._pid)
+        if stat is None:
+            # 进程已经退出，下次重新查pid
+            self._pid = None
+            self._heap = None
+            self._heap_time = None
+            return MemStat()
+
+        now = time.monotonic()
+        if self.heap_interval and (
+            self._heap_time is None or now - self._heap_time >= self.heap_interval
+        ):
+            self._heap = await self._plugin.stat(self.package_name)
+            self._heap_time = now
+
+        if self._heap is not None:
+            stat.heap_size = self._heap.heap_size
+            stat.heap_alloc = self._heap.heap_alloc
+            stat.heap_free = self._heap.heap_free
+            if stat.source == MemSource.STATM:
+                stat.pss = self._heap.pss
+                stat.private_dirty = self._heap.private_dirty
+                stat.private_clean = self._heap.private_clean
+                stat.swapped_dirty = self._heap.swapped_dirty
+                stat.source = MemSource.DUMPSYS
+        return stat
 
 
 class MemPlugin(Plugin):
     @property
     async def info(self) -> MemInfo:
         """
-        获取内存信息
+        获取内存信息，一次读取 /proc/meminfo
 
-        单位是 byte
+        单位是 KB
 
         Returns:
             MemInfo:
         """
+        result = await self._device.read_file("/proc/meminfo")
+        return parse_meminfo(result.output)
 
-        mem_total_str = await self._device.shell("cat /proc/meminfo|grep MemTotal")
-        swap_total_str = await self._device.shell("cat /proc/meminfo|grep SwapTotal")
+    async def process_stat(self, pid: int) -> Optional[MemStat]:
+        """
+        读取进程内存，比 `stat` 快得多，没有heap信息
+
+        smaps_rollup和statm在同一次读取里，smaps_rollup读取失败（没有权限、Android 10以前的内核）
+        时用statm，这时只有rss。
 
-        mem_total_match = re.search(r"\d+", mem_total_str)
-        swap_total_match = re.search(r"\d+", swap_total_str)
+        单位是 KB
+
+        Args:
+            pid (int): 进程pid
 
-        mem_total = mem_total_match.group() if mem_total_match else 0
-        swap_total = swap_total_match.group() if swap_total_match else 0
+        Returns:
+            Optional[MemStat]: 进程不存在时为None
+        """
+        smaps, statm = await self._device.read_files(
+            [f"/proc/{pid}/smaps_rollup", f"/proc/{pid}/statm"]
+        )
+        if smaps.ok and smaps.output:
+            return parse_smaps_rollup(smaps.output)
+        if statm.ok and statm.output:
+            return parse_statm(statm.output, await self._device.page_size)
+        return None
 
-        return MemInfo(mem_total=int(mem_total), swap_total=int(swap_total))
+    def sampler(self, package_name: str, heap_interval: float = 10) -> MemSampler:
+        """
+        创建内存采样器，参考 `MemSampler`
+
+        Args:
+            package_name (str): 包名
+            heap_interval (float, optional): dumpsys meminfo的间隔，单位秒. Defaults to 10.
+
+        Returns:
+            MemSampler: 采样器
+        """
+        return MemSampler(self, package_name, heap_interval)
 
     async def stat(self, package_name: str) -> MemStat:
         """
-        获取app的内存性能
+        通过 `dumpsys meminfo` 获取app的内存性能
 
-        单位是 byte
+        NOTE: dumpsys meminfo 在设备上要几百毫秒到一秒，并且会让应用卡顿，
+        持续采样用 `sampler` 。
 
-        _extended_summary_
+        单位是 KB
 
         Args:
-            package_name (str): _description_
+            package_name (str): 包名
 
         Returns:
-            _type_: _description_
+            MemStat: 应用内存
         """
         total_meminfo_re = re.compile(
             r"\s*TOTAL\s*(?P<pss>\d+)"
@@ -70,6 +288,9 @@ class MemPlugin(Plugin):
         match = total_meminfo_re.search(result, 0)
 
         if match:
-            return MemStat(**{k: int(v) for k, v in match.groupdict().items()})
+            return MemStat(
+                source=MemSource.DUMPSYS,
+                **{k: int(v) for k, v in match.groupdict().items()},
+            )
         else:
             return MemStat()
@@ -1,24 +1,285 @@
+"""
+minicap截图
+
+`get_frame` 每次启动一次minicap截一张图，适合偶尔截图。
+连续截图用 `stream` ：minicap以守护进程的方式只启动一次，通过它的abstract socket持续接收帧。
+
+minicap socket协议：连接后先收到一个banner，之后每一帧是 4字节小端长度 + JPEG数据。
+"""
+import asyncio
 import os
+import struct
+
 # import pkg_resources
 from importlib import resources
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Optional
+from async_lru import alru_cache
+from pydantic import BaseModel
 from async_adbc.plugin import Plugin
-with resources.path('async_adbc','vendor') as path:
-    MINICAP_LIBS = os.path.join(path,"minicap")
+from async_adbc.protocol import (
+    Connection,
+    ConnectionClosedError,
+    DeviceError,
+    Response,
+    read_exactly,
+)
+
+if TYPE_CHECKING:
+    from async_adbc.device import Device
+
+with resources.path("async_adbc", "vendor") as path:
+    MINICAP_LIBS = os.path.join(path, "minicap")
+
+# version, banner长度，之后是 pid, 真实宽高, 虚拟宽高, 旋转方向, quirks
+MINICAP_BANNER = struct.Struct("<BBIIIIIBB")
+MINICAP_FRAME_HEADER = struct.Struct("<I")
+
+
+class MinicapBanner(BaseModel):
+    version: int
+    pid: int  # 设备上minicap进程的pid
+    real_width: int
+    real_height: int
+    virtual_width: int  # 输出图片的宽高
+    virtual_height: int
+    orientation: int  # 旋转角度
+    quirks: int
+
+
+def parse_banner(data: bytes) -> MinicapBanner:
+    """
+    解析minicap banner
+
+    Args:
+        data (bytes): banner数据，至少 `MINICAP_BANNER.size` 字节
+
+    Returns:
+        MinicapBanner: banner
+    """
+    (
+        version,
+        _,
+        pid,
+        real_width,
+        real_height,
+        virtual_width,
+        virtual_height,
+        orientation,
+        quirks,
+    ) = MINICAP_BANNER.unpack_from(data)
+    return MinicapBanner(
+        version=version,
+        pid=pid,
+        real_width=real_width,
+        real_height=real_height,
+        virtual_width=virtual_width,
+        virtual_height=virtual_height,
+        orientation=orientation * 90,
+        quirks=quirks,
+    )
+
+
+class MinicapStream:
+    """
+    minicap帧流
+
+    后台任务持续接收帧，只保留最新的一帧：消费者处理得比minicap出帧慢的时候，
+    中间的帧直接丢弃（计数在 `dropped` 里），不会积压延迟。
+
+        async with device.minicap.stream() as stream:
+            async for frame in stream:
+                ...
+
+    Args:
+        device (Device): 设备
+        size (Optional[str], optional): 输出图片的大小，比如 `720x1280` ，默认是屏幕物理分辨率. Defaults to None.
+        quality (int, optional): JPEG质量. Defaults to 80.
+        socket_name (str, optional): minicap的abstract socket名. Defaults to "minicap".
+        timeout (float, optional): 等待minicap启动的超时，单位秒. Defaults to 10.
+    """
+
+    def __init__(
+        self,
+        device: "Device",
+        size: Optional[str] = None,
+        quality: int = 80,
+        socket_name: str = "minicap",
+        timeout: float = 10,
+    ) -> None:
+        self._device = device
+        self.size = size
+        self.quality = quality
+        self.socket_name = socket_name
+        self.timeout = timeout
+
+        self.banner: Optional[MinicapBanner] = None
+        self.frames = 0  # 收到的帧数
+        self.dropped = 0  # 来不及消费被丢弃的帧数
+
+        self._daemon: Optional[Response] = None
+        self._daemon_output = bytearray()
+        self._daemon_task: Optional["asyncio.Task[None]"] = None
+        self._conn: Optional[Connection] = None
+        self._pump_task: Optional["asyncio.Task[None]"] = None
+        self._latest: Optional[bytes] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    async def start(self):
+        """
+        启动minicap守护进程并连接它的socket，收到banner后返回
+
+        Raises:
+            RuntimeError: minicap启动失败
+            asyncio.TimeoutError: 等待minicap启动超时
+        """
+        self._ready = asyncio.Event()
+        await self._device.minicap.init()
+
+        resolution = await self._device.wm.size()
+        real_size = resolution.physical_size
+        orientation = await self._device.wm.orientation()
+
+        self._daemon = await self._device.request(
+            "shell",
+            f"LD_LIBRARY_PATH={MinicapPlugin.PUSH_TO} {MinicapPlugin.PUSH_TO}/minicap"
+            f" -P {real_size}@{self.size or real_size}/{orientation}"
+            f" -Q {self.quality} -n {self.socket_name}",
+        )
+        # 一直读走minicap的日志，避免管道写满卡住minicap，退出时用来报错
+        self._daemon_task = asyncio.ensure_future(self._drain_daemon(self._daemon))
+
+        try:
+            self._conn = await asyncio.wait_for(self._connect(), self.timeout)
+            header = await read_exactly(self._conn.reader, 2)
+            rest = await read_exactly(self._conn.reader, header[1] - 2)
+            self.banner = parse_banner(header + rest)
+        except BaseException:
+            await self.close()
+            raise
+
+        self._pump_task = asyncio.ensure_future(self._pump(self._conn))
+
+    async def _drain_daemon(self, daemon: Response):
+        while True:
+            data = await daemon.reader.read(4096)
+            if not data:
+                return
+            self._daemon_output += data
+
+    async def _connect(self) -> Connection:
+        # minicap启动到创建socket需要一点时间，连不上就重试
+        while True:
+            if self._daemon_task is not None and self._daemon_task.done():
+                output = self._daemon_output.decode(errors="replace")
+                raise RuntimeError("minicap已退出", output)
+
+            conn = await self._device.create_connection()
+            try:
+                await conn.request(f"localabstract:{self.socket_name}")
+                return conn
+            except DeviceError:
+                conn.close()
+            await asyncio.sleep(0.05)
+
+    async def _pump(self, conn: Connection):
+        assert self._ready is not None
+        reader = conn.reader
+        try:
+            while True:
+                header = await read_exactly(reader, MINICAP_FRAME_HEADER.size)
+                (length,) = MINICAP_FRAME_HEADER.unpack(header)
+                frame = await read_exactly(reader, length)
+
+                if self._latest is not None:
+                    self.dropped += 1
+                self._latest = frame
+                self.frames += 1
+                self._ready.set()
+        except ConnectionClosedError:
+            pass
+        finally:
+            # 唤醒等待的消费者，让它发现流已经结束
+            self._ready.set()
+
+    async def frame(self) -> bytes:
+        """
+        等待并返回下一帧，两次调用之间收到多帧时只返回最新的
+
+        Raises:
+            ConnectionClosedError: 流已经结束
+
+        Returns:
+            bytes: JPEG数据
+        """
+        while self._latest is None:
+            if self._pump_task is None or self._pump_task.done():
+                if self._pump_task is not None and not self._pump_task.cancelled():
+                    # 把pump里的异常抛给消费者
+                    self._pump_task.result()
+                raise ConnectionClosedError("minicap流已结束")
+            assert self._ready is not None
+            self._ready.clear()
+            await self._ready.wait()
+
+        frame, self._latest = self._latest, None
+        return frame
+
+    async def __aiter__(self) -> AsyncGenerator[bytes, Any]:
+        while True:
+            try:
+                yield await self.frame()
+            except ConnectionClosedError:
+                return
+
+    async def close(self):
+        """
+        断开socket，结束设备上的minicap进程
+        """
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+        if self._conn is not None:
+            self._conn.close()
+
+        if self.banner is not None:
+            try:
+                await self._device.shell(f"kill {self.banner.pid}")
+            except Exception:
+                pass
+
+        if self._daemon is not None:
+            self._daemon.close()
+        if self._daemon_task is not None:
+            self._daemon_task.cancel()
+
+        for task in (self._pump_task, self._daemon_task):
+            if task is not None:
+                try:
+                    await task
+                except BaseException:
+                    pass
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
 
 
 class MinicapPlugin(Plugin):
     PUSH_TO = "/data/local/tmp"
 
+    @alru_cache
     async def init(self):
         """
         初始化minicap
-        """
 
-        exists = await self._device.file_exists("/data/local/tmp/minicap")
-        exists = exists and await self._device.file_exists(
-            "/data/local/temp/minicap.so"
+        检查结果做了缓存，同一台设备只会检查、推送一次
+        """
+        exists = await self._device.shell(
+            f"[ -f {self.PUSH_TO}/minicap ] && [ -f {self.PUSH_TO}/minicap.so ] && echo ok"
         )
-        if exists:
+        if exists == "ok":
             return
 
         props = await self._device.properties
@@ -54,10 +315,12 @@ class MinicapPlugin(Plugin):
 
         await self._device.push(sofile_path, self.PUSH_TO + "/minicap.so", chmode=0o755)
 
-    async def get_frame(self)->bytes:
+    async def get_frame(self) -> bytes:
         """
         获取当前屏幕帧截图
 
+        每次都会启动一次minicap，连续截图用 `stream`
+
         Raises:
             RuntimeError: CANNOT LINK EXECUTABLE
             RuntimeError: naccessible or not found
@@ -65,27 +328,48 @@ class MinicapPlugin(Plugin):
         Returns:
             bytes: jpg格式字节
         """
-        
+
         await self.init()
 
         resolution = await self._device.wm.size()
         size = resolution.physical_size
         orientation = await self._device.wm.orientation()
         raw_data = await self._device.shell_raw(
-            "LD_LIBRARY_PATH=/data/local/tmp /data/local/tmp/minicap",
+            f"LD_LIBRARY_PATH={self.PUSH_TO} {self.PUSH_TO}/minicap",
             "-P",
             f"{size}@{size}/{orientation}",
             "-s",
         )
 
         if b"CANNOT LINK EXECUTABLE" in raw_data:
-            raise RuntimeError(raw_data.decode(),"CANNOT LINK EXECUTABLE")
+            raise RuntimeError(raw_data.decode(), "CANNOT LINK EXECUTABLE")
 
         if b"inaccessible or not found" in raw_data:
-            raise RuntimeError(raw_data.decode(),"inaccessible or not found")
+            raise RuntimeError(raw_data.decode(), "inaccessible or not found")
 
         return raw_data
 
+    def stream(
+        self,
+        size: Optional[str] = None,
+        quality: int = 80,
+        socket_name: str = "minicap",
+        timeout: float = 10,
+    ) -> MinicapStream:
+        """
+        创建minicap帧流，用 `async with` 启动，参考 `MinicapStream`
+
+        Args:
+            size (Optional[str], optional): 输出图片的大小，比如 `720x1280` ，默认是屏幕物理分辨率. Defaults to None.
+            quality (int, optional): JPEG质量. Defaults to 80.
+            socket_name (str, optional): minicap的abstract socket名. Defaults to "minicap".
+            timeout (float, optional): 等待minicap启动的超时，单位秒. Defaults to 10.
+
+        Returns:
+            MinicapStream: 帧流
+        """
+        return MinicapStream(self._device, size, quality, socket_name, timeout)
+
     async def screencap(self, filename="screencap.jpg"):
         """
         截图保存到本地
@@ -94,9 +378,6 @@ class MinicapPlugin(Plugin):
             filename (str, optional): 保存的文件名. Defaults to "screencap.jpg".
         """
         frame_data = await self.get_frame()
-        
+
         with open(filename, "wb") as f:
             f.write(frame_data)
-            
-        
-    
\ No newline at end of file
@@ -1,6 +1,7 @@
+import mmap
 import os
 import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Union
 
 from async_adbc.service.local import ProgressCallback
 from async_adbc.plugin import Plugin
@@ -21,6 +22,54 @@ class ClearError(Exception):
         super().__init__(f"{package_name}无法被清除 - [{msg}]")
 
 
+class ApkSource:
+    """
+    只读内存映射的apk文件，多台设备同时安装时共享同一份数据
+
+    文件内容只会被系统读进page cache一次，每台设备的连接都直接发送映射内存的切片，
+    不会在用户态重复读取和复制。
+
+    Args:
+        path (str): apk文件路径
+        chunk_size (int, optional): 每次写入连接的块大小. Defaults to 65536.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 65536) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            if self.size == 0:
+                raise InstallError(path, "apk文件为空")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def chunks(self) -> Iterator[memoryview]:
+        """
+        按chunk_size切分的只读切片，不复制数据
+
+        Yields:
+            memoryview: 数据块
+        """
+        for offset in range(0, self.size, self.chunk_size):
+            yield self._view[offset : offset + self.chunk_size]
+
+    def close(self):
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 还有切片被transport的发送缓冲区持有，交给GC释放映射
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
+
+
 class PMPlugin(Plugin):
     """
     PackageManager插件
@@ -83,18 +132,79 @@ class PMPlugin(Plugin):
 
         try:
             res = await self._device.shell(f"pm install {args} {dest}")
-            match = re.search(self.INSTALL_RESULT_PATTERN, res)
-            if match and match.group(1) == "Success":
-                return True
-            elif match:
-                groups = match.groups()
-                raise InstallError(path, groups)
-            else:
-                raise InstallError(path, f"android shell 打印:{res}")
-
+            return self._check_install_result(path, res)
         finally:
             await self._device.shell(f"rm -f {dest}")
 
+    async def install_stream(
+        self,
+        apk: Union[str, ApkSource],
+        args="rd",
+        progress_cb: Optional[ProgressCallback] = None,
+    ):
+        """
+        用 `pm install -S` 从连接直接读取apk安装，设备上不产生临时文件
+
+        等同于： adb install --streaming
+
+        设备支持 `cmd` 特性时用 `cmd package install` ，否则用 `pm install` 。
+        多台设备安装同一个apk时传入同一个 `ApkSource` ，文件只读取一次。
+
+        Args:
+            apk (Union[str, ApkSource]): apk路径或者已经映射的apk
+            args (str, optional): lrtsdg 等同 adb install的参数. Defaults to "rd".
+            progress_cb (Optional[ProgressCallback], optional): 进度回调，第一个参数是apk路径. Defaults to None.
+
+        Raises:
+            InstallError: 安装失败
+        """
+        source = apk if isinstance(apk, ApkSource) else ApkSource(apk)
+        try:
+            return await self._install_stream(source, args, progress_cb)
+        finally:
+            if source is not apk:
+                source.close()
+
+    async def _install_stream(
+        self,
+        source: ApkSource,
+        args: str,
+        progress_cb: Optional[ProgressCallback],
+    ):
+        flags = " ".join([f"-{c}" for c in args])
+        if "cmd" in await self._device.features:
+            cmd = f"cmd package install {flags} -S {source.size}"
+        else:
+            cmd = f"pm install {flags} -S {source.size}"
+
+        conn = await self._device.create_connection()
+        try:
+            await conn.request("exec", cmd)
+
+            has_send = 0
+            for chunk in source.chunks():
+                conn.writer.write(chunk)
+                has_send += len(chunk)
+                await conn.writer.drain()
+                if progress_cb:
+                    progress_cb(source.path, source.size, has_send)
+
+            res = (await conn.reader.read(-1)).decode(errors="replace")
+        finally:
+            conn.close()
+
+        return self._check_install_result(source.path, res)
+
+    def _check_install_result(self, path: str, res: str):
+        match = re.search(self.INSTALL_RESULT_PATTERN, res)
+        if match and match.group(1) == "Success":
+            return True
+        elif match:
+            groups = match.groups()
+            raise InstallError(path, groups)
+        else:
+            raise InstallError(path, f"android shell 打印:{res}")
+
     async def uninstall(self, package_name: str):
         """卸载app
 
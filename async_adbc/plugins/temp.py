@@ -1,19 +1,97 @@
-import asyncio
-from typing import List
+import posixpath
+import re
+
+from typing import Dict, Iterable, List, Optional
 from async_adbc.plugin import Plugin
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from async_lru import alru_cache
 
 
 # XXX: 如果兼容性实在不行考虑去借鉴solopi
 # https://github.com/alipay/SoloPi/blob/ac684afdb1eb654dc27a2710e3c1e5ac25a9c43d/src/shared/src/main/java/com/alipay/hulu/shared/display/items/TemperatureTools.java#L33
 
+# 每次开机都会重新生成，用来判断设备有没有重启过
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
+
 
 class TempStat(BaseModel):
     cpu: float
     gpu: float
     npu: float
     battery: float
+    zones: Dict[str, float] = Field(default_factory=dict)  # 所有温度传感器，参考 `TempPlugin.temps`
+
+
+class ThermalZone(BaseModel):
+    index: int  # thermal_zone<index>
+    type: str  # 传感器类型，也就是 type 文件的内容
+    name: str  # 类型有重复时带上 `:thermal_zone<index>` 区分，作为 `temps` 返回的key
+    path: str  # temp 文件路径
+
+
+class ThermalIndex(BaseModel):
+    """
+    设备的温度传感器表，开机期间不会变化
+    """
+
+    boot_id: str
+    zones: List[ThermalZone] = Field(default_factory=list)
+
+    def find(self, marks: List[str]) -> Optional[ThermalZone]:
+        """
+        按标记的优先级找到第一个类型包含标记的传感器
+
+        Args:
+            marks (List[str]): 标记列表，越靠前优先级越高
+
+        Returns:
+            Optional[ThermalZone]: 找不到时为None
+        """
+        for mark in marks:
+            for zone in self.zones:
+                if mark in zone.type:
+                    return zone
+        return None
+
+
+_THERMAL_TYPE_PATTERN = re.compile(r"^(.*/thermal_zone(\d+))/type:(.*?)\r?$", re.M)
+
+
+def parse_thermal_index(text: str) -> ThermalIndex:
+    """
+    解析 `TempPlugin.INDEX_CMD` 的输出
+
+    第一行是boot_id，后面是 `grep -H` 的 `路径:类型` ，路径和类型在同一行，
+    某个传感器读不出来的时候不会错位。
+
+    Args:
+        text (str): 命令输出
+
+    Returns:
+        ThermalIndex: 传感器表，按thermal_zone序号排序
+    """
+    boot_id, _, rest = text.partition("\n")
+    found = sorted(
+        (int(index), zone_dir, zone_type.strip())
+        for zone_dir, index, zone_type in _THERMAL_TYPE_PATTERN.findall(rest)
+    )
+
+    counts: Dict[str, int] = {}
+    for _, _, zone_type in found:
+        counts[zone_type] = counts.get(zone_type, 0) + 1
+
+    zones = [
+        ThermalZone(
+            index=index,
+            type=zone_type,
+            name=zone_type
+            if counts[zone_type] == 1
+            else f"{zone_type}:thermal_zone{index}",
+            path=posixpath.join(zone_dir, "temp"),
+        )
+        for index, zone_dir, zone_type in found
+    ]
+    return ThermalIndex(boot_id=boot_id.strip(), zones=zones)
 
 
 class TempPlugin(Plugin):
@@ -31,10 +109,8 @@ class TempPlugin(Plugin):
     NPU_MARKS = ["npu-usr", "npu"]
     GPU_MARKS = ["gpuss-0-us", "gpu"]
 
-    SENSOR_LIST_CMD = "cat /sys/devices/virtual/thermal/thermal_zone*/type"
-    SENSOR_FILE_LIST_CMD = "cd /sys/devices/virtual/thermal/ && ls|grep thermal_zone"
-    SENSOR_TEMP_LIST_CMD = "cat /sys/devices/virtual/thermal/thermal_zone*/temp"
-    TEMP_CMD = "/sys/devices/virtual/thermal/{filename}/temp"
+    THERMAL_DIR = "/sys/devices/virtual/thermal"
+    INDEX_CMD = "cat {boot_id};grep -H '' {thermal_dir}/thermal_zone*/type 2>/dev/null"
 
     # 回滚保底温度记录文件
     PLAY_BACK_TEMP_FILE_LIST = [
@@ -54,75 +130,142 @@ class TempPlugin(Plugin):
         "/sys/devices/platform/s5p-tmu/curr_temp",
     ]
 
-    def __init__(self, device) -> None:
-        super().__init__(device)
-        self._thermal_map = None
-        self._playback_cpu_temp_file = None
-
     @alru_cache
-    async def _get_thermal_map(self):
-        sensor_list = await self._device.shell(self.SENSOR_LIST_CMD)
-        sensor_list = sensor_list.splitlines()
+    async def thermal_index(self) -> ThermalIndex:
+        """
+        获取温度传感器表，一次shell读取所有传感器的类型
 
-        sensor_file_list = await self._device.shell(self.SENSOR_FILE_LIST_CMD)
-        sensor_file_list = sensor_file_list.splitlines()
+        传感器表做了缓存，每次读温度的时候会顺带读boot_id，发现设备重启过就重新获取
 
-        file_type_map = [
-            (self.TEMP_CMD.format(filename=sensor_file_list[i]), v)
-            for i, v in enumerate(sensor_list)
-        ]
-        return file_type_map
+        Returns:
+            ThermalIndex: 传感器表
+        """
+        output = await self._device.shell(
+            self.INDEX_CMD.format(boot_id=BOOT_ID_FILE, thermal_dir=self.THERMAL_DIR)
+        )
+        return parse_thermal_index(output)
 
-    async def _get_temp_file(self, marks: List[str]):
-        _thermal_map = await self._get_thermal_map()
+    def invalidate(self):
+        """
+        丢弃缓存的传感器表和保底温度文件
+        """
+        self.thermal_index.cache_invalidate()
+        self._get_playback_cpu_temp_file.cache_invalidate()
 
-        for mark in marks:
-            for thermal in _thermal_map:
-                if mark in thermal[1]:
-                    return thermal[0]
+    @alru_cache
+    async def _get_playback_cpu_temp_file(self) -> Optional[str]:
+        """保底的CPU温度方案，当传感器都读不到温度的时候默认用Solopi同款 CPU温度
 
-        return await self._get_playback_cpu_temp_file()
+        找不到时返回None，alru_cache不缓存异常，返回None才能避免每次都重新探测
+        """
 
-    @alru_cache
-    async def _get_playback_cpu_temp_file(self):
-        """保底的CPU温度方案，当传感器都读不到温度的时候默认用Solopi同款 CPU温度"""
-
-        for temp_file in self.PLAY_BACK_TEMP_FILE_LIST:
-            res = await self._device.shell("cat", temp_file)
-            res = res.strip()
-            if res.isdigit():
-                int(res)
+        results = await self._device.shell_batch(
+            [f"cat {temp_file}" for temp_file in self.PLAY_BACK_TEMP_FILE_LIST]
+        )
+        for temp_file, res in zip(self.PLAY_BACK_TEMP_FILE_LIST, results):
+            if res.output.isdigit():
                 _playback_cpu_temp_file = temp_file
                 return _playback_cpu_temp_file
-        raise FileNotFoundError("没有合适的温度文件读取")
+        return None
 
-    async def _get_temp(self, marks: List[str]):
-        try:
-            temp_file = await self._get_temp_file(marks)
-            content = await self._device.shell("cat", temp_file)
-            return self._str_to_temp(content)
-        except FileNotFoundError:
-            return 0
+    async def _read_temps(
+        self, zones: List[ThermalZone], extra_paths: List[str], boot_id: str
+    ) -> Optional[Dict[str, float]]:
+        """
+        一次读取boot_id和所有温度文件
 
-    def _is_temp_valid(self, value):
-        return -30 <= value <= 250
+        Returns:
+            Optional[Dict[str, float]]: 路径 -> 温度，读取失败的文件不在里面，设备重启过时为None
+        """
+        paths = [zone.path for zone in zones] + extra_paths
+        results = await self._device.read_files([BOOT_ID_FILE] + paths)
 
-    async def stat(self):
-        cpu_temp = self._get_temp(self.CPU_MARKS)
-        gpu_temp = self._get_temp(self.GPU_MARKS)
-        npu_temp = self._get_temp(self.NPU_MARKS)
-        battery_temp = self._get_temp(self.BATTERY_MARKS)
+        if results[0].output.strip() != boot_id:
+            self.invalidate()
+            return None
 
-        cpu_temp, gpu_temp, npu_temp, battery_temp = await asyncio.gather(
-            cpu_temp, gpu_temp, npu_temp, battery_temp
-        )
+        return {
+            path: self._str_to_temp(result.output)
+            for path, result in zip(paths, results[1:])
+            if result.ok and result.output
+        }
 
-        return TempStat(
-            cpu=cpu_temp,
-            gpu=gpu_temp,
-            npu=npu_temp,
-            battery=battery_temp,
-        )
+    async def temps(self, zone_names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """
+        一次shell往返读取多个温度传感器
+
+        Args:
+            zone_names (Optional[Iterable[str]], optional): 传感器名，参考 `ThermalZone.name` ，默认全部. Defaults to None.
+
+        Returns:
+            Dict[str, float]: 传感器名 -> 摄氏度，读不出来的传感器（比如被关掉的）不在里面
+        """
+        selected = set(zone_names) if zone_names is not None else None
+        for _ in range(2):
+            index = await self.thermal_index()
+            zones = [
+                zone
+                for zone in index.zones
+                if selected is None or zone.name in selected
+            ]
+            temps = await self._read_temps(zones, [], index.boot_id)
+            if temps is not None:
+                return {zone.name: temps[zone.path] for zone in zones if zone.path in temps}
+        return {}
+
+    async def stat(self) -> TempStat:
+        """
+        获取cpu、gpu、npu、电池温度和所有温度传感器，只需要一次shell往返
+
+        Returns:
+            TempStat: 温度，单位摄氏度，找不到传感器的分类为0
+        """
+        for _ in range(2):
+            index = await self.thermal_index()
+
+            category_paths: List[Optional[str]] = []
+            for marks in (
+                self.CPU_MARKS,
+                self.GPU_MARKS,
+                self.NPU_MARKS,
+                self.BATTERY_MARKS,
+            ):
+                zone = index.find(marks)
+                if zone is not None:
+                    category_paths.append(zone.path)
+                    continue
+                category_paths.append(await self._get_playback_cpu_temp_file())
+
+            zone_paths = {zone.path for zone in index.zones}
+            extra_paths = [
+                path
+                for path in category_paths
+                if path is not None and path not in zone_paths
+            ]
+            temps = await self._read_temps(index.zones, extra_paths, index.boot_id)
+            if temps is None:
+                # 设备重启过，传感器表已经重新获取
+                continue
+
+            cpu_temp, gpu_temp, npu_temp, battery_temp = (
+                temps.get(path, 0) if path else 0 for path in category_paths
+            )
+            return TempStat(
+                cpu=cpu_temp,
+                gpu=gpu_temp,
+                npu=npu_temp,
+                battery=battery_temp,
+                zones={
+                    zone.name: temps[zone.path]
+                    for zone in index.zones
+                    if zone.path in temps
+                },
+            )
+
+        return TempStat(cpu=0, gpu=0, npu=0, battery=0)
+
+    def _is_temp_valid(self, value):
+        return -30 <= value <= 250
 
     def _str_to_temp(self, txt: str):
         """字符串数值转摄氏度
@@ -1,12 +1,41 @@
+"""
+流量统计
+
+`/proc/net/dev` 是整个网络命名空间的流量，所有应用都在同一个命名空间里，
+所以应用流量要按UID统计：
+
+1. 内核有 xt_qtaguid 模块（Android 9及以前）时读 `/proc/net/xt_qtaguid/stats` ，
+   所有UID、所有网卡的累计流量一次读完
+2. 没有的话（Android 10以后改成了eBPF）用 `dumpsys netstats --uid` ，先 `--poll` 让系统把
+   eBPF里的计数刷到历史记录里
+
+包名到UID的映射用 `pm list packages -U` 一次取完并缓存，同一次读取可以算出任意多个应用的流量。
+"""
+import enum
+import re
 import typing
+
+from async_lru import alru_cache
 from async_adbc.plugin import Plugin
-from typing import Optional, overload
+from typing import Dict, Optional, overload
 from pydantic import BaseModel
 
 if typing.TYPE_CHECKING:
     from async_adbc.device import Device
 
 
+QTAGUID_STATS = "/proc/net/xt_qtaguid/stats"
+NETSTATS_CMD = "dumpsys netstats --poll >/dev/null;dumpsys netstats --uid"
+
+# 回环网卡的流量不出设备，不计入全局流量
+LOOPBACK = "lo"
+
+
+class TrafficBackend(enum.Enum):
+    QTAGUID = "qtaguid"  # /proc/net/xt_qtaguid/stats
+    NETSTATS = "netstats"  # dumpsys netstats --uid
+
+
 class TrafficStat(BaseModel):
     """
     流量统计，单位byte
@@ -28,12 +57,277 @@ class TrafficStat(BaseModel):
         return TrafficStat(receive=receive, send=send)
 
 
-class TrafficPlugin(Plugin):
-    WAN0 = "wlan0:"
+# 网卡名 -> 累计流量
+InterfaceTraffic = Dict[str, TrafficStat]
+
+
+def parse_net_dev_interfaces(text: str) -> InterfaceTraffic:
+    """
+    解析 /proc/net/dev 里所有网卡的累计流量
+
+    Args:
+        text (str): /proc/net/dev 的内容
+
+    Returns:
+        InterfaceTraffic: 网卡名（不带冒号）到累计流量
+    """
+    table: InterfaceTraffic = {}
+    for line in text.splitlines()[2:]:
+        # 老内核上网卡名和数字之间可能没有空格，比如 `eth0:12345`
+        name, _, data = line.partition(":")
+        row = data.split()
+        if len(row) < 9:
+            continue
+        table[name.strip()] = TrafficStat(receive=int(row[0]), send=int(row[8]))
+    return table
+
+
+def parse_net_dev(text: str, interface: Optional[str] = None) -> TrafficStat:
+    """
+    解析 /proc/net/dev 里某个网卡的累计流量
+
+    Args:
+        text (str): /proc/net/dev 的内容
+        interface (Optional[str], optional): 网卡名，比如 `wlan0` ，不传就是除了回环网卡以外所有网卡的总和. Defaults to None.
+
+    Returns:
+        TrafficStat: 累计流量，网卡不存在时为0
+    """
+    if interface is not None:
+        table = parse_net_dev_interfaces(text)
+        return table.get(interface.rstrip(":"), TrafficStat(receive=0, send=0))
+    return sum_traffic(parse_wan_interfaces(text).values())
+
+
+def parse_wan_interfaces(text: str) -> InterfaceTraffic:
+    """
+    解析 /proc/net/dev 里除了回环网卡以外的所有网卡
 
+    Args:
+        text (str): /proc/net/dev 的内容
+
+    Returns:
+        InterfaceTraffic: 网卡名到累计流量
+    """
+    return {
+        name: stat
+        for name, stat in parse_net_dev_interfaces(text).items()
+        if name != LOOPBACK
+    }
+
+
+def sum_traffic(stats: typing.Iterable[TrafficStat]) -> TrafficStat:
+    total = TrafficStat(receive=0, send=0)
+    for stat in stats:
+        total = total + stat
+    return total
+
+
+def traffic_delta(
+    current: InterfaceTraffic,
+    last: Optional[InterfaceTraffic],
+    reset_as_new: bool = True,
+) -> TrafficStat:
+    """
+    按网卡分别相减再求和
+
+    网卡名是按网卡保存状态的原因：网卡断开重连、新网卡出现时计数会清零或者从0开始，
+    直接用总和相减会得到负数。
+
+    netstats的累计流量是还保留着的时间桶之和，最早的桶过期后总和会变小，这不是计数清零，
+    这时传reset_as_new=False，变小的部分按0算。
+
+    Args:
+        current (InterfaceTraffic): 本次的累计流量
+        last (Optional[InterfaceTraffic]): 上次的累计流量，None表示第一次采样
+        reset_as_new (bool, optional): 计数变小时当成清零，把当前值全部算作新流量. Defaults to True.
+
+    Returns:
+        TrafficStat: 两次之间的流量，第一次采样为0
+    """
+    total = TrafficStat(receive=0, send=0)
+    if last is None:
+        return total
+
+    for name, stat in current.items():
+        prev = last.get(name)
+        if prev is None:
+            total = total + stat
+        elif reset_as_new and (stat.receive < prev.receive or stat.send < prev.send):
+            # 计数被清零，从0开始算
+            total = total + stat
+        else:
+            total = total + TrafficStat(
+                receive=max(stat.receive - prev.receive, 0),
+                send=max(stat.send - prev.send, 0),
+            )
+    return total
+
+
+def parse_qtaguid_stats(text: str) -> Dict[int, InterfaceTraffic]:
+    """
+    解析 /proc/net/xt_qtaguid/stats
+
+    只统计 tag 为 0x0 的行，带tag的行是应用自己打标签的子集，加上会重复计算。
+    前台、后台（cnt_set）两行合并。
+
+    Args:
+        text (str): 文件内容
+
+    Returns:
+        Dict[int, InterfaceTraffic]: uid -> 网卡 -> 累计流量
+    """
+    uids: Dict[int, InterfaceTraffic] = {}
+    # idx iface acct_tag_hex uid_tag_int cnt_set rx_bytes rx_packets tx_bytes ...
+    for line in text.splitlines()[1:]:
+        row = line.split()
+        if len(row) < 8 or row[2] != "0x0":
+            continue
+        stat = TrafficStat(receive=int(row[5]), send=int(row[7]))
+        interfaces = uids.setdefault(int(row[3]), {})
+        last = interfaces.get(row[1])
+        interfaces[row[1]] = stat if last is None else last + stat
+    return uids
+
+
+_NETSTATS_IDENT_PATTERN = re.compile(
+    r"ident=\[\{type=(\w+).*\buid=(-?\d+) set=\S+ tag=(0x[0-9a-f]+)"
+)
+_NETSTATS_BUCKET_PATTERN = re.compile(r"\brb=(\d+) rp=\d+ tb=(\d+)")
+
+
+def parse_netstats_uid(text: str) -> Dict[int, InterfaceTraffic]:
+    """
+    解析 `dumpsys netstats --uid` 的 `UID stats:` 部分
+
+    netstats没有网卡名，用网络类型（WIFI、MOBILE）代替，每个ident下所有时间桶的和就是累计流量。
+
+    Args:
+        text (str): 命令输出
+
+    Returns:
+        Dict[int, InterfaceTraffic]: uid -> 网络类型 -> 累计流量
+    """
+    _, _, section = text.partition("UID stats:")
+    section, _, _ = section.partition("UID tag stats:")
+
+    uids: Dict[int, InterfaceTraffic] = {}
+    key = None
+    for line in section.splitlines():
+        ident = _NETSTATS_IDENT_PATTERN.search(line)
+        if ident:
+            network, uid, tag = ident.groups()
+            key = (int(uid), network) if tag == "0x0" else None
+            continue
+
+        bucket = _NETSTATS_BUCKET_PATTERN.search(line)
+        if bucket and key is not None:
+            stat = TrafficStat(receive=int(bucket[1]), send=int(bucket[2]))
+            interfaces = uids.setdefault(key[0], {})
+            last = interfaces.get(key[1])
+            interfaces[key[1]] = stat if last is None else last + stat
+    return uids
+
+
+class TrafficPlugin(Plugin):
     def __init__(self, device: "Device") -> None:
         super().__init__(device)
-        self._last_stat: Optional[TrafficStat] = None
+        self._backend: Optional[TrafficBackend] = None
+        self._last_dev: Optional[InterfaceTraffic] = None
+        # 包名 -> 上次的每个网卡的累计流量
+        self._last_packages: Dict[str, InterfaceTraffic] = {}
+
+    @alru_cache
+    async def package_uids(self) -> Dict[str, int]:
+        """
+        获取所有包名到UID的映射
+
+        安装的应用不会经常变化，做了缓存，缓存里找不到的包由 `get_uid` 补上
+
+        Returns:
+            Dict[str, int]: 包名 -> UID
+        """
+        result = await self._device.shell("pm list packages -U 2>/dev/null")
+        return {
+            package: int(uid)
+            for package, uid in re.findall(r"^package:(\S+) uid:(\d+)", result, re.M)
+        }
+
+    async def get_uid(self, package_name: str) -> int:
+        """
+        获取应用的UID
+
+        Args:
+            package_name (str): 包名
+
+        Raises:
+            ValueError: 应用没有安装
+
+        Returns:
+            int: UID
+        """
+        uids = await self.package_uids()
+        if package_name in uids:
+            return uids[package_name]
+
+        # 缓存之后新安装的应用，或者不支持 `pm list packages -U` 的老系统
+        result = await self._device.shell(f"dumpsys package {package_name}")
+        match = re.search(r"userId=(\d+)", result)
+        if match is None:
+            raise ValueError(f"{package_name} 应用没有安装")
+
+        uids[package_name] = int(match[1])
+        return uids[package_name]
+
+    async def uid_stats(self) -> Dict[int, InterfaceTraffic]:
+        """
+        一次读取所有UID在每个网卡上的累计流量
+
+        第一次调用时探测可用的数据源，之后固定使用同一个，参考 `TrafficBackend`
+
+        Returns:
+            Dict[int, InterfaceTraffic]: uid -> 网卡 -> 累计流量
+        """
+        if self._backend in (None, TrafficBackend.QTAGUID):
+            result = await self._device.read_file(QTAGUID_STATS)
+            if result.ok and result.output:
+                self._backend = TrafficBackend.QTAGUID
+                return parse_qtaguid_stats(result.output)
+
+        self._backend = TrafficBackend.NETSTATS
+        output = await self._device.shell(NETSTATS_CMD)
+        return parse_netstats_uid(output)
+
+    async def stats(self, *package_names: str) -> Dict[str, TrafficStat]:
+        """
+        获取多个应用与上一次调用之间的流量，所有应用共用一次读取
+
+        每个应用单独保存上一次的累计流量，第一次获取某个应用时为0。
+        共享UID的应用（比如 `android.uid.system` ）流量是整个UID的。
+
+        单位 byte
+
+        Args:
+            package_names (str): 包名
+
+        Raises:
+            ValueError: 应用没有安装
+
+        Returns:
+            Dict[str, TrafficStat]: 包名 -> 流量
+        """
+        uids = {package: await self.get_uid(package) for package in package_names}
+        table = await self.uid_stats()
+        reset_as_new = self._backend != TrafficBackend.NETSTATS
+
+        stats = {}
+        for package, uid in uids.items():
+            current = table.get(uid, {})
+            stats[package] = traffic_delta(
+                current, self._last_packages.get(package), reset_as_new
+            )
+            self._last_packages[package] = current
+        return stats
 
     @overload
     async def stat(self) -> TrafficStat:
@@ -44,39 +338,26 @@ class TrafficPlugin(Plugin):
         ...
 
     async def stat(self, package_name: Optional[str] = None) -> TrafficStat:
-        """获取流量
+        """获取与上一次调用之间的流量
 
-        默认获取全局流量
+        默认获取全局流量，也就是除了回环网卡以外所有网卡的总和，传包名时按应用的UID统计，参考 `stats`
 
         单位 byte
 
         Args:
             package_name (Optional[str], optional): 不传就获取全局流量. Defaults to None.
 
+        Raises:
+            ValueError: 应用没有安装
+
         Returns:
-            TrafficStat: 流量统计
+            TrafficStat: 流量统计，第一次调用为0
         """
+        if package_name:
+            return (await self.stats(package_name))[package_name]
 
-        try:
-            if package_name:
-                pid = await self._device.get_pid_by_pkgname(package_name)
-                result = await self._device.shell(f"cat /proc/{pid}/net/dev")
-            else:
-                result = await self._device.shell("cat /proc/net/dev")
-        except Exception:
-            result = await self._device.shell("cat /proc/net/dev")
-
-        lines = map(lambda line: line.split(), result.splitlines()[2:])
-        table = {line[0]: line[1:] for line in lines}
-
-        wlan0 = table[self.WAN0]
-        receive = int(wlan0[0])
-        send = int(wlan0[8])
-        new_stat = TrafficStat(receive=receive, send=send)
-
-        if self._last_stat is None:
-            self._last_stat = new_stat
-
-        diff = new_stat - self._last_stat
-        self._last_stat = new_stat
+        result = await self._device.read_file("/proc/net/dev")
+        current = parse_wan_interfaces(result.output)
+        diff = traffic_delta(current, self._last_dev)
+        self._last_dev = current
         return diff
@@ -1,5 +1,280 @@
-from typing import Optional
+import asyncio
+import io
+import struct
+import zlib
+
+from typing import List, Optional
+from async_lru import alru_cache
+from pydantic import BaseModel
 from async_adbc.plugin import Plugin
+from async_adbc.protocol import ConnectionClosedError, ProtocolError, read_exactly
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow是可选依赖，没有的时候只能编码32位像素的PNG
+    Image = None  # type: ignore
+
+
+# framebuffer: 服务的头部，第一个uint32是版本号，决定后面有几个字段
+FB_VERSION = struct.Struct("<I")
+FB_HEADER_V1 = struct.Struct("<12I")  # bpp, size, width, height, 4组颜色的offset/length
+FB_HEADER_V2 = struct.Struct("<13I")  # 比v1在bpp后面多一个color_space
+FB_HEADER_LEGACY = struct.Struct("<3I")  # 版本号为16，RGB565，只有size, width, height
+FB_LEGACY_VERSION = 16
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class FramebufferHeader(BaseModel):
+    version: int
+    bpp: int
+    color_space: int = 0
+    size: int
+    width: int
+    height: int
+    red_offset: int
+    red_length: int
+    blue_offset: int
+    blue_length: int
+    green_offset: int
+    green_length: int
+    alpha_offset: int
+    alpha_length: int
+
+    @property
+    def mode(self) -> str:
+        """
+        像素格式，Pillow的raw mode命名，比如 `RGBA` 、 `BGRA` 、 `RGB;16`
+        """
+        if self.bpp == 16:
+            return "BGR;16" if self.blue_offset else "RGB;16"
+
+        channels = sorted(
+            [
+                (self.red_offset, "R"),
+                (self.green_offset, "G"),
+                (self.blue_offset, "B"),
+                (self.alpha_offset, "A" if self.alpha_length else "X"),
+            ][: self.bpp // 8]
+        )
+        return "".join(name for _, name in channels)
+
+
+def parse_framebuffer_header(version: int, data: bytes) -> FramebufferHeader:
+    """
+    解析framebuffer头部
+
+    Args:
+        version (int): 版本号
+        data (bytes): 版本号之后的头部数据
+
+    Returns:
+        FramebufferHeader: 头部
+    """
+    if version == FB_LEGACY_VERSION:
+        size, width, height = FB_HEADER_LEGACY.unpack(data)
+        return FramebufferHeader(
+            version=version,
+            bpp=16,
+            size=size,
+            width=width,
+            height=height,
+            red_offset=11,
+            red_length=5,
+            blue_offset=0,
+            blue_length=5,
+            green_offset=5,
+            green_length=6,
+            alpha_offset=0,
+            alpha_length=0,
+        )
+
+    if version == 2:
+        bpp, color_space, *fields = FB_HEADER_V2.unpack(data)
+    else:
+        bpp, *fields = FB_HEADER_V1.unpack(data)
+        color_space = 0
+
+    names = [
+        "size",
+        "width",
+        "height",
+        "red_offset",
+        "red_length",
+        "blue_offset",
+        "blue_length",
+        "green_offset",
+        "green_length",
+        "alpha_offset",
+        "alpha_length",
+    ]
+    values = dict(zip(names, fields))
+    # offset是位偏移，换算成字节序号方便排列通道
+    for name in ("red_offset", "blue_offset", "green_offset", "alpha_offset"):
+        values[name] //= 8
+    return FramebufferHeader(version=version, bpp=bpp, color_space=color_space, **values)
+
+
+def _header_struct(version: int) -> struct.Struct:
+    if version == FB_LEGACY_VERSION:
+        return FB_HEADER_LEGACY
+    if version == 2:
+        return FB_HEADER_V2
+    if version == 1:
+        return FB_HEADER_V1
+    raise ProtocolError(f"不支持的framebuffer版本 {version}")
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + tag
+        + data
+        + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    )
+
+
+def encode_png(rgba: memoryview, width: int, height: int, level: int = 6) -> bytes:
+    """
+    把RGBA像素编码成PNG，纯python实现，不依赖Pillow
+
+    Args:
+        rgba (memoryview): RGBA像素，每个像素4字节
+        width (int): 宽
+        height (int): 高
+        level (int, optional): zlib压缩等级. Defaults to 6.
+
+    Returns:
+        bytes: PNG数据
+    """
+    stride = width * 4
+    compressor = zlib.compressobj(level)
+    chunks: List[bytes] = []
+    for offset in range(0, stride * height, stride):
+        # 每行前面一个字节的过滤类型，0表示不过滤
+        chunks.append(compressor.compress(b"\x00"))
+        chunks.append(compressor.compress(rgba[offset : offset + stride]))
+    chunks.append(compressor.flush())
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (
+        PNG_SIGNATURE
+        + _png_chunk(b"IHDR", ihdr)
+        + _png_chunk(b"IDAT", b"".join(chunks))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+class Framebuffer:
+    """
+    一帧原始像素
+
+    像素数据直接读进 `buffer` ，不做编码和格式转换，需要图片的时候再用 `encode` 在线程池里编码。
+
+    Args:
+        header (FramebufferHeader): 头部
+        buffer (bytearray): 像素数据，长度可能比 `header.size` 大（复用的缓冲区）
+    """
+
+    def __init__(self, header: FramebufferHeader, buffer: bytearray) -> None:
+        self.header = header
+        self.buffer = buffer
+
+    @property
+    def width(self) -> int:
+        return self.header.width
+
+    @property
+    def height(self) -> int:
+        return self.header.height
+
+    @property
+    def mode(self) -> str:
+        return self.header.mode
+
+    @property
+    def pixels(self) -> memoryview:
+        """
+        原始像素，不复制，格式参考 `mode`
+
+        buffer被传回 `UtilsPlugin.framebuffer` 复用后内容会被下一帧覆盖，需要保留时先复制
+        """
+        return memoryview(self.buffer)[: self.header.size]
+
+    def to_rgba(self) -> memoryview:
+        """
+        转成RGBA像素，本来就是RGBA时不复制
+
+        Raises:
+            RuntimeError: 不是32位像素，转换需要安装Pillow
+
+        Returns:
+            memoryview: RGBA像素
+        """
+        mode = self.mode
+        if mode == "RGBA":
+            return self.pixels
+        if len(mode) != 4:
+            raise RuntimeError(f"不支持转换 {mode} 格式，需要安装Pillow")
+
+        src = self.pixels
+        rgba = bytearray(len(src))
+        # 按通道整列切片复制，不逐像素循环
+        for index, channel in enumerate("RGBA"):
+            if channel in mode:
+                rgba[index::4] = src[mode.index(channel) :: 4]
+            else:
+                rgba[index::4] = b"\xff" * (len(src) // 4)
+        return memoryview(rgba)
+
+    def _encode(self, format: str, quality: int) -> bytes:
+        if format == "png" and Image is None:
+            return encode_png(self.to_rgba(), self.width, self.height)
+
+        if Image is None:
+            raise RuntimeError(f"编码 {format} 需要安装Pillow")
+
+        image = Image.frombuffer(
+            "RGBA" if len(self.mode) == 4 else "RGB",
+            (self.width, self.height),
+            self.pixels,
+            "raw",
+            self.mode,
+            0,
+            1,
+        )
+        if format == "jpeg":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format=format, quality=quality)
+        return output.getvalue()
+
+    async def encode(self, format: str = "png", quality: int = 90) -> bytes:
+        """
+        在线程池里编码成图片
+
+        Args:
+            format (str, optional): `png` 或者 `jpeg` ，jpeg需要安装Pillow. Defaults to "png".
+            quality (int, optional): jpeg质量. Defaults to 90.
+
+        Returns:
+            bytes: 图片数据
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._encode, format.lower(), quality)
+
+    async def save(self, filename: str, format: str = "png", quality: int = 90):
+        """
+        编码并保存到本地
+
+        Args:
+            filename (str): 文件名
+            format (str, optional): 参考 `encode`. Defaults to "png".
+            quality (int, optional): 参考 `encode`. Defaults to 90.
+        """
+        data = await self.encode(format, quality)
+        with open(filename, "wb") as f:
+            f.write(data)
 
 
 class UtilsPlugin(Plugin):
@@ -8,8 +283,20 @@ class UtilsPlugin(Plugin):
 
     """
 
+    @alru_cache
+    async def needs_crlf_fix(self) -> bool:
+        """
+        legacy shell是否会把输出里的 `\\n` 转成 `\\r\\n`
+
+        老设备（Android 7以前）的legacy shell走pty，二进制输出会被破坏，结果做了缓存
+
+        Returns:
+            bool: 需要把 `\\r\\n` 还原成 `\\n`
+        """
+        return (await self._device.shell_raw("echo")).endswith(b"\r\n")
+
     async def screencap(self, save_file: Optional[str] = None) -> bytes:
-        """原生截屏，效率很慢，建议用minicap代替
+        """原生截屏，效率很慢，建议用minicap或者 `framebuffer` 代替
 
         Args:
             save_file (str | None, optional): 保存文件，png格式，为空就不保存. Defaults to None.
@@ -18,7 +305,7 @@ class UtilsPlugin(Plugin):
             bytes: 返回二进制数据
         """
         result = await self._device.shell_raw("/system/bin/screencap -p")
-        if result and len(result) > 5 and result[5] == 0x0D:
+        if await self.needs_crlf_fix():
             result = result.replace(b"\r\n", b"\n")
 
         if save_file:
@@ -26,3 +313,46 @@ class UtilsPlugin(Plugin):
                 f.write(result)
 
         return result
+
+    async def framebuffer(self, buffer: Optional[bytearray] = None) -> Framebuffer:
+        """
+        通过adbd的 `framebuffer:` 服务获取原始像素，设备端不做PNG编码
+
+        连续截图时把上一帧的 `buffer` 传回来复用，不用每帧重新分配内存：
+
+            frame = await device.utils.framebuffer()
+            frame = await device.utils.framebuffer(frame.buffer)
+
+        buffer不够大时分配新的缓冲区，不在原来的上面扩容：调用者可能还持有上一帧的 `pixels` ，
+        有memoryview引用的bytearray不能改变大小。
+
+        Args:
+            buffer (Optional[bytearray], optional): 复用的缓冲区，不够大时不使用. Defaults to None.
+
+        Returns:
+            Framebuffer: 原始帧
+        """
+        res = await self._device.request("framebuffer", "")
+        with res:
+            reader = res.reader
+            (version,) = FB_VERSION.unpack(await read_exactly(reader, FB_VERSION.size))
+            header_struct = _header_struct(version)
+            header = parse_framebuffer_header(
+                version, await read_exactly(reader, header_struct.size)
+            )
+
+            if buffer is None or len(buffer) < header.size:
+                buffer = bytearray(header.size)
+
+            with memoryview(buffer) as view:
+                offset = 0
+                while offset < header.size:
+                    chunk = await reader.read(header.size - offset)
+                    if not chunk:
+                        raise ConnectionClosedError(
+                            f"连接已关闭，期望读取{header.size}字节，只收到{offset}字节"
+                        )
+                    view[offset : offset + len(chunk)] = chunk
+                    offset += len(chunk)
+
+        return Framebuffer(header, buffer)
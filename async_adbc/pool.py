@@ -0,0 +1,230 @@
+"""
+连接池
+
+每次 `Device.shell` 都要新建一条到adb server的TCP连接，再发一次 `host:transport:<serialno>`
+切换到转发模式。adb的LOCAL SERVICE连接是一次性的，shell流结束后adbd就会关闭它，
+所以连接池不回收用过的连接，而是提前建好处于转发模式的连接放在池里，取用的时候直接拿来发请求，
+取走一条就在后台补一条。池里有空闲连接时会在最早的一条超时的时候自动清理。
+"""
+import asyncio
+import time
+
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+from pydantic import BaseModel
+
+from async_adbc.protocol import Connection
+
+ConnectionFactory = Callable[[], Awaitable[Connection]]
+
+
+class PoolStats(BaseModel):
+    """
+    连接池统计
+    """
+
+    hits: int = 0  # 直接从池里拿到预热连接的次数
+    misses: int = 0  # 池里没有可用连接，现建连接的次数
+    created: int = 0  # 预热创建的连接数
+    discarded: int = 0  # 因为超时或者健康检查不通过被丢弃的连接数
+    errors: int = 0  # 预热失败次数
+    idle: int = 0  # 当前池里的空闲连接数
+
+
+class ConnectionPool:
+    """
+    按设备序列号分池的转发模式连接池
+
+    serialno为None的池存放的是还没发过任何请求的adb server连接，用于HOST SERVICES。
+
+    Args:
+        connect (ConnectionFactory): 创建到adb server连接的方法
+        max_size (int, optional): 每个池最多保留的空闲连接数. Defaults to 4.
+        idle_timeout (float, optional): 空闲连接存活时间，单位秒，超过就丢弃. Defaults to 30.
+        prewarm (int, optional): 每个池在被使用后保持的预热连接数，0表示不预热. Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        connect: ConnectionFactory,
+        max_size: int = 4,
+        idle_timeout: float = 30,
+        prewarm: int = 1,
+    ) -> None:
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.prewarm = min(prewarm, max_size)
+
+        self._idle: Dict[Optional[str], Deque[Tuple[Connection, float]]] = {}
+        self._pending: Dict[Optional[str], int] = {}
+        self._stats: Dict[Optional[str], PoolStats] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._prune_handle: Optional[asyncio.TimerHandle] = None
+
+    def _pool(self, serialno: Optional[str]) -> Deque[Tuple[Connection, float]]:
+        if serialno not in self._idle:
+            self._idle[serialno] = deque()
+            self._pending[serialno] = 0
+            self._stats[serialno] = PoolStats()
+        return self._idle[serialno]
+
+    async def _create(self, serialno: Optional[str]) -> Connection:
+        conn = await self._connect()
+        if serialno is not None:
+            try:
+                await conn.transport_mode(serialno)
+            except Exception:
+                conn.close()
+                raise
+        return conn
+
+    def _is_healthy(self, conn: Connection, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        return time.monotonic() - idle_since < self.idle_timeout
+
+    async def acquire(self, serialno: Optional[str] = None) -> Connection:
+        """
+        取出一条连接
+
+        取出的连接归调用者所有，用完直接关闭即可，不需要还回池里。
+
+        Args:
+            serialno (Optional[str], optional): 设备序列号，None表示取adb server连接. Defaults to None.
+
+        Returns:
+            Connection: 连接，指定serialno时已经处于转发模式
+        """
+        pool = self._pool(serialno)
+        stats = self._stats[serialno]
+
+        conn = None
+        while pool:
+            candidate, idle_since = pool.popleft()
+            if self._is_healthy(candidate, idle_since):
+                conn = candidate
+                break
+            candidate.close()
+            stats.discarded += 1
+
+        if conn is None:
+            stats.misses += 1
+            conn = await self._create(serialno)
+        else:
+            stats.hits += 1
+
+        self.warm(serialno)
+        return conn
+
+    def warm(self, serialno: Optional[str] = None, count: Optional[int] = None):
+        """
+        在后台为某个池补充预热连接
+
+        Args:
+            serialno (Optional[str], optional): 设备序列号. Defaults to None.
+            count (Optional[int], optional): 期望的空闲连接数，默认是prewarm. Defaults to None.
+        """
+        pool = self._pool(serialno)
+        target = self.prewarm if count is None else min(count, self.max_size)
+        missing = target - len(pool) - self._pending[serialno]
+
+        for _ in range(max(missing, 0)):
+            self._pending[serialno] += 1
+            task = asyncio.ensure_future(self._fill(serialno))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fill(self, serialno: Optional[str]):
+        stats = self._stats[serialno]
+        try:
+            conn = await self._create(serialno)
+        except Exception:
+            stats.errors += 1
+            return
+        finally:
+            self._pending[serialno] -= 1
+
+        pool = self._pool(serialno)
+        if len(pool) >= self.max_size:
+            conn.close()
+            stats.discarded += 1
+            return
+
+        stats.created += 1
+        pool.append((conn, time.monotonic()))
+        self._schedule_prune()
+
+    def _schedule_prune(self):
+        # 每个池里越靠前的连接越早空闲，定时器设在所有池里最早超时的那一条
+        if self._prune_handle is not None:
+            return
+
+        oldest = [pool[0][1] for pool in self._idle.values() if pool]
+        if not oldest:
+            return
+
+        delay = max(min(oldest) + self.idle_timeout - time.monotonic(), 0)
+        loop = asyncio.get_event_loop()
+        self._prune_handle = loop.call_later(delay, self._prune_later)
+
+    def _prune_later(self):
+        self._prune_handle = None
+        self.prune()
+        self._schedule_prune()
+
+    def prune(self):
+        """
+        丢弃所有超时或者已经断开的空闲连接，池里有空闲连接时会被定时调用
+        """
+        for serialno, pool in self._idle.items():
+            alive = deque()
+            for conn, idle_since in pool:
+                if self._is_healthy(conn, idle_since):
+                    alive.append((conn, idle_since))
+                else:
+                    conn.close()
+                    self._stats[serialno].discarded += 1
+            self._idle[serialno] = alive
+
+    def discard(self, serialno: Optional[str] = None):
+        """
+        关闭并丢弃某个池的所有空闲连接，比如设备断开、重启之后
+
+        Args:
+            serialno (Optional[str], optional): 设备序列号. Defaults to None.
+        """
+        pool = self._idle.get(serialno)
+        while pool:
+            conn, _ = pool.popleft()
+            conn.close()
+            self._stats[serialno].discarded += 1
+
+    def stats(self, serialno: Optional[str] = None) -> PoolStats:
+        """
+        获取某个池的统计
+
+        Args:
+            serialno (Optional[str], optional): 设备序列号. Defaults to None.
+
+        Returns:
+            PoolStats: 统计数据
+        """
+        pool = self._pool(serialno)
+        return self._stats[serialno].model_copy(update={"idle": len(pool)})
+
+    async def close(self):
+        """
+        取消所有预热任务、清理定时器，并关闭所有空闲连接
+        """
+        if self._prune_handle is not None:
+            self._prune_handle.cancel()
+            self._prune_handle = None
+
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        for serialno in list(self._idle):
+            self.discard(serialno)
@@ -0,0 +1,182 @@
+"""
+系统进程表
+
+一次shell读取所有 /proc/<pid>/stat 和 /proc/<pid>/statm ，得到类似 `top` 的全进程cpu、内存视图。
+进程表按列保存在 `array` 里，两次快照相减得到每个进程这段时间的cpu占用和RSS变化。
+"""
+import re
+import time
+
+from array import array
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+from async_adbc.plugins.cpu import parse_cpu_snapshot
+
+# 第一行是 /proc/stat 的总cpu行，然后是所有进程的stat，最后是 `grep -H` 输出的statm
+PROCESSES_CMD = (
+    "head -n 1 /proc/stat;"
+    "cat /proc/[0-9]*/stat 2>/dev/null;"
+    "grep -H '' /proc/[0-9]*/statm 2>/dev/null"
+)
+
+# stat：pid (名字) state ppid，跳过pgrp到cmajflt的9个字段就是utime、stime
+# statm：/proc/<pid>/statm:size resident ...
+_PROCESS_PATTERN = re.compile(
+    r"^(?:(\d+) \((.*)\) (\S) (-?\d+) (?:\S+ ){9}(\d+) (\d+)"
+    r"|/proc/(\d+)/statm:\d+ (\d+))",
+    re.M,
+)
+
+
+class ProcessStat(BaseModel):
+    pid: int
+    ppid: int
+    name: str  # /proc/<pid>/stat 里的名字，内核只保留前15个字符
+    state: str
+    cpu: float = 0  # 两次快照之间占总cpu时间片的百分比
+    rss: int = 0  # 单位字节
+    rss_delta: int = 0  # 与上一次快照相比的RSS变化，单位字节
+
+
+class ProcessTable:
+    """
+    一次读取的全进程表，每一列是一个 `array('q')` ，用 `index` 按pid找到行号
+
+    Args:
+        total_jiffies (int): 同一次读取的总cpu时间片
+        page_size (int): 内核页大小，参考 `Device.page_size`
+    """
+
+    def __init__(self, total_jiffies: int, page_size: int) -> None:
+        self.timestamp = time.time()
+        self.total_jiffies = total_jiffies
+        self.page_size = page_size
+        self.pids = array("q")
+        self.ppids = array("q")
+        self.jiffies = array("q")  # utime + stime
+        self.rss = array("q")  # 单位页
+        self.names: List[str] = []
+        self.states: List[str] = []
+        self.index: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.pids)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self.index
+
+    def get(self, pid: int) -> Optional[ProcessStat]:
+        """
+        按pid获取进程，cpu字段为0，需要占用率用 `diff`
+
+        Args:
+            pid (int): 进程pid
+
+        Returns:
+            Optional[ProcessStat]: 进程不存在时为None
+        """
+        row = self.index.get(pid)
+        if row is None:
+            return None
+        return self._stat(row)
+
+    def _stat(self, row: int, cpu: float = 0, rss_delta: int = 0) -> ProcessStat:
+        return ProcessStat(
+            pid=self.pids[row],
+            ppid=self.ppids[row],
+            name=self.names[row],
+            state=self.states[row],
+            cpu=cpu,
+            rss=self.rss[row] * self.page_size,
+            rss_delta=rss_delta * self.page_size,
+        )
+
+    def find(self, name: str) -> List[int]:
+        """
+        按进程名查找pid，包名超过15个字符时用包名的后15个字符匹配
+
+        Args:
+            name (str): 进程名或包名
+
+        Returns:
+            List[int]: 匹配的pid
+        """
+        name = name[-15:]
+        return [self.pids[i] for i, n in enumerate(self.names) if n == name]
+
+    def diff(self, previous: "ProcessTable", top: int = 0) -> List[ProcessStat]:
+        """
+        对比上一次快照，计算每个进程的cpu占用和RSS变化
+
+        上一次快照里没有的进程（新启动的、pid被复用的）按启动以来的cpu时间计算。
+
+        Args:
+            previous (ProcessTable): 上一次的快照
+            top (int, optional): 只返回cpu占用最高的前几个，0表示全部. Defaults to 0.
+
+        Returns:
+            List[ProcessStat]: 按cpu占用从高到低排序
+        """
+        total = self.total_jiffies - previous.total_jiffies
+        if total <= 0:
+            total = 0
+
+        rows = []
+        for row, pid in enumerate(self.pids):
+            jiffies = self.jiffies[row]
+            rss_delta = 0
+            prev = previous.index.get(pid)
+            if prev is not None and previous.names[prev] == self.names[row]:
+                jiffies -= previous.jiffies[prev]
+                rss_delta = self.rss[row] - previous.rss[prev]
+            rows.append((jiffies, row, rss_delta))
+
+        rows.sort(reverse=True)
+        if top:
+            rows = rows[:top]
+
+        return [
+            self._stat(row, round(100 * jiffies / total, 2) if total else 0, rss_delta)
+            for jiffies, row, rss_delta in rows
+        ]
+
+
+def parse_processes(text: str, page_size: int) -> ProcessTable:
+    """
+    解析 `PROCESSES_CMD` 的输出，整段文本用一个正则一次扫描
+
+    Args:
+        text (str): 命令输出
+        page_size (int): 内核页大小，参考 `Device.page_size`
+
+    Returns:
+        ProcessTable: 进程表，statm读取失败的进程rss为0
+    """
+    cpu_line, _, rest = text.partition("\n")
+    table = ProcessTable(parse_cpu_snapshot(cpu_line).total_jiffies, page_size)
+
+    rss: Dict[int, int] = {}
+    for (
+        pid,
+        name,
+        state,
+        ppid,
+        utime,
+        stime,
+        statm_pid,
+        resident,
+    ) in _PROCESS_PATTERN.findall(rest):
+        if statm_pid:
+            rss[int(statm_pid)] = int(resident)
+            continue
+
+        table.index[int(pid)] = len(table.pids)
+        table.pids.append(int(pid))
+        table.ppids.append(int(ppid))
+        table.jiffies.append(int(utime) + int(stime))
+        table.names.append(name)
+        table.states.append(state)
+
+    table.rss = array("q", [rss.get(pid, 0) for pid in table.pids])
+    return table
@@ -2,7 +2,7 @@ import asyncio
 import struct
 
 from asyncio import StreamReader, StreamWriter
-from typing import Any, AsyncGenerator, Optional, Type
+from typing import Any, AsyncGenerator, Optional, Tuple, Type
 
 # adb协议相关参考
 # ref https://github.com/kaluluosi/adbDocumentation/blob/master/README.zh-cn.md
@@ -24,21 +24,145 @@ DATA = "DATA"  # 紧接上面协议，发送文件数据块
 DONE = "DONE"  # 文件发送完毕后的通知服务器结束
 QUIT = "QUIT"  # 退出
 
+# shell v2 协议的数据包类型
+# 每个包由 1字节类型 + 4字节小端长度 + 数据 组成
+SHELL_STDIN = 0
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+SHELL_CLOSE_STDIN = 4
+SHELL_WINDOW_SIZE_CHANGE = 5
+SHELL_PACKET_HEADER = struct.Struct("<BI")
+
+
+_B_OKAY = OKAY.encode()
+_B_FAIL = FAIL.encode()
+_B_ZERO_LENGTH = b"0000"
+_B_HEX_DIGITS = b"0123456789abcdefABCDEF"
+
+MESSAGE_HEADER = struct.Struct("<4sI")
+
+
+class ADBError(RuntimeError):
+    """
+    adb协议相关异常的基类，继承RuntimeError是为了兼容以前捕获RuntimeError的代码
+    """
+
+
+class ProtocolError(ADBError):
+    """
+    收到的数据不符合协议格式，比如长度不是十六进制、未知的状态码
+    """
+
+
+class DeviceError(ADBError):
+    """
+    adb server或者设备返回了FAIL
+
+    Args:
+        reason (str): 失败原因
+    """
+
+    def __init__(self, reason: str, *args: object) -> None:
+        super().__init__(f"ERROR: {reason}", *args)
+        self.reason = reason
+
+
+class ConnectionClosedError(ADBError, ConnectionError):
+    """
+    读到一半连接被对端关闭了
+    """
+
 
 def encode_length(length: int) -> bytes:
-    return f"{length:04X}".encode("utf-8")
+    return b"%04X" % length
 
 
 def decode_length(data: bytes) -> int:
-    s_length = data.decode("utf-8")
-    return int(s_length, 16)
+    """
+    解析4字节十六进制长度，直接在bytes上解析，不需要先解码成str
+
+    `int(data, 16)` 会接受空格、正负号和下划线，所以先检查是不是正好4个十六进制数字
+
+    Raises:
+        ProtocolError: 不是合法的十六进制长度
+    """
+    if data == _B_ZERO_LENGTH:
+        return 0
+    if len(data) != 4 or data.translate(None, _B_HEX_DIGITS):
+        raise ProtocolError(f"无效的长度 {data!r}")
+    return int(data, 16)
+
+
+async def read_exactly(reader: StreamReader, n: int) -> bytes:
+    """
+    读取n个字节，连接提前关闭时抛出ConnectionClosedError
+
+    Args:
+        reader (StreamReader): 读取器
+        n (int): 字节数
+
+    Raises:
+        ConnectionClosedError: 连接已关闭
+    """
+    try:
+        return await reader.readexactly(n)
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionClosedError(
+            f"连接已关闭，期望读取{n}字节，只收到{len(e.partial)}字节"
+        ) from None
+
+
+async def read_frame(reader: StreamReader) -> Optional[bytes]:
+    """
+    读取一个 4字节十六进制长度 + 数据 的帧
+
+    Args:
+        reader (StreamReader): 读取器
+
+    Raises:
+        ConnectionClosedError: 帧读到一半连接被关闭
+        ProtocolError: 长度不合法
+
+    Returns:
+        Optional[bytes]: 帧数据，在帧边界上遇到EOF时返回None
+    """
+    try:
+        header = await reader.readexactly(HEADER_LENGTH)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionClosedError(f"帧头不完整 {e.partial!r}") from None
+
+    length = decode_length(header)
+    if length == 0:
+        return b""
+    return await read_exactly(reader, length)
 
 
 def pack(msg: str) -> bytes:
-    length = len(msg)
-    b_length = encode_length(length)
     b_data = msg.encode("utf-8")
-    return b_length + b_data
+    return encode_length(len(b_data)) + b_data
+
+
+def pack_shell_packet(packet_id: int, data: bytes = b"") -> bytes:
+    return SHELL_PACKET_HEADER.pack(packet_id, len(data)) + data
+
+
+async def read_shell_packet(reader: StreamReader) -> Tuple[int, bytes]:
+    """
+    读取一个shell v2数据包
+
+    Args:
+        reader (StreamReader): 读取器
+
+    Returns:
+        Tuple[int, bytes]: 包类型和数据
+    """
+    header = await reader.readexactly(SHELL_PACKET_HEADER.size)
+    packet_id, length = SHELL_PACKET_HEADER.unpack(header)
+    data = await reader.readexactly(length) if length else b""
+    return packet_id, data
 
 
 async def create_connection(host: str = "127.0.0.1", port: int = 5037):
@@ -87,21 +211,33 @@ class Response:
         return recv.decode()
 
     async def byte(self) -> bytes:
-        header = await self.reader.read(HEADER_LENGTH)
-        nob = int(header.decode(), 16)
-        recv = await self.reader.read(nob)
-        return recv
+        """获取一个 4字节十六进制长度 + 数据 的响应
+
+        Raises:
+            ConnectionClosedError: 连接已关闭
+            ProtocolError: 长度不合法
+
+        Returns:
+            bytes: 响应数据
+        """
+        data = await read_frame(self.reader)
+        if data is None:
+            raise ConnectionClosedError("连接已关闭，没有响应数据")
+        return data
 
     async def trace(self) -> AsyncGenerator[bytes, Any]:
         """
-        持续返回响应数据
+        持续返回响应数据，对端在帧边界上正常关闭连接时结束
+
+        Raises:
+            ConnectionClosedError: 帧读到一半连接被关闭
+            ProtocolError: 长度不合法
         """
-        try:
-            while True:
-                data = await self.byte()
-                yield data
-        except Exception:
-            pass
+        while True:
+            data = await read_frame(self.reader)
+            if data is None:
+                return
+            yield data
 
     async def trace_text(self) -> AsyncGenerator[str, Any]:
         """
@@ -152,20 +288,46 @@ class Connection:
             MSG (str): OKAY、SEND等
         """
 
-        length = len(data) if length is None else length
-        data = MSG.encode() + struct.pack("<I", length) + data
-        self.writer.write(data)
+        self.write_message(MSG, length, data)
         await self.writer.drain()
 
+    def write_message(self, MSG: str, length: Optional[int] = None, data: Any = b""):
+        """跟message一样，但是只写入缓冲区不等待drain，用于连续发送多个数据块
+
+        data可以是bytes、bytearray或者memoryview，数据不会被拼接复制
+
+        Args:
+            MSG (str): OKAY、SEND等
+        """
+        length = len(data) if length is None else length
+        self.writer.write(MESSAGE_HEADER.pack(MSG.encode(), length))
+        if data:
+            self.writer.write(data)
+
     async def _check_status(self):
-        recv = await self.reader.read(HEADER_LENGTH)
-        recv = recv.decode()
-        if recv != OKAY:
-            error = await self.reader.read(-1)
-            error = error.decode()
-            raise RuntimeError("ERROR: {} {}".format(repr(recv), error))
+        """
+        读取请求的状态码
 
-        return True
+        Raises:
+            DeviceError: 返回FAIL
+            ProtocolError: 未知的状态码
+            ConnectionClosedError: 连接已关闭
+        """
+        status = await read_exactly(self.reader, HEADER_LENGTH)
+        if status == _B_OKAY:
+            return True
+
+        if status == _B_FAIL:
+            # FAIL后面一般是 4字节十六进制长度 + 原因，个别服务直接输出原因到EOF
+            rest = await self.reader.read(-1)
+            try:
+                length = decode_length(rest[:HEADER_LENGTH])
+                reason = rest[HEADER_LENGTH : HEADER_LENGTH + length]
+            except ProtocolError:
+                reason = rest
+            raise DeviceError(reason.decode(errors="replace"))
+
+        raise ProtocolError(f"未知的状态码 {status!r}")
 
     async def transport_mode(self, serialno: str):
         """
@@ -176,6 +338,13 @@ class Connection:
         await self.request(cmd)
         return self
 
+    @property
+    def closed(self) -> bool:
+        """
+        连接是否已经关闭，或者对端已经断开
+        """
+        return self.writer.is_closing() or self.reader.at_eof()
+
     def close(self):
         self.writer.close()
 
@@ -0,0 +1,267 @@
+"""
+设备注册表
+
+`HostService.device()` 每次都要请求一次 `host:devices-l` ，并且每次都会创建新的 `Device` ，
+`alru_cache` 缓存的props、cpu核心数、温度传感器表都跟着丢了。
+
+`DeviceRegistry` 在后台订阅 `track-devices` ，维护 序列号->Device 的表：
+
+1. 每个序列号只有一个 `Device` 对象，断开重连之后还是同一个对象，查找是一次字典查询
+2. 设备断开、掉线（重启的时候会先掉线）时清掉设备上的缓存、连接池和agent
+3. 可以订阅设备连接、断开事件
+"""
+import asyncio
+import enum
+
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+)
+from pydantic import BaseModel
+
+from async_adbc.device import Device, Status
+
+if TYPE_CHECKING:
+    from async_adbc.adbclient import ADBClient
+
+
+class DeviceEventType(enum.Enum):
+    CONNECTED = "connected"  # 设备进入 device 状态
+    DISCONNECTED = "disconnected"  # 设备离开 device 状态（断开、offline、未授权等）
+
+
+class DeviceEvent(BaseModel):
+    serialno: str
+    status: Optional[Status] = None  # 设备已经不在列表里的时候为None
+    event: DeviceEventType
+
+
+DeviceEventCallback = Callable[[DeviceEvent], Any]
+
+
+class DeviceRegistry:
+    """
+    基于 `track-devices` 的设备注册表
+
+    Args:
+        adbc (ADBClient): adb客户端
+        reconnect_interval (float, optional): track连接断开后的重连间隔，单位秒. Defaults to 1.
+    """
+
+    def __init__(self, adbc: "ADBClient", reconnect_interval: float = 1) -> None:
+        self.adbc = adbc
+        self.reconnect_interval = reconnect_interval
+
+        self._devices: Dict[str, Device] = {}
+        self._status: Dict[str, Status] = {}
+        self._callbacks: List[DeviceEventCallback] = []
+        self._queues: Set["asyncio.Queue[DeviceEvent]"] = set()
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """
+        启动后台追踪，等到收到第一份设备列表才返回
+        """
+        if self.running:
+            return
+
+        self._ready = asyncio.Event()
+        self._task = asyncio.ensure_future(self._track())
+
+        ready = asyncio.ensure_future(self._ready.wait())
+        await asyncio.wait([ready, self._task], return_when=asyncio.FIRST_COMPLETED)
+        ready.cancel()
+
+        if self._task.done():
+            # 第一次连接就失败了，把异常抛给调用者
+            self._task.result()
+
+    async def close(self):
+        """
+        停止后台追踪，已经拿到的Device对象仍然可用
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _track(self):
+        first = True
+        while True:
+            try:
+                async for snapshot in self.adbc.devices_snapshots():
+                    self._update(snapshot)
+                    if self._ready is not None:
+                        self._ready.set()
+                    first = False
+            except Exception:
+                if first:
+                    raise
+
+            # track连接断开期间设备状态未知，按全部断开处理，重连后会重新收到完整列表
+            self._update({})
+            await asyncio.sleep(self.reconnect_interval)
+
+    def _update(self, snapshot: Dict[str, Status]):
+        for serialno in set(self._status) | set(snapshot):
+            old = self._status.get(serialno)
+            new = snapshot.get(serialno)
+            if old == new:
+                continue
+
+            if new is None:
+                del self._status[serialno]
+            else:
+                self._status[serialno] = new
+
+            device = self._devices.get(serialno)
+            if device is None:
+                device = self._devices[serialno] = Device(self.adbc, serialno)
+
+            if new == Status.DEVICE:
+                event = DeviceEventType.CONNECTED
+            elif old == Status.DEVICE:
+                device.invalidate_caches()
+                event = DeviceEventType.DISCONNECTED
+            else:
+                continue
+
+            self._emit(DeviceEvent(serialno=serialno, status=new, event=event))
+
+    def _emit(self, event: DeviceEvent):
+        for callback in list(self._callbacks):
+            result = callback(event)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+
+        for queue in self._queues:
+            queue.put_nowait(event)
+
+    def get(self, serialno: str) -> Optional[Device]:
+        """
+        按序列号获取在线设备
+
+        Args:
+            serialno (str): 序列号
+
+        Returns:
+            Optional[Device]: 设备不在 device 状态时返回None
+        """
+        if self._status.get(serialno) != Status.DEVICE:
+            return None
+        return self._devices[serialno]
+
+    def status(self, serialno: str) -> Optional[Status]:
+        """
+        获取设备状态
+
+        Args:
+            serialno (str): 序列号
+
+        Returns:
+            Optional[Status]: 设备不在列表里时返回None
+        """
+        return self._status.get(serialno)
+
+    def devices(self, status: Status = Status.DEVICE) -> List[Device]:
+        """
+        获取指定状态的设备列表
+
+        Args:
+            status (Status, optional): 设备状态. Defaults to Status.DEVICE.
+
+        Returns:
+            List[Device]: 设备列表
+        """
+        return [
+            self._devices[serialno]
+            for serialno, _status in self._status.items()
+            if _status == status
+        ]
+
+    def subscribe(self, callback: DeviceEventCallback) -> Callable[[], None]:
+        """
+        订阅设备连接、断开事件，回调可以是普通函数也可以是协程函数
+
+        Args:
+            callback (DeviceEventCallback): 回调
+
+        Returns:
+            Callable[[], None]: 调用后取消订阅
+        """
+        self._callbacks.append(callback)
+
+        def unsubscribe():
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+        return unsubscribe
+
+    async def events(self) -> AsyncGenerator[DeviceEvent, Any]:
+        """
+        以异步生成器的方式读取设备事件，只会收到开始迭代之后的事件
+
+        Yields:
+            DeviceEvent: 设备事件
+        """
+        queue: "asyncio.Queue[DeviceEvent]" = asyncio.Queue()
+        self._queues.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues.discard(queue)
+
+    async def wait_for(self, serialno: str, timeout: Optional[float] = None) -> Device:
+        """
+        等待设备上线，已经在线时直接返回
+
+        Args:
+            serialno (str): 序列号
+            timeout (Optional[float], optional): 超时，单位秒. Defaults to None.
+
+        Raises:
+            asyncio.TimeoutError: 超时
+
+        Returns:
+            Device: 设备
+        """
+        device = self.get(serialno)
+        if device is not None:
+            return device
+
+        future: "asyncio.Future[Device]" = asyncio.get_event_loop().create_future()
+
+        def on_event(event: DeviceEvent):
+            if (
+                event.serialno == serialno
+                and event.event == DeviceEventType.CONNECTED
+                and not future.done()
+            ):
+                future.set_result(self._devices[serialno])
+
+        unsubscribe = self.subscribe(on_event)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            unsubscribe()
+
+    def __contains__(self, serialno: str) -> bool:
+        return self._status.get(serialno) == Status.DEVICE
+
+    def __len__(self) -> int:
+        return len(self.devices())
@@ -0,0 +1,213 @@
+"""
+统一的周期采样
+
+各个插件的 `stat` 都是调用一次采一次，同时采多个指标的时候每个指标都有自己的轮询循环，
+同一个 /proc/stat 也会被读好几次。`Sampler` 按固定间隔统一调度一台设备的所有指标：
+
+1. /proc/stat、/proc/<pid>/stat、/proc/net/dev 这些文件合并成一次 `read_files` 读取，
+   一次 /proc/stat 同时算出总cpu和每个核心的占用
+2. 保留上一次的快照用来计算差值，不需要在调用里sleep，cpu的差值和 `CPUSampler` 一致
+3. 以异步迭代器的方式输出带时间戳的采样记录
+"""
+import asyncio
+import enum
+import time
+import typing
+
+from typing import Any, AsyncGenerator, Dict, Iterable, Optional
+from pydantic import BaseModel, Field
+
+from async_adbc.plugins.battery import BatteryStat
+from async_adbc.plugins.cpu import CPUUsage, CPUUsageMap
+from async_adbc.plugins.fps import FpsMonitor, FpsStat
+from async_adbc.plugins.mem import MemSampler, MemStat
+from async_adbc.plugins.temp import TempStat
+from async_adbc.plugins.traffic import (
+    InterfaceTraffic,
+    TrafficStat,
+    parse_wan_interfaces,
+    traffic_delta,
+)
+
+if typing.TYPE_CHECKING:
+    from async_adbc.device import Device
+
+
+class Metric(enum.Enum):
+    CPU = "cpu"
+    MEM = "mem"
+    FPS = "fps"
+    TEMP = "temp"
+    BATTERY = "battery"
+    TRAFFIC = "traffic"
+
+
+class Sample(BaseModel):
+    """
+    一次采样记录，没有采集或者采集失败的指标为None，失败原因记录在errors里
+    """
+
+    timestamp: float
+    cpu: Optional[CPUUsage] = None  # 总cpu占用
+    cpu_cores: Optional[CPUUsageMap] = None  # 每个核心的占用
+    app_cpu: Optional[CPUUsage] = None  # 应用cpu占用，需要指定包名
+    mem: Optional[MemStat] = None  # 应用内存，需要指定包名
+    fps: Optional[FpsStat] = None  # 应用帧率，需要指定包名
+    temp: Optional[TempStat] = None
+    battery: Optional[BatteryStat] = None
+    traffic: Optional[TrafficStat] = None  # 与上一次采样之间的流量
+    errors: Dict[str, str] = Field(default_factory=dict)
+
+
+class Sampler:
+    """
+    一台设备的周期采样器
+
+    Args:
+        device (Device): 设备
+        interval (float, optional): 采样间隔，单位秒. Defaults to 1.
+        metrics (Optional[Iterable[Metric]], optional): 要采集的指标，默认全部. Defaults to None.
+        package_name (Optional[str], optional): 包名，不传就不采集应用相关的指标. Defaults to None.
+        heap_interval (float, optional): 获取heap信息（dumpsys meminfo）的间隔，单位秒. Defaults to 10.
+    """
+
+    def __init__(
+        self,
+        device: "Device",
+        interval: float = 1,
+        metrics: Optional[Iterable[Metric]] = None,
+        package_name: Optional[str] = None,
+        heap_interval: float = 10,
+    ) -> None:
+        self._device = device
+        self.interval = interval
+        self.metrics = set(metrics) if metrics is not None else set(Metric)
+        self.package_name = package_name
+        self.heap_interval = heap_interval
+
+        self._pid: Optional[int] = None
+        self._fps_monitor: Optional[FpsMonitor] = None
+        self._mem_sampler: Optional[MemSampler] = None
+
+        self._cpu_sampler = device.cpu.sampler()
+        self._last_traffic: Optional[InterfaceTraffic] = None
+
+    def reset(self):
+        """
+        丢弃上一次的快照，下一次采样的流量从0开始，cpu是开机以来的平均占用率
+        """
+        self._pid = None
+        self._fps_monitor = None
+        self._mem_sampler = None
+        self._cpu_sampler.reset()
+        self._last_traffic = None
+
+    async def sample(self) -> Sample:
+        """
+        采样一次
+
+        Returns:
+            Sample: 采样记录
+        """
+        sample = Sample(timestamp=time.time())
+
+        jobs: Dict[str, typing.Awaitable[Any]] = {}
+        if Metric.CPU in self.metrics or Metric.TRAFFIC in self.metrics:
+            jobs["proc"] = self._sample_proc(sample)
+        if Metric.TEMP in self.metrics:
+            jobs["temp"] = self._device.temp.stat()
+        if Metric.BATTERY in self.metrics:
+            jobs["battery"] = self._device.battery.stat()
+        if self.package_name and Metric.MEM in self.metrics:
+            jobs["mem"] = self._sample_mem(self.package_name)
+        if self.package_name and Metric.FPS in self.metrics:
+            jobs["fps"] = self._sample_fps(self.package_name)
+
+        results = await asyncio.gather(*jobs.values(), return_exceptions=True)
+
+        for name, result in zip(jobs, results):
+            if isinstance(result, BaseException):
+                sample.errors[name] = repr(result)
+            elif name != "proc":
+                setattr(sample, name, result)
+
+        return sample
+
+    async def _sample_proc(self, sample: Sample):
+        """
+        一次shell往返读取所有 /proc 下的数据源
+        """
+        sample_cpu = Metric.CPU in self.metrics
+        sample_traffic = Metric.TRAFFIC in self.metrics
+
+        if sample_cpu and self.package_name and self._pid is None:
+            try:
+                self._pid = await self._device.get_pid_by_pkgname(self.package_name)
+            except ValueError as e:
+                sample.errors["app_cpu"] = repr(e)
+
+        pids = [self._pid] if self._pid is not None else []
+        paths = []
+        if sample_cpu:
+            paths.extend(self._cpu_sampler.paths(*pids))
+        if sample_traffic:
+            paths.append("/proc/net/dev")
+
+        results = await self._device.read_files(paths)
+
+        if sample_cpu:
+            cpu_results, results = results[: len(pids) + 1], results[len(pids) + 1 :]
+            normalize_factor = await self._device.cpu.normalize_factor
+            cpu = self._cpu_sampler.update(cpu_results, pids, normalize_factor)
+            sample.cpu, sample.cpu_cores = cpu.total, cpu.cores
+
+            if self._pid is not None:
+                if self._pid in cpu.processes:
+                    sample.app_cpu = cpu.processes[self._pid]
+                else:
+                    # 进程已经退出，下次重新查pid
+                    sample.errors["app_cpu"] = f"/proc/{self._pid}/stat 读取失败"
+                    self._pid = None
+
+        if sample_traffic:
+            traffic = parse_wan_interfaces(results[0].output)
+            sample.traffic = traffic_delta(traffic, self._last_traffic)
+            self._last_traffic = traffic
+
+    async def _sample_fps(self, package_name: str) -> FpsStat:
+        # 复用同一个monitor，缓存SurfaceView并且只统计上次采样之后的新帧
+        if self._fps_monitor is None:
+            self._fps_monitor = FpsMonitor(self._device.fps, package_name)
+        return await self._fps_monitor.poll()
+
+    async def _sample_mem(self, package_name: str) -> MemStat:
+        # 每次只读smaps_rollup，dumpsys meminfo按heap_interval降频
+        if self._mem_sampler is None:
+            self._mem_sampler = self._device.mem.sampler(
+                package_name, self.heap_interval
+            )
+        return await self._mem_sampler.sample()
+
+    async def stream(self) -> AsyncGenerator[Sample, Any]:
+        """
+        按固定间隔持续采样
+
+        间隔按照开始时间对齐，某次采样耗时超过间隔的时候会跳过错过的时间点，不会堆积。
+
+        Yields:
+            Sample: 采样记录
+        """
+        loop = asyncio.get_event_loop()
+        next_tick = loop.time()
+        while True:
+            yield await self.sample()
+
+            next_tick += self.interval
+            now = loop.time()
+            if next_tick < now:
+                skipped = (now - next_tick) // self.interval + 1
+                next_tick += skipped * self.interval
+            await asyncio.sleep(next_tick - now)
+
+    def __aiter__(self):
+        return self.stream()
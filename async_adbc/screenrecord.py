@@ -0,0 +1,239 @@
+"""
+录屏流
+
+`screenrecord --output-format=h264 -` 把H.264裸流（Annex B格式）输出到stdout，
+不落地文件，也不需要在设备上编码图片。
+
+裸流按起始码 `00 00 01` 切成NAL单元：`NalSplitter` 每次只在新收到的数据附近查找起始码，
+缓冲区里只保留还没结束的最后一个NAL。
+
+screenrecord单次最多录3分钟，连续录制时在上一段结束前提前启动下一段，
+新的一段以SPS、PPS和关键帧开头，直接接在上一段后面输出，中间没有空档。
+"""
+import asyncio
+
+from typing import TYPE_CHECKING, Any, AsyncGenerator, List, Optional
+
+from async_adbc.protocol import Response
+
+if TYPE_CHECKING:
+    from async_adbc.device import Device
+
+# screenrecord的 --time-limit 上限，单位秒
+SCREENRECORD_MAX_TIME = 180
+
+NAL_START_CODE = b"\x00\x00\x01"
+
+# 常用的NAL类型
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+
+
+def nal_type(nal: bytes) -> int:
+    """
+    获取NAL单元的类型
+
+    Args:
+        nal (bytes): 带起始码的NAL单元
+
+    Returns:
+        int: NAL类型，参考 `NAL_IDR` 等
+    """
+    offset = nal.find(NAL_START_CODE) + len(NAL_START_CODE)
+    return nal[offset] & 0x1F
+
+
+class NalSplitter:
+    """
+    把H.264 Annex B字节流增量地切成NAL单元
+
+    输出的每个NAL都带着自己的起始码（3字节或4字节），直接拼起来就是合法的裸流。
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        # 下一次查找起始码的位置，之前的部分已经查过了
+        self._scan = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """
+        输入一段数据
+
+        Args:
+            data (bytes): 字节流的下一段
+
+        Returns:
+            List[bytes]: 这段数据里结束的NAL单元，最后一个还没结束的NAL留在缓冲区里
+        """
+        buffer = self._buffer
+        buffer += data
+
+        nals = []
+        start = self._nal_start(buffer.find(NAL_START_CODE))
+        if start < 0:
+            # 还没有收到第一个起始码
+            self._scan = max(0, len(buffer) - 3)
+            return nals
+
+        pos = max(self._scan, start + len(NAL_START_CODE))
+        while True:
+            index = buffer.find(NAL_START_CODE, pos)
+            if index < 0:
+                break
+            end = self._nal_start(index)
+            nals.append(bytes(buffer[start:end]))
+            start = end
+            pos = index + len(NAL_START_CODE)
+
+        # 丢掉已经输出的部分，只保留最后一个NAL
+        del buffer[:start]
+        self._scan = max(len(NAL_START_CODE), len(buffer) - 3)
+        return nals
+
+    def _nal_start(self, index: int) -> int:
+        # 4字节起始码 00 00 00 01 的第一个0属于这个NAL
+        if index > 0 and self._buffer[index - 1] == 0:
+            return index - 1
+        return index
+
+    def flush(self) -> Optional[bytes]:
+        """
+        流结束时取出最后一个NAL
+
+        Returns:
+            Optional[bytes]: 缓冲区里没有完整的NAL时为None
+        """
+        buffer = self._buffer
+        start = self._nal_start(buffer.find(NAL_START_CODE))
+        nal = bytes(buffer[start:]) if start >= 0 else None
+        self._buffer = bytearray()
+        self._scan = 0
+        return nal
+
+
+def screenrecord_command(
+    bit_rate: Optional[int] = None,
+    size: Optional[str] = None,
+    time_limit: float = SCREENRECORD_MAX_TIME,
+) -> str:
+    """
+    拼出输出H.264裸流的screenrecord命令
+
+    Args:
+        bit_rate (Optional[int], optional): 码率，单位bps. Defaults to None.
+        size (Optional[str], optional): 视频大小，比如 `720x1280` . Defaults to None.
+        time_limit (float, optional): 录制时长，单位秒. Defaults to SCREENRECORD_MAX_TIME.
+
+    Returns:
+        str: 命令
+    """
+    cmd = ["screenrecord", "--output-format=h264"]
+    if bit_rate:
+        cmd.append(f"--bit-rate {bit_rate}")
+    if size:
+        cmd.append(f"--size {size}")
+    cmd.append(f"--time-limit {max(1, min(SCREENRECORD_MAX_TIME, round(time_limit)))}")
+    cmd.append("-")
+    return " ".join(cmd)
+
+
+async def _start_screenrecord(device: "Device", cmd: str) -> Response:
+    # 走pty的老设备用exec:，否则二进制流里的 \n 会被改成 \r\n
+    service = "exec" if await device.utils.needs_crlf_fix() else "shell"
+    return await device.request(service, cmd)
+
+
+async def stream_screenrecord(
+    device: "Device",
+    bit_rate: Optional[int] = None,
+    size: Optional[str] = None,
+    time_limit: Optional[float] = None,
+    segment_time: float = SCREENRECORD_MAX_TIME,
+    overlap: float = 1,
+    chunk_size: int = 65536,
+) -> AsyncGenerator[bytes, Any]:
+    """
+    持续录屏，按NAL单元输出H.264裸流，参考 `Device.screenrecord_stream`
+    """
+    loop = asyncio.get_event_loop()
+    deadline = None if time_limit is None else loop.time() + time_limit
+    segment_time = min(segment_time, SCREENRECORD_MAX_TIME)
+
+    def segment_command() -> Optional[str]:
+        remaining = segment_time
+        if deadline is not None:
+            remaining = min(remaining, deadline - loop.time())
+            if remaining < 1:
+                return None
+        return screenrecord_command(bit_rate, size, remaining)
+
+    async def start_next(delay: float) -> Optional[Response]:
+        await asyncio.sleep(delay)
+        cmd = segment_command()
+        if cmd is None:
+            return None
+        return await _start_screenrecord(device, cmd)
+
+    async def cancel_next(task: "asyncio.Task[Optional[Response]]"):
+        # 任务可能已经打开了下一段的连接，要关掉，否则设备上会留下一个没人读的screenrecord
+        task.cancel()
+        try:
+            pending = await task
+        except BaseException:
+            return
+        if pending is not None:
+            pending.close()
+
+    cmd = segment_command()
+    if cmd is None:
+        return
+
+    current: Optional[Response] = await _start_screenrecord(device, cmd)
+    upcoming: Optional["asyncio.Task[Optional[Response]]"] = None
+    splitter = NalSplitter()
+    try:
+        while current is not None:
+            started = loop.time()
+            # 下一段在这一段结束前overlap秒启动，画面静止时stdout没有数据，所以用定时任务
+            upcoming = asyncio.ensure_future(start_next(segment_time - overlap))
+
+            nals = 0
+            head = b""
+            while True:
+                chunk = await current.reader.read(chunk_size)
+                if not chunk:
+                    break
+                if not nals and len(head) < 4096:
+                    head += chunk
+                for nal in splitter.feed(chunk):
+                    nals += 1
+                    yield nal
+
+            last = splitter.flush()
+            if last is not None:
+                nals += 1
+                yield last
+            current.close()
+            current = None
+
+            if not nals:
+                # 一帧都没有输出就退出了，输出的是错误信息
+                raise RuntimeError("screenrecord启动失败", head.decode(errors="replace"))
+
+            if deadline is not None and deadline - loop.time() < 1:
+                break
+
+            if loop.time() - started < segment_time - overlap:
+                # 这一段提前结束（比如屏幕旋转），不用等定时，马上启动下一段
+                await cancel_next(upcoming)
+                upcoming = asyncio.ensure_future(start_next(0))
+
+            current = await upcoming
+            upcoming = None
+    finally:
+        if upcoming is not None:
+            await cancel_next(upcoming)
+        if current is not None:
+            current.close()
@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING, Any, AsyncGenerator, List, Optional, Union, cast
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Dict, List, Optional, Union, cast
 from pydantic import BaseModel
 from async_adbc.service import Service
 from async_adbc.device import Device, Status
@@ -139,16 +139,29 @@ class HostService(Service):
         Yields:
             Iterator[AsyncGenerator[DeviceChangedNotification, Any]]: 状态消息
         """
+        async for snapshot in self.devices_snapshots():
+            for serialno, status in snapshot.items():
+                yield DeviceStatusNotification(serialno=serialno, status=status)
+
+    async def devices_snapshots(self) -> AsyncGenerator[Dict[str, Status], Any]:
+        """
+        `track-devices` 每次推送的都是完整的设备列表，这个方法按推送返回完整的 序列号->状态 表。
+
+        没有设备的时候会返回空表，对比前后两次的表就能知道哪些设备连接或者断开了。
+
+        Yields:
+            Dict[str, Status]: 设备序列号到状态的映射
+        """
         res = await self.request(self.HOST, "track-devices")
 
         with res:
             async for notify in res.trace_text():
-                if notify:
-                    notify = notify.strip()
-                    notify = notify.split()
-                    yield DeviceStatusNotification(
-                        serialno=notify[0], status=Status(notify[1])
-                    )
+                snapshot: Dict[str, Status] = {}
+                for line in notify.splitlines():
+                    items = line.split()
+                    if len(items) >= 2:
+                        snapshot[items[0]] = Status(items[1])
+                yield snapshot
 
     async def transport(self, serialno: str) -> Connection:
         """
@@ -165,6 +178,23 @@ class HostService(Service):
         await conn.transport_mode(serialno)
         return conn
 
+    async def features(self, serialno: str) -> List[str]:
+        """
+        获取设备adbd支持的特性列表，比如 shell_v2、cmd、stat_v2
+
+        等同：adb features
+
+        Args:
+            serialno (str): 设备序号
+
+        Returns:
+            List[str]: 特性列表
+        """
+        res = await self.request(self.HOST_SERIAL, serialno, "features")
+        with res:
+            ret = await res.text()
+        return [feature for feature in ret.strip().split(",") if feature]
+
     async def remote_connect(self, host: str, port: int) -> bool:
         """远程连接设备
         等同：adb connect
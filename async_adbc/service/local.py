@@ -1,15 +1,107 @@
 import asyncio
 import os
-import struct
+import posixpath
+import time
+import uuid
 
 from asyncio import StreamReader
-from stat import S_IFREG
-from typing import Callable, List, Literal, Optional, Union
-from pydantic import BaseModel
-from async_adbc.protocol import DATA, DONE, FAIL, RECV, SEND, Connection
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Awaitable,
+    BinaryIO,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from pydantic import BaseModel, Field
+from async_adbc.protocol import (
+    SHELL_EXIT,
+    SHELL_STDERR,
+    SHELL_STDOUT,
+    read_shell_packet,
+)
 from async_adbc.service import Service
+from async_adbc.service.sync import FileStat, SyncConnection
 
 ProgressCallback = Callable[[str, int, int], None]
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+async def _iter_file(stream: BinaryIO, chunk_size: int) -> AsyncGenerator[bytes, Any]:
+    """
+    在线程里分块读取文件，并且在返回当前块的同时提前读取下一块。
+
+    NOTE: 不能用readinto复用缓冲区，python3.12以后transport.write会直接持有传入的内存而不是复制。
+    """
+    loop = asyncio.get_event_loop()
+    pending = loop.run_in_executor(None, stream.read, chunk_size)
+    try:
+        while True:
+            chunk = await pending
+            if not chunk:
+                break
+            pending = loop.run_in_executor(None, stream.read, chunk_size)
+            yield chunk
+    finally:
+        await asyncio.wait([pending])
+
+
+def _split_batch_output(
+    data: bytes, delimiter: bytes
+) -> List[Tuple[bytes, List[bytes]]]:
+    """
+    按 `\\n<delimiter> <字段...>\\n` 分隔行切分批量命令的输出
+
+    Returns:
+        List[Tuple[bytes, List[bytes]]]: 每段输出和分隔行上的字段
+    """
+    marker = b"\n" + delimiter + b" "
+    parts = []
+    pos = 0
+    while True:
+        idx = data.find(marker, pos)
+        if idx < 0:
+            break
+        start = idx + len(marker)
+        end = data.find(b"\n", start)
+        if end < 0:
+            end = len(data)
+        parts.append((data[pos:idx], data[start:end].split()))
+        pos = end + 1
+    return parts
+
+
+def _walk_local(root: str) -> Dict[str, Tuple[int, int]]:
+    """
+    递归列出本地目录下的所有文件
+
+    Returns:
+        Dict[str, Tuple[int, int]]: key是用 `/` 分隔的相对路径，value是大小和修改时间
+    """
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            rel_path = os.path.relpath(path, root).replace(os.sep, "/")
+            stat = os.stat(path)
+            files[rel_path] = (stat.st_size, int(stat.st_mtime))
+    return files
+
+
+class SyncResult(BaseModel):
+    """
+    目录同步结果，路径都是相对于同步目录的 `/` 分隔路径
+    """
+
+    transferred: List[str] = Field(default_factory=list)
+    skipped: List[str] = Field(default_factory=list)
 
 
 class ReverseRule(BaseModel):
@@ -18,10 +110,43 @@ class ReverseRule(BaseModel):
     remote: str
 
 
+class ShellResult(BaseModel):
+    """
+    shell v2 命令的执行结果，stdout和stderr是分开的
+    """
+
+    stdout: bytes = b""
+    stderr: bytes = b""
+    exit_code: int = -1
+
+    @property
+    def ok(self) -> bool:
+        """
+        命令是否执行成功，也就是退出码为0
+        """
+        return self.exit_code == 0
+
+    @property
+    def output(self) -> str:
+        """
+        stdout文本，跟 `shell` 的返回一样去掉了首尾空白
+        """
+        return self.stdout.decode(errors="replace").strip()
+
+    @property
+    def error(self) -> str:
+        """
+        stderr文本
+        """
+        return self.stderr.decode(errors="replace").strip()
+
+
 class LocalService(Service):
     TEMP_PATH = "/data/local/tmp"
     DEFAULT_CHMOD = 0o644
     DATA_MAX_LENGTH = 65536
+    # 不支持shell v2的设备用legacy shell模拟时，用来标记退出码的分隔符
+    SHELL_EXIT_MARKER = "__ADBC_EXIT__"
 
     async def shell_raw(self, cmd: str, *args) -> bytes:
         args = map(str, args)
@@ -60,6 +185,117 @@ class LocalService(Service):
             res = await res.reader.read()
             return res.decode().strip()
 
+    async def supports_shell_v2(self) -> bool:
+        """
+        adbd是否支持shell v2协议，Android 7.0以上都支持
+
+        子类可以通过查询设备features来覆盖这个判断。
+
+        Returns:
+            bool: 是否支持
+        """
+        return True
+
+    async def shell_v2(self, cmd: str, *args) -> ShellResult:
+        """
+        用shell v2协议调用安卓设备的shell命令，stdout、stderr和退出码是分开返回的。
+
+        设备不支持shell v2的时候，会退回到legacy shell并在命令末尾打印退出码来模拟，
+        这时候stderr会混在stdout里。
+
+        等同于：adb shell（Android 7.0以上）
+
+        Args:
+            cmd (str): 命令
+
+        Returns:
+            ShellResult: 执行结果
+        """
+        str_args = map(str, args)
+        cmd = " ".join([cmd, *str_args])
+
+        if not await self.supports_shell_v2():
+            return await self._shell_v2_fallback(cmd)
+
+        res = await self.request(f"shell,v2,raw:{cmd}")
+        stdout: List[bytes] = []
+        stderr: List[bytes] = []
+        exit_code = -1
+
+        with res:
+            while True:
+                try:
+                    packet_id, data = await read_shell_packet(res.reader)
+                except asyncio.IncompleteReadError:
+                    break
+
+                if packet_id == SHELL_STDOUT:
+                    stdout.append(data)
+                elif packet_id == SHELL_STDERR:
+                    stderr.append(data)
+                elif packet_id == SHELL_EXIT:
+                    exit_code = data[0]
+                    break
+
+        return ShellResult(
+            stdout=b"".join(stdout), stderr=b"".join(stderr), exit_code=exit_code
+        )
+
+    async def _shell_v2_fallback(self, cmd: str) -> ShellResult:
+        raw = await self.shell_raw(f"{cmd};echo {self.SHELL_EXIT_MARKER}$?")
+        marker = self.SHELL_EXIT_MARKER.encode()
+        output, found, code = raw.rpartition(marker)
+        if not found:
+            return ShellResult(stdout=raw)
+
+        code = code.strip()
+        exit_code = int(code) if code.isdigit() else -1
+        return ShellResult(stdout=output, exit_code=exit_code)
+
+    async def shell_batch(self, cmds: Sequence[str]) -> List[ShellResult]:
+        """
+        把多条命令拼成一个shell脚本一次执行，每条命令之后打印唯一的分隔行和退出码，
+        返回时再按分隔行切开，只需要一次adb往返和一次设备端 `sh` 。
+
+        NOTE: 命令是在同一个shell里顺序执行的，`cd`、变量赋值会影响后面的命令，
+        命令里调用 `exit` 会导致后面的命令都不执行，这些命令的退出码是-1。
+        不支持shell v2的设备stderr会混在stdout里。
+
+        Args:
+            cmds (Sequence[str]): 命令列表
+
+        Returns:
+            List[ShellResult]: 与cmds一一对应的执行结果
+        """
+        if not cmds:
+            return []
+
+        delimiter = f"__ADBC_{uuid.uuid4().hex}__"
+        v2 = await self.supports_shell_v2()
+
+        script = []
+        for index, cmd in enumerate(cmds):
+            script.append(f"{{ {cmd}\n}}")
+            script.append(f"printf '\\n%s %d %d\\n' {delimiter} {index} $?")
+            if v2:
+                script.append(f"printf '\\n%s %d\\n' {delimiter} {index} >&2")
+
+        res = await self.shell_v2(";".join(script))
+
+        results = [ShellResult() for _ in cmds]
+        b_delimiter = delimiter.encode()
+
+        for output, fields in _split_batch_output(res.stdout, b_delimiter):
+            index, exit_code = int(fields[0]), int(fields[1])
+            results[index].stdout = output
+            results[index].exit_code = exit_code
+
+        if v2:
+            for output, fields in _split_batch_output(res.stderr, b_delimiter):
+                results[int(fields[0])].stderr = output
+
+        return results
+
     async def shell_reader(self, cmd: str, *args) -> StreamReader:
         """
         返回shell的读取器，用来持续读取打印。
@@ -284,78 +520,336 @@ class LocalService(Service):
         if not os.path.exists(src) or os.path.isdir(src):
             raise FileNotFoundError(f"src:{src} 路径不存在或不是文件")
 
-        # 推送流程是独立控制的不是请求响应流程，因此不能用 self.reqeust方法
-
-        conn = await self.create_connection()
-        await conn.request("sync:")
-
         stat = os.stat(src)
-        timestamp = int(stat.st_mtime)
-        size = stat.st_size
-        has_send = 0
-        chmode = chmode | S_IFREG
-        args = f"{dst},{chmode}".encode()
+        loop = asyncio.get_event_loop()
+        stream = await loop.run_in_executor(None, open, src, "rb")
+
+        def _progress(_dst: str, size: int, has_send: int):
+            if progress_cb:
+                progress_cb(src, size, has_send)
+
+        try:
+            await self.push_stream(
+                stream,
+                dst,
+                chmode,
+                timestamp=int(stat.st_mtime),
+                size=stat.st_size,
+                progress_cb=_progress,
+            )
+        finally:
+            await loop.run_in_executor(None, stream.close)
 
-        await conn.message(SEND, data=args)
+    async def push_stream(
+        self,
+        source: Union[AsyncIterable[BytesLike], BinaryIO],
+        dst: str,
+        chmode: int = DEFAULT_CHMOD,
+        timestamp: Optional[int] = None,
+        size: int = -1,
+        progress_cb: Optional[ProgressCallback] = None,
+    ):
+        """
+        把字节流推送到设备的dst文件，数据不需要全部读进内存。
 
-        with open(src, "rb") as stream:
-            while True:
-                chunk = stream.read(self.DATA_MAX_LENGTH)
-                if not chunk:
-                    break
-                chunk_size = len(chunk)
-                has_send += chunk_size
+        source可以是异步字节迭代器，也可以是文件对象（在线程里读取，不阻塞事件循环）。
+        连续写入 `SyncConnection.PIPELINE_FRAMES` 个DATA块才等待一次drain。
 
-                await conn.message(DATA, data=chunk)
+        Args:
+            source (Union[AsyncIterable[BytesLike], BinaryIO]): 数据来源
+            dst (str): 目标文件路径，不可以是文件夹
+            chmode (int, optional): 文件权限. Defaults to DEFAULT_CHMOD.
+            timestamp (Optional[int], optional): 文件修改时间，默认当前时间. Defaults to None.
+            size (int, optional): 总大小，只用于进度回调，未知时为-1. Defaults to -1.
+            progress_cb (Optional[ProgressCallback], optional): 进度回调，第一个参数是dst. Defaults to None.
+        """
+        if timestamp is None:
+            timestamp = int(time.time())
 
-                if progress_cb:
-                    progress_cb(src, size, has_send)
+        if isinstance(source, AsyncIterable):
+            chunks = source
+        else:
+            chunks = _iter_file(source, self.DATA_MAX_LENGTH)
+
+        def _progress(has_send: int):
+            if progress_cb:
+                progress_cb(dst, size, has_send)
 
-        await conn.message(DONE, timestamp)
-        await conn._check_status()
-        conn.close()
+        with await self.sync_connection() as sync:
+            await sync.send(chunks, dst, chmode, timestamp, _progress)
 
-    async def pull(self, src: str, dst: str):
+    async def pull(self, src: str, dst: Union[str, BinaryIO]):
         """从设备的src路径拉取文件保存到本地的dest路径。只支持文件，不支持拉整个目录。
 
+        写文件在线程里进行，跟下一个数据块的接收并行。
+
         等同于：adb pull
 
         Args:
             src (str): 设备上的文件路径
-            dst (str): 本地保存的路径
+            dst (Union[str, BinaryIO]): 本地保存的路径或者可写的文件对象
+
+        Raises:
+            RuntimeError: 请求失败
+        """
+        loop = asyncio.get_event_loop()
+
+        if isinstance(dst, str):
+            stream = await loop.run_in_executor(None, open, dst, "wb")
+        else:
+            stream = dst
+
+        pending = None
+        try:
+            async for chunk in self.pull_stream(src):
+                if pending is not None:
+                    await pending
+                pending = loop.run_in_executor(None, stream.write, chunk)
+            if pending is not None:
+                await pending
+        finally:
+            if isinstance(dst, str):
+                await loop.run_in_executor(None, stream.close)
+
+    async def pull_stream(self, src: str) -> AsyncGenerator[bytes, Any]:
+        """
+        以异步迭代器的方式拉取设备文件，每次返回一个DATA块，不会把整个文件读进内存
+
+        Args:
+            src (str): 设备上的文件路径
 
         Raises:
             RuntimeError: 请求失败
+
+        Yields:
+            bytes: 数据块
+        """
+        with await self.sync_connection() as sync:
+            async for chunk in sync.recv(src):
+                yield chunk
+
+    async def sync_connection(self) -> SyncConnection:
         """
+        创建一条sync模式的连接，可以在上面连续执行多个文件操作
 
-        async def _read_data(conn: Connection):
-            length = await conn.reader.read(4)
-            length = struct.unpack("<I", length)[0]
-            data = bytearray()
-            while len(data) < length:
-                recv = await conn.reader.read(length - len(data))
-                data += recv
-            return data
+        WARNING: 连接需要手动关闭，可以用 `with` 语句
 
+        Returns:
+            SyncConnection: sync连接
+        """
+        # 推送流程是独立控制的不是请求响应流程，因此不能用 self.reqeust方法
         conn = await self.create_connection()
-        await conn.request("sync:")
-        b_src = src.encode()
-        await conn.message(RECV, data=b_src)
+        try:
+            await conn.request("sync:")
+        except Exception:
+            conn.close()
+            raise
+        return SyncConnection(conn)
+
+    async def stat(self, path: str) -> FileStat:
+        """
+        获取设备文件属性，文件不存在时 `exists` 为False
 
-        with open(dst, "wb") as stream:
-            while True:
-                flag = await conn.reader.read(4)
-                flag = flag.decode()
-                if flag == DATA:
-                    data = await _read_data(conn)
-                    stream.write(data)
-                elif flag == DONE:
-                    await conn.reader.read(4)
-                    conn.close()
-                    return
-                elif flag == FAIL:
-                    error = await _read_data(conn)
-                    raise RuntimeError(error.decode())
+        Args:
+            path (str): 设备路径
+
+        Returns:
+            FileStat: 文件属性
+        """
+        with await self.sync_connection() as sync:
+            return await sync.stat(path)
+
+    async def list_dir(self, path: str) -> List[FileStat]:
+        """
+        列出设备目录下的文件
+
+        等同于：adb ls
+
+        Args:
+            path (str): 设备目录
+
+        Returns:
+            List[FileStat]: 文件列表
+        """
+        with await self.sync_connection() as sync:
+            return await sync.list(path)
+
+    async def push_dir(
+        self,
+        src: str,
+        dst: str,
+        delta: bool = True,
+        concurrency: int = 4,
+        chmode: int = DEFAULT_CHMOD,
+        progress_cb: Optional[ProgressCallback] = None,
+    ) -> SyncResult:
+        """
+        推送本地目录到设备目录
+
+        delta为True时先用LIST列出设备上已有的文件，大小和修改时间都一致的文件会跳过。
+        推送时会把设备文件的修改时间设置成本地文件的修改时间，所以第二次推送只会传输有变化的文件。
+        文件通过concurrency条sync连接并行推送。
+
+        Args:
+            src (str): 本地目录
+            dst (str): 设备目录
+            delta (bool, optional): 是否只推送有变化的文件. Defaults to True.
+            concurrency (int, optional): 并行的sync连接数. Defaults to 4.
+            chmode (int, optional): 文件权限. Defaults to DEFAULT_CHMOD.
+            progress_cb (Optional[ProgressCallback], optional): 每个文件的进度回调，第一个参数是本地路径. Defaults to None.
+
+        Returns:
+            SyncResult: 推送和跳过的文件列表，都是相对路径
+        """
+        if not os.path.isdir(src):
+            raise FileNotFoundError(f"src:{src} 路径不存在或不是目录")
+
+        loop = asyncio.get_event_loop()
+        local_files = await loop.run_in_executor(None, _walk_local, src)
+
+        remote_files: Dict[str, FileStat] = {}
+        if delta:
+            with await self.sync_connection() as sync:
+                remote_files = await sync.walk(dst)
+
+        result = SyncResult()
+        queue: List[str] = []
+        for rel_path, (size, mtime) in sorted(local_files.items()):
+            remote = remote_files.get(rel_path)
+            if remote and remote.size == size and remote.mtime == mtime:
+                result.skipped.append(rel_path)
+            else:
+                queue.append(rel_path)
+
+        async def _push(sync: SyncConnection, rel_path: str):
+            local_path = os.path.join(src, *rel_path.split("/"))
+            size, mtime = local_files[rel_path]
+
+            def _progress(has_send: int):
+                if progress_cb:
+                    progress_cb(local_path, size, has_send)
+
+            stream = await loop.run_in_executor(None, open, local_path, "rb")
+            try:
+                chunks = _iter_file(stream, self.DATA_MAX_LENGTH)
+                remote_path = posixpath.join(dst, rel_path)
+                await sync.send(chunks, remote_path, chmode, mtime, _progress)
+            finally:
+                await loop.run_in_executor(None, stream.close)
+            result.transferred.append(rel_path)
+
+        await self._run_sync_workers(queue, _push, concurrency)
+        return result
+
+    async def pull_dir(
+        self,
+        src: str,
+        dst: str,
+        delta: bool = True,
+        concurrency: int = 4,
+    ) -> SyncResult:
+        """
+        拉取设备目录到本地目录
+
+        delta为True时本地已有的、大小和修改时间都一致的文件会跳过。
+        拉取后会把本地文件的修改时间设置成设备文件的修改时间。
+
+        Args:
+            src (str): 设备目录
+            dst (str): 本地目录
+            delta (bool, optional): 是否只拉取有变化的文件. Defaults to True.
+            concurrency (int, optional): 并行的sync连接数. Defaults to 4.
+
+        Returns:
+            SyncResult: 拉取和跳过的文件列表，都是相对路径
+        """
+        with await self.sync_connection() as sync:
+            remote_files = await sync.walk(src)
+
+        loop = asyncio.get_event_loop()
+        local_files = {}
+        if delta and os.path.isdir(dst):
+            local_files = await loop.run_in_executor(None, _walk_local, dst)
+
+        result = SyncResult()
+        queue: List[str] = []
+        for rel_path, remote in sorted(remote_files.items()):
+            if local_files.get(rel_path) == (remote.size, remote.mtime):
+                result.skipped.append(rel_path)
+            else:
+                queue.append(rel_path)
+
+        def _open(path: str):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            return open(path, "wb")
+
+        async def _pull(sync: SyncConnection, rel_path: str):
+            local_path = os.path.join(dst, *rel_path.split("/"))
+            stream = await loop.run_in_executor(None, _open, local_path)
+            try:
+                async for chunk in sync.recv(posixpath.join(src, rel_path)):
+                    await loop.run_in_executor(None, stream.write, chunk)
+            finally:
+                await loop.run_in_executor(None, stream.close)
+
+            mtime = remote_files[rel_path].mtime
+            await loop.run_in_executor(None, os.utime, local_path, (mtime, mtime))
+            result.transferred.append(rel_path)
+
+        await self._run_sync_workers(queue, _pull, concurrency)
+        return result
+
+    async def sync(
+        self,
+        src: str,
+        dst: str,
+        concurrency: int = 4,
+        progress_cb: Optional[ProgressCallback] = None,
+    ) -> SyncResult:
+        """
+        把本地目录同步到设备，只推送有变化的文件
+
+        等同于：adb sync
+
+        Args:
+            src (str): 本地目录
+            dst (str): 设备目录
+            concurrency (int, optional): 并行的sync连接数. Defaults to 4.
+            progress_cb (Optional[ProgressCallback], optional): 每个文件的进度回调. Defaults to None.
+
+        Returns:
+            SyncResult: 推送和跳过的文件列表
+        """
+        return await self.push_dir(
+            src, dst, delta=True, concurrency=concurrency, progress_cb=progress_cb
+        )
+
+    async def _run_sync_workers(
+        self,
+        queue: List[str],
+        job: Callable[[SyncConnection, str], Awaitable[None]],
+        concurrency: int,
+    ):
+        """
+        开concurrency条sync连接，每条连接从队列里依次取文件处理
+
+        一个文件失败时取消其他连接上还在进行的传输，等它们都结束后再抛出异常
+        """
+        pending = iter(queue)
+
+        async def _worker():
+            with await self.sync_connection() as sync:
+                for rel_path in pending:
+                    await job(sync, rel_path)
+
+        workers = min(concurrency, len(queue))
+        tasks = [asyncio.ensure_future(_worker()) for _ in range(workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     async def reverse_list(self) -> List[ReverseRule]:
         """列出当前设备的反向代理规则列表
@@ -0,0 +1,228 @@
+"""
+sync服务
+
+`sync:` 请求之后连接进入文件传输模式，可以在同一条连接上连续执行多个STAT、LIST、SEND、RECV，
+最后发送QUIT退出。所有消息都是 4字节指令 + 4字节小端长度/参数 + 数据 的格式。
+"""
+import posixpath
+import stat
+import struct
+
+from typing import Any, AsyncGenerator, AsyncIterable, Callable, Dict, List, Optional
+from pydantic import BaseModel
+
+from async_adbc.protocol import (
+    DATA,
+    DENT,
+    DONE,
+    FAIL,
+    LIST,
+    QUIT,
+    RECV,
+    SEND,
+    STAT,
+    Connection,
+    DeviceError,
+    ProtocolError,
+    read_exactly,
+)
+
+SYNC_STAT = struct.Struct("<III")  # mode, size, mtime
+SYNC_DENT = struct.Struct("<IIII")  # mode, size, mtime, namelen
+
+
+class FileStat(BaseModel):
+    """
+    设备文件属性，STAT/DENT的返回
+    """
+
+    name: str = ""
+    mode: int = 0
+    size: int = 0
+    mtime: int = 0
+
+    @property
+    def exists(self) -> bool:
+        # 文件不存在时STAT返回的mode、size、mtime都是0
+        return self.mode != 0
+
+    @property
+    def is_dir(self) -> bool:
+        return stat.S_ISDIR(self.mode)
+
+    @property
+    def is_file(self) -> bool:
+        return stat.S_ISREG(self.mode)
+
+
+class SyncConnection:
+    """
+    处于sync模式的连接
+
+    一条连接上的操作只能串行执行，并发传输需要开多条连接。
+    """
+
+    # 每写入多少个DATA块才等待一次drain
+    PIPELINE_FRAMES = 8
+    DATA_MAX_LENGTH = 65536
+
+    def __init__(self, conn: Connection) -> None:
+        self._conn = conn
+
+    async def _read_fail(self, length: int):
+        error = await read_exactly(self._conn.reader, length)
+        raise DeviceError(error.decode(errors="replace"))
+
+    async def stat(self, path: str) -> FileStat:
+        """
+        获取文件属性，文件不存在时 `exists` 为False
+
+        Args:
+            path (str): 设备路径
+
+        Returns:
+            FileStat: 文件属性
+        """
+        await self._conn.message(STAT, data=path.encode())
+        header = await read_exactly(self._conn.reader, 4 + SYNC_STAT.size)
+        if header[:4].decode() != STAT:
+            raise ProtocolError(f"未知的sync响应 {header[:4]!r}")
+
+        mode, size, mtime = SYNC_STAT.unpack_from(header, 4)
+        return FileStat(name=posixpath.basename(path), mode=mode, size=size, mtime=mtime)
+
+    async def list(self, path: str) -> List[FileStat]:
+        """
+        列出目录下的文件，不包含 `.` 和 `..`
+
+        Args:
+            path (str): 设备目录
+
+        Returns:
+            List[FileStat]: 文件列表，目录不存在时为空
+        """
+        await self._conn.message(LIST, data=path.encode())
+
+        entries = []
+        while True:
+            header = await read_exactly(self._conn.reader, 4 + SYNC_DENT.size)
+            flag = header[:4].decode()
+            mode, size, mtime, namelen = SYNC_DENT.unpack_from(header, 4)
+
+            if flag == DONE:
+                return entries
+            elif flag == FAIL:
+                await self._read_fail(namelen)
+            elif flag != DENT:
+                raise ProtocolError(f"未知的sync响应 {flag!r}")
+
+            name = (await read_exactly(self._conn.reader, namelen)).decode()
+            if name in (".", ".."):
+                continue
+            entries.append(FileStat(name=name, mode=mode, size=size, mtime=mtime))
+
+    async def walk(self, path: str) -> Dict[str, FileStat]:
+        """
+        递归列出目录下所有文件
+
+        Args:
+            path (str): 设备目录
+
+        Returns:
+            Dict[str, FileStat]: key是相对path的路径（用 `/` 分隔），只包含普通文件
+        """
+        files: Dict[str, FileStat] = {}
+        dirs = [""]
+        while dirs:
+            rel_dir = dirs.pop()
+            for entry in await self.list(posixpath.join(path, rel_dir)):
+                rel_path = posixpath.join(rel_dir, entry.name)
+                if entry.is_dir:
+                    dirs.append(rel_path)
+                elif entry.is_file:
+                    files[rel_path] = entry
+        return files
+
+    async def send(
+        self,
+        chunks: AsyncIterable[Any],
+        dst: str,
+        mode: int,
+        timestamp: int,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ):
+        """
+        发送文件
+
+        Args:
+            chunks (AsyncIterable[Any]): 字节块迭代器，块可以是bytes、bytearray、memoryview
+            dst (str): 目标文件路径
+            mode (int): 文件权限
+            timestamp (int): 文件修改时间
+            on_progress (Optional[Callable[[int], None]], optional): 进度回调，参数是已发送的字节数. Defaults to None.
+        """
+        conn = self._conn
+        args = f"{dst},{mode | stat.S_IFREG}".encode()
+        conn.write_message(SEND, data=args)
+
+        has_send = 0
+        frames = 0
+        async for chunk in chunks:
+            view = memoryview(chunk)
+            for offset in range(0, len(view), self.DATA_MAX_LENGTH):
+                frame = view[offset : offset + self.DATA_MAX_LENGTH]
+                conn.write_message(DATA, data=frame)
+                has_send += len(frame)
+                frames += 1
+
+                if frames % self.PIPELINE_FRAMES == 0:
+                    await conn.writer.drain()
+
+                if on_progress:
+                    on_progress(has_send)
+
+        await conn.message(DONE, timestamp)
+
+        header = await read_exactly(conn.reader, 8)
+        length = struct.unpack("<I", header[4:])[0]
+        if header[:4].decode() == FAIL:
+            await self._read_fail(length)
+
+    async def recv(self, src: str) -> AsyncGenerator[bytes, Any]:
+        """
+        接收文件，每次返回一个DATA块
+
+        Args:
+            src (str): 设备文件路径
+
+        Yields:
+            bytes: 数据块
+        """
+        await self._conn.message(RECV, data=src.encode())
+
+        while True:
+            header = await read_exactly(self._conn.reader, 8)
+            flag = header[:4].decode()
+            length = struct.unpack("<I", header[4:])[0]
+            if flag == DATA:
+                yield await read_exactly(self._conn.reader, length)
+            elif flag == DONE:
+                return
+            elif flag == FAIL:
+                await self._read_fail(length)
+            else:
+                raise ProtocolError(f"未知的sync响应 {flag!r}")
+
+    def close(self):
+        """
+        发送QUIT并关闭连接
+        """
+        if not self._conn.closed:
+            self._conn.write_message(QUIT)
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
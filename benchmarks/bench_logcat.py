@@ -0,0 +1,58 @@
+"""
+logcat二进制解析微基准：`parse_logger_entries` 每秒能解析多少条记录
+
+生成N条v4格式的 `logger_entry` ，按 `LogcatStream` 的方式分块喂给解析器，
+分别统计不过滤和按tag过滤（只保留1/10）时的每秒记录数。
+
+用法：python benchmarks/bench_logcat.py [--entries 500000] [--chunk 65536]
+"""
+import argparse
+import struct
+import time
+
+from async_adbc.plugins.logcat import LogPriority, parse_logger_entries
+
+
+def build(entries: int) -> bytes:
+    records = []
+    for i in range(entries):
+        tag = f"Tag{i % 10}".encode()
+        message = f"message {i} with some typical payload text".encode()
+        payload = bytes([LogPriority.INFO]) + tag + b"\0" + message + b"\0"
+        header = struct.pack(
+            "<HHiIIIII", len(payload), 28, 1000, 1001, 1700000000, i, 0, 10123
+        )
+        records.append(header + payload)
+    return b"".join(records)
+
+
+def bench(data: bytes, chunk: int, tags=None) -> int:
+    buffer = bytearray()
+    count = 0
+    for offset in range(0, len(data), chunk):
+        buffer += data[offset : offset + chunk]
+        entries, consumed = parse_logger_entries(buffer, tags)
+        del buffer[:consumed]
+        count += len(entries)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=500000)
+    parser.add_argument("--chunk", type=int, default=65536)
+    args = parser.parse_args()
+
+    data = build(args.entries)
+    for name, tags in (("全部", None), ("按tag过滤", {b"Tag3"})):
+        start = time.perf_counter()
+        count = bench(data, args.chunk, tags)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{name}：{args.entries} 条记录，保留 {count} 条，耗时 {elapsed:.3f}s，"
+            f"{args.entries / elapsed:,.0f} 条/秒"
+        )
+
+
+if __name__ == "__main__":
+    main()
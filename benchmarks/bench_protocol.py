@@ -0,0 +1,72 @@
+"""
+协议层微基准：track-devices 风格的长连接帧流每秒能解析多少帧
+
+本地起一个假server，OKAY之后连续推送N个 4字节十六进制长度 + 设备列表 的帧，
+客户端用 `Response.trace_text` 读取并解析成 序列号->状态 表，统计每秒帧数。
+
+用法：python benchmarks/bench_protocol.py [--frames 200000] [--devices 8]
+"""
+import argparse
+import asyncio
+import time
+
+from async_adbc.device import Status
+from async_adbc.protocol import create_connection, encode_length
+
+
+async def serve(frames: int, payload: bytes, reader, writer):
+    length = int(await reader.readexactly(4), 16)
+    await reader.readexactly(length)
+    writer.write(b"OKAY")
+    frame = encode_length(len(payload)) + payload
+    batch = frame * 256
+    for _ in range(frames // 256):
+        writer.write(batch)
+        await writer.drain()
+    writer.write(frame * (frames % 256))
+    await writer.drain()
+    writer.close()
+
+
+async def bench(frames: int, devices: int):
+    payload = "".join(f"serial-{i:04d}\tdevice\n" for i in range(devices)).encode()
+    server = await asyncio.start_server(
+        lambda r, w: serve(frames, payload, r, w), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+
+    conn = await create_connection("127.0.0.1", port)
+    res = await conn.request("host:track-devices")
+
+    count = 0
+    start = time.perf_counter()
+    with res:
+        async for notify in res.trace_text():
+            snapshot = {}
+            for line in notify.splitlines():
+                items = line.split()
+                snapshot[items[0]] = Status(items[1])
+            count += 1
+    elapsed = time.perf_counter() - start
+
+    server.close()
+    await server.wait_closed()
+
+    assert count == frames, f"收到{count}帧，期望{frames}帧"
+    print(
+        f"{count} 帧 x {len(payload)} 字节，耗时 {elapsed:.3f}s，"
+        f"{count / elapsed:,.0f} 帧/秒，"
+        f"{count * (len(payload) + 4) / elapsed / 1024 / 1024:.1f} MiB/秒"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=200000)
+    parser.add_argument("--devices", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(bench(args.frames, args.devices))
+
+
+if __name__ == "__main__":
+    main()
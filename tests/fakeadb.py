@@ -0,0 +1,233 @@
+"""
+本地假adb server，用于不依赖真机的协议测试。
+
+只实现了 `host:transport:<serialno>` 的切换，其他请求都按前缀分发给注册的handler处理。
+"""
+import asyncio
+import os
+import struct
+
+from asyncio import StreamReader, StreamWriter
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from async_adbc.adbclient import ADBClient
+from async_adbc.device import Device
+
+Handler = Callable[[str, StreamReader, StreamWriter], Awaitable[None]]
+
+
+def okay(writer: StreamWriter, payload: Optional[str] = None):
+    writer.write(b"OKAY")
+    if payload is not None:
+        data = payload.encode()
+        writer.write(f"{len(data):04X}".encode() + data)
+
+
+def fail(writer: StreamWriter, reason: str):
+    data = reason.encode()
+    writer.write(b"FAIL" + f"{len(data):04X}".encode() + data)
+
+
+def shell_packet(packet_id: int, data: bytes) -> bytes:
+    return struct.pack("<BI", packet_id, len(data)) + data
+
+
+class FakeADBServer:
+    def __init__(self) -> None:
+        self.handlers: Dict[str, Handler] = {}
+        self.requests: List[str] = []
+        self.connections = 0
+        self.transports = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, prefix: str, handler: Handler):
+        self.handlers[prefix] = handler
+
+    def route_text(self, prefix: str, text: str):
+        """响应 OKAY + hex长度 + text 的简单请求"""
+
+        async def handler(msg: str, reader: StreamReader, writer: StreamWriter):
+            okay(writer, text)
+
+        self.route(prefix, handler)
+
+    def route_shell(self, prefix: str, output: bytes):
+        """legacy shell请求，OKAY之后直接输出到EOF"""
+
+        async def handler(msg: str, reader: StreamReader, writer: StreamWriter):
+            okay(writer)
+            writer.write(output)
+
+        self.route(prefix, handler)
+
+    def route_shell_v2(
+        self, prefix: str, stdout: bytes = b"", stderr: bytes = b"", exit_code: int = 0
+    ):
+        """shell v2请求，按数据包格式分别输出stdout、stderr和退出码"""
+
+        async def handler(msg: str, reader: StreamReader, writer: StreamWriter):
+            okay(writer)
+            writer.write(shell_packet(1, stdout))
+            writer.write(shell_packet(2, stderr))
+            writer.write(shell_packet(3, bytes([exit_code])))
+
+        self.route(prefix, handler)
+
+    def route_local_shell(self):
+        """shell请求都交给本机的 `sh -c` 执行，用来测试真正依赖shell语义的命令"""
+
+        async def run(cmd: str):
+            proc = await asyncio.create_subprocess_exec(
+                "sh",
+                "-c",
+                cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stdout, stderr = await proc.communicate()
+            return stdout, stderr, proc.returncode
+
+        async def v2(msg: str, reader: StreamReader, writer: StreamWriter):
+            stdout, stderr, exit_code = await run(msg[len("shell,v2,raw:") :])
+            okay(writer)
+            writer.write(shell_packet(1, stdout))
+            writer.write(shell_packet(2, stderr))
+            writer.write(shell_packet(3, bytes([exit_code])))
+
+        async def legacy(msg: str, reader: StreamReader, writer: StreamWriter):
+            stdout, stderr, _ = await run(msg[len("shell:") :])
+            okay(writer)
+            writer.write(stdout + stderr)
+
+        self.route("shell,v2,raw:", v2)
+        self.route("shell:", legacy)
+
+    def route_sync(self, root: str):
+        """sync服务，设备路径映射到本地root目录下"""
+
+        def local_path(path: bytes) -> str:
+            return os.path.join(root, path.decode().lstrip("/"))
+
+        async def handler(msg: str, reader: StreamReader, writer: StreamWriter):
+            okay(writer)
+            while True:
+                header = await reader.readexactly(8)
+                cmd, length = header[:4], struct.unpack("<I", header[4:])[0]
+                if cmd == b"QUIT":
+                    return
+
+                arg = await reader.readexactly(length)
+                if cmd == b"STAT":
+                    path = local_path(arg)
+                    if os.path.exists(path):
+                        st = os.stat(path)
+                        values = (st.st_mode, st.st_size, int(st.st_mtime))
+                    else:
+                        values = (0, 0, 0)
+                    writer.write(b"STAT" + struct.pack("<III", *values))
+                elif cmd == b"LIST":
+                    path = local_path(arg)
+                    names = []
+                    if os.path.isdir(path):
+                        names = [".", ".."] + sorted(os.listdir(path))
+                    for name in names:
+                        st = os.stat(os.path.join(path, name))
+                        b_name = name.encode()
+                        values = (st.st_mode, st.st_size, int(st.st_mtime), len(b_name))
+                        writer.write(b"DENT" + struct.pack("<IIII", *values) + b_name)
+                    writer.write(b"DONE" + struct.pack("<IIII", 0, 0, 0, 0))
+                elif cmd == b"SEND":
+                    path, _, mode = arg.rpartition(b",")
+                    data = bytearray()
+                    while True:
+                        header = await reader.readexactly(8)
+                        cmd, length = header[:4], struct.unpack("<I", header[4:])[0]
+                        if cmd == b"DONE":
+                            break
+                        data += await reader.readexactly(length)
+                    dst = local_path(path)
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    with open(dst, "wb") as f:
+                        f.write(data)
+                    os.utime(dst, (length, length))
+                    writer.write(b"OKAY" + struct.pack("<I", 0))
+                    await writer.drain()
+                elif cmd == b"RECV":
+                    src = local_path(arg)
+                    if not os.path.isfile(src):
+                        reason = b"No such file or directory"
+                        writer.write(b"FAIL" + struct.pack("<I", len(reason)) + reason)
+                        return
+                    with open(src, "rb") as f:
+                        while chunk := f.read(65536):
+                            writer.write(b"DATA" + struct.pack("<I", len(chunk)) + chunk)
+                    writer.write(b"DONE" + struct.pack("<I", 0))
+                    await writer.drain()
+
+        self.route("sync:", handler)
+
+    @property
+    def port(self) -> int:
+        assert self._server is not None
+        return self._server.sockets[0].getsockname()[1]
+
+    def client(self, **kwargs) -> ADBClient:
+        return ADBClient("127.0.0.1", self.port, **kwargs)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _serve(self, reader: StreamReader, writer: StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                msg = (await reader.readexactly(int(header, 16))).decode()
+                self.requests.append(msg)
+
+                if msg.startswith("host:transport:"):
+                    self.transports += 1
+                    okay(writer)
+                    await writer.drain()
+                    continue
+
+                handler = self._match(msg)
+                if handler is None:
+                    fail(writer, f"unknown service {msg}")
+                else:
+                    await handler(msg, reader, writer)
+                await writer.drain()
+                break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _match(self, msg: str) -> Optional[Handler]:
+        prefixes = sorted(
+            (p for p in self.handlers if msg.startswith(p)), key=len, reverse=True
+        )
+        return self.handlers[prefixes[0]] if prefixes else None
+
+
+class FakeADBTestCase:
+    """混入IsolatedAsyncioTestCase使用，提供self.server、self.adbc、self.device"""
+
+    SERIALNO = "fake-serial"
+    FEATURES = "shell_v2,cmd,stat_v2"
+
+    async def asyncSetUp(self):
+        self.server = await FakeADBServer().start()
+        self.server.route_text(f"host-serial:{self.SERIALNO}:features", self.FEATURES)
+        self.adbc = self.server.client()
+        self.device = Device(self.adbc, self.SERIALNO)
+
+    async def asyncTearDown(self):
+        await self.adbc.close()
+        await self.server.close()
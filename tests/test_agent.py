@@ -0,0 +1,102 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from async_adbc.agent import AGENT_READ_LIMIT, AGENT_SCRIPT, Agent
+from tests.fakeadb import FakeADBTestCase
+
+
+class TestAgent(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    SHELL = "sh"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_local_shell()
+
+        # 用本机进程代替设备端agent
+        delimiter = "__ADBC_TEST__"
+        self.proc = await asyncio.create_subprocess_exec(
+            self.SHELL,
+            AGENT_SCRIPT,
+            delimiter,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=AGENT_READ_LIMIT,
+        )
+        assert self.proc.stdout and self.proc.stdin
+        self.device.agent.attach(self.proc.stdout, self.proc.stdin, delimiter)
+
+    async def asyncTearDown(self):
+        self.device.agent.close()
+        await self.proc.wait()
+        await super().asyncTearDown()
+
+    async def test_read_files(self):
+        results = await self.device.agent.read_files(
+            ["/proc/stat", "/not_exist", "/proc/self/stat"]
+        )
+        self.assertTrue(results[0].ok)
+        self.assertTrue(results[0].output.startswith("cpu "))
+        self.assertFalse(results[1].ok)
+        self.assertTrue(results[2].ok)
+
+    async def test_exact_bytes(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for name, data in (("empty", b""), ("newlines", b"a\n\n\n"), ("plain", b"x")):
+                path = os.path.join(tmpdir, name)
+                with open(path, "wb") as f:
+                    f.write(data)
+                paths.append(path)
+
+            results = await self.device.agent.read_files(paths)
+            self.assertEqual([r.stdout for r in results], [b"", b"a\n\n\n", b"x"])
+            # 跟shell_batch的结果一致
+            fallback = await self.device.shell_batch([f"cat {path}" for path in paths])
+            self.assertEqual(
+                [(r.stdout, r.exit_code) for r in results],
+                [(r.stdout, r.exit_code) for r in fallback],
+            )
+
+    async def test_device_read_files(self):
+        results = await self.device.read_files(["/proc/stat"])
+        self.assertTrue(results[0].output.startswith("cpu "))
+        # 走agent不需要shell请求
+        self.assertFalse([r for r in self.server.requests if r.startswith("shell")])
+
+    async def test_fallback(self):
+        self.proc.kill()
+        results = await self.device.read_files(["/proc/stat"])
+        self.assertTrue(results[0].output.startswith("cpu "))
+        self.assertFalse(self.device.agent.running)
+
+    async def test_timeout(self):
+        # 没有写入端的管道，cat会一直阻塞
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fifo = os.path.join(tmpdir, "fifo")
+            os.mkfifo(fifo)
+
+            self.device.agent.timeout = 0.2
+            with self.assertRaises(ConnectionError):
+                await self.device.agent.read_files([fifo])
+            self.proc.kill()
+
+        self.assertFalse(self.device.agent.running)
+        results = await self.device.read_files(["/proc/stat"])
+        self.assertTrue(results[0].output.startswith("cpu "))
+
+
+@unittest.skipIf(shutil.which("bash") is None, "没有bash")
+class TestAgentBash(TestAgent):
+    SHELL = "bash"
+
+
+class TestAgentUnavailable(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    FEATURES = "cmd"
+
+    async def test_start(self):
+        agent = Agent(self.device)
+        self.assertFalse(await agent.start())
+        self.assertFalse(agent.running)
@@ -0,0 +1,186 @@
+import os
+import time
+import unittest
+
+from unittest import mock
+
+from async_adbc.plugins import cpu
+from async_adbc.plugins.cpu import (
+    CPUPlugin,
+    CPUSampler,
+    CPUStat,
+    parse_cpu_snapshot,
+    parse_pid_stat,
+    parse_pid_times,
+    parse_proc_stat,
+    parse_task_stats,
+)
+from tests.fakeadb import FakeADBTestCase
+
+PROC_STAT_1 = """cpu  100 0 100 800 0 0 0 0 0 0
+cpu0 50 0 50 400 0 0 0 0 0 0
+cpu1 50 0 50 400 0 0 0 0 0 0
+intr 1 2 3 4 5 6 7 8 9
+ctxt 123
+"""
+
+PROC_STAT_2 = """cpu  300 0 200 1000 0 0 0 0 0 0
+cpu0 200 0 100 500 0 0 0 0 0 0
+cpu1 100 0 100 500 0 0 0 0 0 0
+intr 1 2 3 4 5 6 7 8 9
+"""
+
+# cpu1下线了
+PROC_STAT_3 = """cpu  400 0 300 1100
+cpu0 300 0 200 600
+intr 1
+"""
+
+def task_output(total: int, threads) -> bytes:
+    lines = [f"cpu  {total} 0 0 0 0 0 0 0 0 0", "pid 100 com.demo"]
+    for tid, name, jiffies in threads:
+        if tid == 200:
+            lines.append("pid 200 com.demo:remote")
+        lines.append(f"{tid} ({name}) S 1 2 3 4 5 6 7 8 9 10 {jiffies} 0 0 0 20")
+    return ("\n".join(lines) + "\n").encode()
+
+
+PID_STAT = "1234 (Render Thread) S 1 2 3 4 5 6 7 8 9 10 11 22 33 44 20 0 1 0"
+
+
+class CPUSnapshotMixin:
+    def test_parse(self):
+        snapshot = parse_cpu_snapshot(PROC_STAT_1)
+        self.assertEqual(snapshot.cores, (0, 1))
+        self.assertEqual(snapshot.total_jiffies, 1000)
+        self.assertEqual(snapshot.row(1), [50, 0, 50, 400, 0, 0, 0, 0, 0, 0])
+
+        total, cores = parse_proc_stat(PROC_STAT_1)
+        self.assertEqual(total, CPUStat(user=100, system=100, idle=800))
+        self.assertEqual(cores[1].idle, 400)
+
+    def test_usages(self):
+        delta = parse_cpu_snapshot(PROC_STAT_2) - parse_cpu_snapshot(PROC_STAT_1)
+        total, cores = delta.to_usages(normalize_factor=0.5)
+
+        self.assertEqual(total.usage, 60)
+        self.assertEqual(total.normalized, 30)
+        self.assertEqual(cores[0].usage, 66.67)
+        self.assertEqual(cores[1].usage, 50)
+
+    def test_hotplug(self):
+        delta = parse_cpu_snapshot(PROC_STAT_3) - parse_cpu_snapshot(PROC_STAT_2)
+        total, cores = delta.to_usages()
+        self.assertEqual(list(cores), [0])
+        self.assertEqual(cores[0].usage, 66.67)
+
+    def test_idle(self):
+        snapshot = parse_cpu_snapshot(PROC_STAT_1)
+        total, cores = (snapshot - snapshot).to_usages()
+        self.assertEqual(total.usage, 0)
+        self.assertEqual(cores[0].usage, 0)
+
+
+class TestCPUSnapshotArray(CPUSnapshotMixin, unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(cpu, "np", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+@unittest.skipIf(cpu.np is None, "numpy没有安装")
+class TestCPUSnapshotNumpy(CPUSnapshotMixin, unittest.TestCase):
+    pass
+
+
+class TestPidStat(unittest.TestCase):
+    def test_parse(self):
+        times = parse_pid_times(PID_STAT)
+        self.assertEqual(times.name, "Render Thread")
+        self.assertEqual(times.total, 11 + 22 + 33 + 44)
+        self.assertEqual((times - times).total, 0)
+        self.assertEqual(parse_pid_stat(PID_STAT).total, times.total)
+    def test_parse_tasks(self):
+        table = parse_task_stats(
+            task_output(1000, [(100, "main", 10), (101, "a (b) c", 20), (200, "x", 5)])
+            .decode()
+        )
+        self.assertEqual(table.cpu.total_jiffies, 1000)
+        self.assertEqual(table.processes, {100: "com.demo", 200: "com.demo:remote"})
+        self.assertEqual(list(table.tids), [100, 101, 200])
+        self.assertEqual(list(table.pids), [100, 100, 200])
+        self.assertEqual(table.names[1], "a (b) c")
+        self.assertEqual(list(table.jiffies), [10, 20, 5])
+
+
+class FixedFactorCPUPlugin(CPUPlugin):
+    @property
+    async def normalize_factor(self) -> float:
+        return 1.0
+
+
+class TestCPUSampler(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # 用本机的 /proc 代替设备
+        self.server.route_local_shell()
+        self.device.cpu = FixedFactorCPUPlugin(self.device)
+
+    def shells(self) -> int:
+        return len([r for r in self.server.requests if r.startswith("shell")])
+
+    async def test_sample(self):
+        sampler = CPUSampler(self.device.cpu)
+        pid = os.getpid()
+
+        start = time.monotonic()
+        first = await sampler.sample(pid)
+        # 第一次是开机以来的平均占用率
+        self.assertGreater(first.total.usage, 0)
+        self.assertIn(pid, first.processes)
+
+        sum(range(10**6))
+        second = await sampler.sample(pid, 999999999)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(set(second.cores), set(first.cores))
+        self.assertGreaterEqual(second.processes[pid].usage, 0)
+        self.assertNotIn(999999999, second.processes)
+
+        # 每次采样只有一次设备读取
+        self.assertEqual(self.shells(), 2)
+
+    async def test_plugin(self):
+        usages = await self.device.cpu.cpu_usages
+        self.assertEqual(len(usages), await self.device.cpu.count)
+
+        usage = await self.device.cpu.get_pid_cpu_usage(os.getpid())
+        self.assertGreaterEqual(usage.usage, 0)
+        self.assertGreaterEqual((await self.device.cpu.total_cpu_usage).usage, 0)
+
+    async def test_independent_samplers(self):
+        await self.device.cpu.total_cpu_usage
+        last = self.device.cpu._total_sampler._last_cpu
+
+        # 其他方法不会缩短total_cpu_usage的采样区间
+        await self.device.cpu.cpu_usages
+        await self.device.cpu.get_pid_cpu_usage(os.getpid())
+        self.assertIs(self.device.cpu._total_sampler._last_cpu, last)
+        self.assertIsNot(self.device.cpu.sampler(), self.device.cpu.sampler())
+
+    async def test_threads(self):
+        threads = [(100, "main", 100), (101, "RenderThread", 200), (200, "x", 0)]
+        self.server.route_shell("shell:head -n 1 /proc/stat", task_output(1000, threads))
+        await self.device.cpu.threads("com.demo")
+
+        threads = [(100, "main", 150), (101, "RenderThread", 400), (200, "x", 10)]
+        self.server.route_shell("shell:head -n 1 /proc/stat", task_output(2000, threads))
+        result = await self.device.cpu.threads("com.demo", top=2)
+
+        self.assertEqual([t.tid for t in result], [101, 100])
+        self.assertEqual(result[0].usage, 20)
+        self.assertEqual(result[0].name, "RenderThread")
+        self.assertEqual(result[1].process_name, "com.demo")
+
+
+if __name__ == "__main__":
+    unittest.main()
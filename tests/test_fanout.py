@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+
+from async_adbc.device import Device
+from tests.fakeadb import FakeADBTestCase
+
+
+class TestFanout(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_shell("shell:", b"ok\n")
+        self.server.route_text(
+            "host:devices-l",
+            "dev-0 device usb:1\ndev-1 device usb:2\ndev-2 offline usb:3\n",
+        )
+
+    async def test_fanout(self):
+        devices = [Device(self.adbc, f"dev-{i}") for i in range(20)]
+
+        async def fn(device: Device):
+            if device.serialno == "dev-3":
+                raise RuntimeError("boom")
+            if device.serialno == "dev-4":
+                await asyncio.sleep(10)
+            return await device.shell("echo ok")
+
+        results = [
+            r async for r in self.adbc.fanout(fn, devices, concurrency=5, timeout=1)
+        ]
+        self.assertEqual(len(results), 20)
+
+        by_serial = {r.serialno: r for r in results}
+        self.assertIsInstance(by_serial["dev-3"].error, RuntimeError)
+        self.assertIsInstance(by_serial["dev-4"].error, asyncio.TimeoutError)
+        self.assertEqual(sum(r.ok for r in results), 18)
+        self.assertEqual(by_serial["dev-0"].result, "ok")
+
+    async def test_default_devices(self):
+        async def fn(device: Device):
+            return device.serialno
+
+        results = [r async for r in self.adbc.fanout(fn)]
+        self.assertEqual(sorted(r.result for r in results), ["dev-0", "dev-1"])
+
+    async def test_break(self):
+        devices = [Device(self.adbc, f"dev-{i}") for i in range(5)]
+
+        async def fn(device: Device):
+            await asyncio.sleep(0.01 * int(device.serialno[-1]))
+            return device.serialno
+
+        async for result in self.adbc.fanout(fn, devices, concurrency=1):
+            self.assertEqual(result.result, "dev-0")
+            break
@@ -0,0 +1,174 @@
+import unittest
+
+from async_adbc.plugins.fps import (
+    PENDING_FENCE_TIME,
+    FpsBackend,
+    FpsMonitor,
+    parse_framestats,
+    parse_latency,
+)
+from tests.fakeadb import FakeADBTestCase
+
+PKG = "com.example.game"
+SURFACE = f"SurfaceView - {PKG}/com.example.game.MainActivity#0"
+MS = 1000000
+
+
+def latency(*presents: int) -> bytes:
+    rows = ["0\t0\t0"] * 3
+    rows += [f"{p}\t{p}\t{p}" for p in presents]
+    return ("16666666\n" + "\n".join(rows) + "\n").encode()
+
+
+FRAMESTATS_HEADER = (
+    "Flags,IntendedVsync,Vsync,OldestInputEvent,NewestInputEvent,"
+    "HandleInputStart,AnimationStart,PerformTraversalsStart,DrawStart,"
+    "SyncQueued,SyncStart,IssueDrawCommandsStart,SwapBuffers,FrameCompleted,"
+)
+
+
+def framestats_row(vsync: int, flags: int = 0) -> str:
+    # 每个阶段1ms，整帧8ms
+    stages = [vsync + i * MS for i in range(8)]
+    values = [flags, vsync, vsync, 0, 0] + stages + [vsync + 8 * MS]
+    return ",".join(map(str, values)) + ","
+
+
+def framestats(*windows) -> bytes:
+    text = "Applications Graphics Acceleration Info:\n"
+    for vsyncs in windows:
+        rows = [framestats_row(v) for v in vsyncs]
+        rows.insert(0, framestats_row(1, flags=1))
+        text += f"\n---PROFILEDATA---\n{FRAMESTATS_HEADER}\n"
+        text += "\n".join(rows) + "\n---PROFILEDATA---\n"
+    return text.encode()
+
+
+class TestParseFramestats(unittest.TestCase):
+    def test_parse(self):
+        frames = parse_framestats(framestats([100 * MS, 116 * MS]).decode())
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(list(frames["IntendedVsync"]), [100 * MS, 116 * MS])
+        self.assertEqual(list(frames["FrameCompleted"]), [108 * MS, 124 * MS])
+
+        stages = frames.stages()
+        self.assertEqual(stages.input, 1)
+        self.assertEqual(stages.swap, 1)
+        self.assertEqual(stages.total, 8)
+
+    def test_windows(self):
+        text = framestats([100 * MS, 132 * MS], [116 * MS]).decode()
+        frames = parse_framestats(text)
+        self.assertEqual(
+            list(frames["IntendedVsync"]), [100 * MS, 116 * MS, 132 * MS]
+        )
+        frames = parse_framestats(text, after=116 * MS)
+        self.assertEqual(list(frames["IntendedVsync"]), [132 * MS])
+
+    def test_empty(self):
+        self.assertEqual(len(parse_framestats("No process found for: x")), 0)
+
+
+class TestParseLatency(unittest.TestCase):
+    def test_parse(self):
+        text = latency(100, 200, 300).decode()
+        self.assertEqual(parse_latency(text), (16666666.0, [100, 200, 300]))
+        self.assertEqual(parse_latency(text, after=200)[1], [300])
+        self.assertEqual(parse_latency(text, after=300)[1], [])
+
+    def test_pending_fence(self):
+        text = latency(100, 200).decode() + f"300\t{PENDING_FENCE_TIME}\t300\n"
+        self.assertEqual(parse_latency(text)[1], [100, 200])
+
+
+class TestFpsMonitor(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_shell(
+            "shell:dumpsys SurfaceFlinger --list", f"{SURFACE}\n".encode()
+        )
+
+    def route_latency(self, output: bytes):
+        self.server.route_shell("shell:dumpsys SurfaceFlinger --latency", output)
+
+    def list_requests(self) -> int:
+        return sum("--list" in r for r in self.server.requests)
+
+    async def test_incremental(self):
+        monitor = FpsMonitor(self.device.fps, PKG)
+
+        # 60帧，每帧16ms
+        frames = [1000 * MS + i * 16 * MS for i in range(61)]
+        self.route_latency(latency(*frames))
+        stat = await monitor.poll()
+        self.assertEqual(len(stat.frametimes), 60)
+        self.assertAlmostEqual(stat.fps, 62.5, places=1)
+        self.assertEqual(stat.p50, 16)
+
+        # 第二次只统计新的30帧，其中一帧卡顿了100ms
+        new_frames = [frames[-1] + i * 16 * MS for i in range(1, 30)]
+        new_frames.append(new_frames[-1] + 100 * MS)
+        self.route_latency(latency(*(frames[-60:] + new_frames)))
+        stat = await monitor.poll()
+        self.assertEqual(len(stat.frametimes), 30)
+        self.assertEqual(stat.jank, 1)
+        self.assertEqual(stat.big_jank, 0)
+        self.assertEqual(stat.p99, 100)
+
+        # 画面静止，没有新帧
+        stat = await monitor.poll()
+        self.assertEqual(stat.fps, 0)
+        self.assertEqual(stat.frametimes, [])
+
+        self.assertEqual(self.list_requests(), 1)
+
+    async def test_surface_gone(self):
+        monitor = FpsMonitor(self.device.fps, PKG)
+        self.route_latency(latency(100 * MS, 116 * MS))
+        await monitor.poll()
+
+        self.route_latency(b"16666666\n")
+        stat = await monitor.poll()
+        self.assertEqual(stat.fps, 0)
+        self.assertIsNone(monitor.surface_view)
+
+        self.route_latency(latency(500 * MS, 516 * MS, 532 * MS))
+        stat = await monitor.poll()
+        self.assertEqual(len(stat.frametimes), 2)
+        self.assertEqual(self.list_requests(), 2)
+
+    async def test_gfxinfo_backend(self):
+        self.server.route_shell("shell:dumpsys SurfaceFlinger --list", b"")
+        self.server.route_shell(
+            "shell:dumpsys gfxinfo", framestats([100 * MS, 116 * MS, 132 * MS])
+        )
+        monitor = FpsMonitor(self.device.fps, PKG)
+        stat = await monitor.poll()
+        self.assertEqual(stat.frametimes, [16, 16])
+        assert stat.stages is not None
+        self.assertEqual(stat.stages.draw, 1)
+        self.assertEqual(self.device.fps._backends[PKG], FpsBackend.GFXINFO)
+
+        # 后端已经确定，不再查找SurfaceView
+        self.server.route_shell(
+            "shell:dumpsys gfxinfo", framestats([148 * MS, 164 * MS])
+        )
+        stat = await FpsMonitor(self.device.fps, PKG).poll()
+        self.assertEqual(stat.frametimes, [16])
+        self.assertEqual(self.list_requests(), 1)
+        self.assertTrue(
+            any(r.endswith("framestats reset") for r in self.server.requests)
+        )
+
+    async def test_monitor(self):
+        self.route_latency(latency(100 * MS, 116 * MS))
+        stats = []
+        async for stat in self.device.fps.monitor(PKG, interval=0.01):
+            stats.append(stat)
+            if len(stats) == 3:
+                break
+        self.assertEqual([len(s.frametimes) for s in stats], [1, 0, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
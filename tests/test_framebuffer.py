@@ -0,0 +1,111 @@
+import struct
+import unittest
+import zlib
+
+from asyncio import StreamReader, StreamWriter
+
+from async_adbc.plugins.utils import (
+    PNG_SIGNATURE,
+    FB_HEADER_V2,
+    Framebuffer,
+    parse_framebuffer_header,
+)
+from tests.fakeadb import FakeADBTestCase, okay
+
+WIDTH, HEIGHT = 4, 3
+
+
+def framebuffer_header(red: int, blue: int) -> bytes:
+    size = WIDTH * HEIGHT * 4
+    # offset是位偏移
+    fields = (32, 0, size, WIDTH, HEIGHT, red, 8, blue, 8, 8, 8, 24, 8)
+    return struct.pack("<I", 2) + FB_HEADER_V2.pack(*fields)
+
+
+def pixels() -> bytes:
+    return bytes(range(WIDTH * HEIGHT * 4))
+
+
+def png_rows(png: bytes) -> bytes:
+    assert png.startswith(PNG_SIGNATURE)
+    offset = len(PNG_SIGNATURE)
+    data = b""
+    while offset < len(png):
+        (length,) = struct.unpack(">I", png[offset : offset + 4])
+        tag = png[offset + 4 : offset + 8]
+        if tag == b"IDAT":
+            data += png[offset + 8 : offset + 8 + length]
+        offset += 12 + length
+    raw = zlib.decompress(data)
+    stride = WIDTH * 4 + 1
+    return b"".join(raw[i + 1 : i + stride] for i in range(0, len(raw), stride))
+
+
+class TestFramebuffer(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    def route_framebuffer(self, header: bytes):
+        async def handler(msg: str, reader: StreamReader, writer: StreamWriter):
+            okay(writer)
+            writer.write(header)
+            data = pixels()
+            # 分几次写，验证分段读进缓冲区
+            for offset in range(0, len(data), 10):
+                writer.write(data[offset : offset + 10])
+                await writer.drain()
+
+        self.server.route("framebuffer:", handler)
+
+    async def test_rgba(self):
+        self.route_framebuffer(framebuffer_header(0, 16))
+        frame = await self.device.utils.framebuffer()
+        self.assertEqual(frame.mode, "RGBA")
+        self.assertEqual((frame.width, frame.height), (WIDTH, HEIGHT))
+        self.assertEqual(bytes(frame.pixels), pixels())
+
+        png = await frame.encode()
+        self.assertEqual(png_rows(png), pixels())
+
+        # 复用缓冲区
+        buffer = bytearray(1024)
+        again = await self.device.utils.framebuffer(buffer)
+        self.assertIs(again.buffer, buffer)
+        self.assertEqual(bytes(again.pixels), pixels())
+
+        # 缓冲区不够大，而且调用者还持有它的memoryview，也不会BufferError
+        small = bytearray(8)
+        with memoryview(small):
+            bigger = await self.device.utils.framebuffer(small)
+        self.assertIsNot(bigger.buffer, small)
+        self.assertEqual(bytes(bigger.pixels), pixels())
+
+    async def test_bgra(self):
+        self.route_framebuffer(framebuffer_header(16, 0))
+        frame = await self.device.utils.framebuffer()
+        self.assertEqual(frame.mode, "BGRA")
+        rgba = bytes(frame.to_rgba())
+        self.assertEqual(rgba[:4], bytes([2, 1, 0, 3]))
+
+    def test_rgb565_to_rgba(self):
+        fields = (16, 0, WIDTH * HEIGHT * 2, WIDTH, HEIGHT, 11, 5, 0, 5, 5, 6, 0, 0)
+        header = parse_framebuffer_header(2, FB_HEADER_V2.pack(*fields))
+        frame = Framebuffer(header, bytearray(header.size))
+        with self.assertRaises(RuntimeError):
+            frame.to_rgba()
+
+    async def test_screencap_crlf(self):
+        self.server.route_shell("shell:/system/bin/screencap", PNG_SIGNATURE)
+        self.server.route_shell("shell:echo", b"\n")
+        self.assertEqual(await self.device.utils.screencap(), PNG_SIGNATURE)
+
+    async def test_screencap_crlf_fix(self):
+        self.server.route_shell(
+            "shell:/system/bin/screencap", PNG_SIGNATURE.replace(b"\n", b"\r\n")
+        )
+        self.server.route_shell("shell:echo", b"\r\n")
+        self.assertEqual(await self.device.utils.screencap(), PNG_SIGNATURE)
+        await self.device.utils.screencap()
+        echo = [r for r in self.server.requests if r.startswith("shell:echo")]
+        self.assertEqual(len(echo), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
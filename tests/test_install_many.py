@@ -0,0 +1,114 @@
+import os
+import re
+import tempfile
+import unittest
+
+from asyncio import StreamReader, StreamWriter
+
+from async_adbc.device import Device
+from async_adbc.plugins.pm import ApkSource, InstallError
+from tests.fakeadb import FakeADBTestCase, okay
+
+
+class TestInstallStream(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_text("host-serial:", self.FEATURES)
+
+        self.received = []
+
+        async def install(msg: str, reader: StreamReader, writer: StreamWriter):
+            okay(writer)
+            await writer.drain()
+            size = int(re.search(r"-S (\d+)", msg).group(1))
+            data = await reader.readexactly(size)
+            self.received.append(data)
+            if b"bad" in data[:3]:
+                writer.write(b"Failure [INSTALL_FAILED_INVALID_APK]\n")
+            else:
+                writer.write(b"Success\n")
+
+        self.server.route("exec:cmd package install", install)
+        self.server.route("exec:pm install", install)
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.apk = self.write_apk("app.apk", os.urandom(300 * 1024 + 7))
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.tmp.cleanup()
+
+    def write_apk(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    async def test_install_stream(self):
+        progress = []
+        ok = await self.device.pm.install_stream(
+            self.apk, "r", lambda *args: progress.append(args)
+        )
+        self.assertTrue(ok)
+
+        with open(self.apk, "rb") as f:
+            self.assertEqual(self.received, [f.read()])
+        self.assertEqual(progress[-1], (self.apk, 300 * 1024 + 7, 300 * 1024 + 7))
+        self.assertTrue(
+            any(r.startswith("exec:cmd package install -r -S ") for r in self.server.requests)
+        )
+        self.assertFalse(any(r.startswith("shell:") for r in self.server.requests))
+
+    async def test_pm_fallback(self):
+        self.server.route_text(f"host-serial:{self.SERIALNO}:features", "shell_v2")
+        await self.device.pm.install_stream(self.apk)
+        self.assertTrue(
+            any(r.startswith("exec:pm install -r -d -S ") for r in self.server.requests)
+        )
+
+    async def test_failure(self):
+        apk = self.write_apk("bad.apk", b"bad apk")
+        with self.assertRaises(InstallError):
+            await self.device.pm.install_stream(apk)
+
+    async def test_empty(self):
+        apk = self.write_apk("empty.apk", b"")
+        with self.assertRaises(InstallError):
+            ApkSource(apk)
+
+    async def test_install_many(self):
+        devices = [Device(self.adbc, f"dev-{i}") for i in range(10)]
+        progress = {}
+
+        def on_progress(serialno: str, size: int, has_send: int):
+            progress[serialno] = (size, has_send)
+
+        results = [
+            r
+            async for r in self.adbc.install_many(
+                self.apk, devices, concurrency=4, progress_cb=on_progress
+            )
+        ]
+
+        self.assertEqual(sorted(r.serialno for r in results), sorted(d.serialno for d in devices))
+        self.assertTrue(all(r.ok and r.result for r in results))
+
+        size = os.path.getsize(self.apk)
+        self.assertEqual(progress, {d.serialno: (size, size) for d in devices})
+
+        with open(self.apk, "rb") as f:
+            data = f.read()
+        self.assertEqual(len(self.received), 10)
+        self.assertTrue(all(r == data for r in self.received))
+
+    async def test_install_many_failure(self):
+        apk = self.write_apk("bad.apk", b"bad apk")
+        devices = [Device(self.adbc, f"dev-{i}") for i in range(3)]
+
+        results = [r async for r in self.adbc.install_many(apk, devices)]
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(isinstance(r.error, InstallError) for r in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import asyncio
+import gzip
+import os
+import tempfile
+import unittest
+
+from asyncio import StreamReader, StreamWriter
+from unittest import mock
+
+from async_adbc import logarchive
+from async_adbc.logarchive import (
+    LogArchive,
+    SegmentWriter,
+    format_entry,
+    parse_entry,
+)
+from async_adbc.plugins.logcat import LogEntry, LogPriority
+from tests.fakeadb import FakeADBTestCase, okay
+from tests.test_logcat_stream import entry
+
+
+def log(sec: int, tag: str, message: str, priority: int = LogPriority.INFO):
+    return LogEntry(100, 101, sec, 5, priority, tag, message)
+
+
+class TestLogArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = self.tmpdir.name
+
+    def test_format(self):
+        original = LogEntry(1, 2, 3, 4, 5, "t\tag", "a\\b\nc\td e", 3, 10123)
+        line = format_entry(original)
+        self.assertEqual(line.count("\n"), 1)
+        self.assertEqual(parse_entry(line), original)
+
+    def test_rotate_and_search(self):
+        writer = SegmentWriter(self.path, max_bytes=1)
+        writer.write_block([log(100, "A", "a1"), log(101, "B", "b1")])
+        writer.write_block([log(200, "A", "a2"), log(201, "A", "a3", LogPriority.ERROR)])
+        writer.write_block([log(300, "C", "c1")])
+        writer.close()
+
+        # 每个块之后都超过了max_bytes，每块一个分段
+        self.assertEqual(len(writer.segments), 3)
+        archive = LogArchive(self.path)
+        self.assertEqual(archive.segments(), writer.segments)
+
+        with mock.patch.object(
+            logarchive, "decompress", wraps=logarchive.decompress
+        ) as decompress:
+            messages = [e.message for e in archive.search(tags=["A"], start=150)]
+            self.assertEqual(messages, ["a2", "a3"])
+            # 只解压了第二个块
+            self.assertEqual(decompress.call_count, 1)
+
+        errors = [e.message for e in archive.search(min_priority=LogPriority.ERROR)]
+        self.assertEqual(errors, ["a3"])
+        self.assertEqual([e.message for e in archive.search(end=101.5)], ["a1", "b1"])
+
+    def test_out_of_order(self):
+        writer = SegmentWriter(self.path)
+        # 合并多个缓冲区时，块的首尾不是最早、最晚的记录
+        writer.write_block(
+            [log(200, "A", "a"), log(100, "B", "b"), log(300, "C", "c"), log(250, "D", "d")]
+        )
+        writer.close()
+
+        archive = LogArchive(self.path)
+        self.assertEqual([e.message for e in archive.search(end=150)], ["b"])
+        self.assertEqual([e.message for e in archive.search(start=280)], ["c"])
+
+    def test_plain_gzip(self):
+        writer = SegmentWriter(self.path)
+        writer.write_block([log(1, "A", "first")])
+        writer.write_block([log(2, "A", "second")])
+        writer.close()
+
+        # 多个块拼起来仍然是合法的gzip文件
+        self.assertEqual(len(writer.segments), 1)
+        with gzip.open(writer.segments[0], "rt") as f:
+            lines = f.read().splitlines()
+        self.assertEqual([parse_entry(line).message for line in lines], ["first", "second"])
+
+
+class TestLogcatRecorder(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_shell("shell:echo", b"\n")
+        self.logs: "asyncio.Queue[bytes]" = asyncio.Queue()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+        async def logcat(msg: str, reader: StreamReader, writer: StreamWriter):
+            okay(writer)
+            while True:
+                data = await self.logs.get()
+                if not data:
+                    return
+                writer.write(data)
+                await writer.drain()
+
+        self.server.route("shell:logcat -B", logcat)
+
+    async def asyncTearDown(self):
+        self.logs.put_nowait(b"")
+        await super().asyncTearDown()
+        self.tmpdir.cleanup()
+
+    async def test_record(self):
+        path = os.path.join(self.tmpdir.name, "serial")
+        recorder = self.device.logcat.record(path, tags=["App"])
+        recorder.block_size = 10
+        async with recorder:
+            self.logs.put_nowait(
+                b"".join(entry("App", f"line {i}") for i in range(25))
+                + entry("Noise", "x")
+            )
+            while recorder.written < 20:
+                await asyncio.sleep(0.01)
+
+        self.assertEqual(recorder.written, 25)
+        archive = LogArchive(path)
+        self.assertEqual(len(list(archive.blocks())), 3)
+        messages = [e.message for e in archive.search()]
+        self.assertEqual(messages, [f"line {i}" for i in range(25)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import asyncio
+import struct
+import unittest
+
+from asyncio import StreamReader, StreamWriter
+
+from async_adbc.plugins.logcat import (
+    LogId,
+    LogPriority,
+    OverflowPolicy,
+    parse_logger_entries,
+)
+from tests.fakeadb import FakeADBTestCase, okay
+
+
+def entry(
+    tag: str,
+    message: str,
+    priority: int = LogPriority.INFO,
+    pid: int = 100,
+    log_id: int = LogId.MAIN,
+    version: int = 4,
+) -> bytes:
+    payload = bytes([priority]) + tag.encode() + b"\0" + message.encode() + b"\0"
+    if version == 1:
+        header = struct.pack("<HHiIII", len(payload), 0, pid, pid + 1, 1700000000, 500)
+    elif version in (2, 3):
+        # v2最后4字节是euid，v3是lid，这里都写log_id
+        header = struct.pack(
+            "<HHiIIII", len(payload), 24, pid, pid + 1, 1700000000, 500, log_id
+        )
+    else:
+        header = struct.pack(
+            "<HHiIIIII", len(payload), 28, pid, pid + 1, 1700000000, 500, log_id, 10123
+        )
+    return header + payload
+
+
+class TestLoggerEntry(unittest.TestCase):
+    def test_parse(self):
+        data = entry("Tag", "hello\n") + entry("Old", "v1", version=1)
+        entries, consumed = parse_logger_entries(data)
+        self.assertEqual(consumed, len(data))
+        self.assertEqual(
+            [(e.tag, e.message, e.uid) for e in entries],
+            [("Tag", "hello", 10123), ("Old", "v1", -1)],
+        )
+        self.assertEqual(entries[0].tid, 101)
+        self.assertAlmostEqual(entries[0].timestamp, 1700000000.0000005)
+
+    def test_header_24(self):
+        # v2的euid碰巧等于EVENTS也不会被当成二进制缓冲区丢掉
+        data = entry("V2", "euid", log_id=LogId.EVENTS, version=2)
+        entries, _ = parse_logger_entries(data)
+        self.assertEqual([(e.tag, e.log_id, e.uid) for e in entries], [("V2", LogId.MAIN, -1)])
+
+        data = entry("V3", "lid", log_id=LogId.SYSTEM, version=3) + entry(
+            "Ev", "x", log_id=LogId.EVENTS, version=3
+        )
+        entries, _ = parse_logger_entries(data, header_v3=True)
+        self.assertEqual([(e.tag, e.log_id) for e in entries], [("V3", LogId.SYSTEM)])
+
+    def test_partial(self):
+        data = entry("A", "1") + entry("B", "2")
+        entries, consumed = parse_logger_entries(data[:-3])
+        self.assertEqual([e.tag for e in entries], ["A"])
+        self.assertEqual(consumed, len(entry("A", "1")))
+
+    def test_filter(self):
+        data = (
+            entry("Keep", "a", LogPriority.WARN)
+            + entry("Keep", "b", LogPriority.DEBUG)
+            + entry("Other", "c", LogPriority.ERROR)
+            + entry("Keep", "event", log_id=LogId.EVENTS)
+        )
+        entries, consumed = parse_logger_entries(
+            data, tags={b"Keep"}, min_priority=LogPriority.INFO
+        )
+        self.assertEqual(consumed, len(data))
+        self.assertEqual([e.message for e in entries], ["a"])
+
+
+class TestLogcatStream(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_shell("shell:echo", b"\n")
+        self.logs: "asyncio.Queue[bytes]" = asyncio.Queue()
+
+        async def logcat(msg: str, reader: StreamReader, writer: StreamWriter):
+            okay(writer)
+            while True:
+                data = await self.logs.get()
+                if not data:
+                    return
+                writer.write(data)
+                await writer.drain()
+
+        self.server.route("shell:logcat -B", logcat)
+
+    async def test_stream(self):
+        async with self.device.logcat.stream("-b", "main", tags=["App"]) as stream:
+            data = b"".join(entry("App", f"line {i}") for i in range(100))
+            data += entry("Noise", "x")
+            # 记录跨块切开
+            self.logs.put_nowait(data[:1001])
+            self.logs.put_nowait(data[1001:])
+            self.logs.put_nowait(b"")
+            messages = [e.message async for e in stream]
+
+        self.assertEqual(messages, [f"line {i}" for i in range(100)])
+        self.assertIn("shell:logcat -B -b main", self.server.requests)
+
+    async def test_drop_oldest(self):
+        async with self.device.logcat.stream(maxsize=10) as stream:
+            self.logs.put_nowait(b"".join(entry("T", str(i)) for i in range(25)))
+            self.logs.put_nowait(b"")
+            while stream._task is not None and not stream._task.done():
+                await asyncio.sleep(0.01)
+            batch = await stream.get_batch()
+
+        self.assertEqual([e.message for e in batch], [str(i) for i in range(15, 25)])
+        self.assertEqual(stream.dropped, 15)
+
+    async def test_drop_newest(self):
+        async with self.device.logcat.stream(
+            maxsize=10, policy=OverflowPolicy.DROP_NEWEST
+        ) as stream:
+            self.logs.put_nowait(b"".join(entry("T", str(i)) for i in range(25)))
+            self.logs.put_nowait(b"")
+            while stream._task is not None and not stream._task.done():
+                await asyncio.sleep(0.01)
+            batch = await stream.get_batch()
+
+        self.assertEqual([e.message for e in batch], [str(i) for i in range(10)])
+        self.assertEqual(stream.dropped, 15)
+
+    async def test_block(self):
+        async with self.device.logcat.stream(
+            maxsize=10, policy=OverflowPolicy.BLOCK
+        ) as stream:
+            self.logs.put_nowait(b"".join(entry("T", str(i)) for i in range(25)))
+            self.logs.put_nowait(b"")
+            messages = [e.message async for e in stream]
+
+        self.assertEqual(messages, [str(i) for i in range(25)])
+        self.assertEqual(stream.dropped, 0)
+
+    async def test_logs(self):
+        self.server.route_shell("shell:logcat -d", b"first\r\nsecond\nthird")
+        lines = [line async for line in self.device.logcat.logs("-d")]
+        self.assertEqual(lines, ["first", "second", "third"])
+
+
+if __name__ == "__main__":
+    unittest.main()
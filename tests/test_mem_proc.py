@@ -0,0 +1,143 @@
+import os
+import tempfile
+import unittest
+
+from async_adbc.plugins.mem import (
+    MemSource,
+    parse_meminfo,
+    parse_smaps_rollup,
+    parse_statm,
+)
+from tests.fakeadb import FakeADBTestCase
+
+MEMINFO = """MemTotal:        7802304 kB
+MemFree:          224688 kB
+MemAvailable:    3170420 kB
+Buffers:            3164 kB
+Cached:          2957032 kB
+SwapCached:        52336 kB
+SwapTotal:       4194300 kB
+SwapFree:        2867156 kB
+"""
+
+SMAPS_ROLLUP = """12c00000-ffff0000 ---p 00000000 00:00 0                                  [rollup]
+Rss:              201324 kB
+Pss:              120450 kB
+Pss_Anon:          80000 kB
+Shared_Clean:      60000 kB
+Shared_Dirty:       4000 kB
+Private_Clean:     30000 kB
+Private_Dirty:    107324 kB
+Swap:              12000 kB
+SwapPss:            9000 kB
+"""
+
+DUMPSYS = """
+                   Pss  Private  Private  SwapPss     Heap     Heap     Heap
+                 Total    Dirty    Clean    Dirty     Size    Alloc     Free
+                ------   ------   ------   ------   ------   ------   ------
+        TOTAL   120000   100000    30000     9000    65536    40000    25536
+"""
+
+
+class TestMemProc(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    def test_parse_meminfo(self):
+        info = parse_meminfo(MEMINFO)
+        self.assertEqual(info.mem_total, 7802304)
+        self.assertEqual(info.swap_total, 4194300)
+        self.assertEqual(info.mem_available, 3170420)
+        self.assertEqual(info.shmem, 0)
+
+    def test_parse_smaps_rollup(self):
+        stat = parse_smaps_rollup(SMAPS_ROLLUP)
+        self.assertEqual(stat.pss, 120450)
+        self.assertEqual(stat.rss, 201324)
+        self.assertEqual(stat.private_dirty, 107324)
+        self.assertEqual(stat.private_clean, 30000)
+        # 有SwapPss的时候用SwapPss
+        self.assertEqual(stat.swap, 9000)
+        self.assertEqual(stat.heap_size, 0)
+
+    def test_parse_statm(self):
+        stat = parse_statm("1000 256 10 1 0 100 0\n", 16384)
+        self.assertEqual(stat.rss, 256 * 16)
+        self.assertEqual(stat.pss, 0)
+
+    async def test_page_size(self):
+        self.server.route_shell("shell:getconf PAGESIZE", b"16384\n")
+        self.assertEqual(await self.device.page_size, 16384)
+        self.assertEqual(await self.device.page_size, 16384)
+        self.assertEqual(len([r for r in self.server.requests if "getconf" in r]), 1)
+
+    async def test_info(self):
+        self.server.route_local_shell()
+        info = await self.device.mem.info
+        self.assertGreater(info.mem_total, 0)
+
+    async def test_process_stat(self):
+        # 用本机的 /proc 代替设备
+        self.server.route_local_shell()
+        stat = await self.device.mem.process_stat(os.getpid())
+        assert stat is not None
+        self.assertGreater(stat.rss, 0)
+        self.assertEqual(
+            len([r for r in self.server.requests if r.startswith("shell")]), 1
+        )
+
+        self.assertIsNone(await self.device.mem.process_stat(2**22 + 1))
+
+    async def test_sampler_heap_interval(self):
+        self.server.route_local_shell()
+        self.server.route_shell("shell:pidof", f"{os.getpid()}\n".encode())
+        self.server.route_shell("shell:dumpsys meminfo", DUMPSYS.encode())
+
+        sampler = self.device.mem.sampler("com.demo", heap_interval=3600)
+        first = await sampler.sample()
+        second = await sampler.sample()
+
+        self.assertGreater(second.rss, 0)
+        self.assertEqual(first.heap_size, 65536)
+        # heap信息沿用第一次dumpsys的结果
+        self.assertEqual(second.heap_alloc, 40000)
+        dumpsys = [r for r in self.server.requests if "dumpsys" in r]
+        self.assertEqual(len(dumpsys), 1)
+
+    async def test_sampler_statm_fallback(self):
+        # 没有权限读smaps_rollup时，pss用dumpsys的结果
+        self.server.route_shell("shell:pidof", b"1234\n")
+        self.server.route_shell("shell:dumpsys meminfo", DUMPSYS.encode())
+        self.server.route_local_shell()
+        local = self.server.handlers["shell,v2,raw:"]
+
+        # /proc/1234/ 映射到只有statm的临时目录，smaps_rollup读取失败
+        with tempfile.TemporaryDirectory() as proc_dir:
+            with open(os.path.join(proc_dir, "statm"), "w") as f:
+                f.write("1000 256 10 1 0 100 0\n")
+
+            async def v2(msg: str, reader, writer):
+                await local(msg.replace("/proc/1234/", proc_dir + "/"), reader, writer)
+
+            self.server.route("shell,v2,raw:", v2)
+            stat = await self.device.mem.process_stat(1234)
+            assert stat is not None
+            self.assertEqual(stat.source, MemSource.STATM)
+            self.assertEqual(stat.pss, 0)
+
+            sampler = self.device.mem.sampler("com.demo", heap_interval=3600)
+            for _ in range(2):
+                sample = await sampler.sample()
+                self.assertEqual(sample.source, MemSource.DUMPSYS)
+                self.assertEqual(sample.pss, 120000)
+                self.assertEqual(sample.private_dirty, 100000)
+                self.assertEqual(sample.private_clean, 30000)
+                self.assertEqual(sample.rss, 256 * await self.device.page_size // 1024)
+
+    async def test_sampler_not_running(self):
+        self.server.route_shell("shell:pidof", b"")
+        sampler = self.device.mem.sampler("com.demo")
+        stat = await sampler.sample()
+        self.assertEqual(stat.pss, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import struct
+import unittest
+
+from asyncio import StreamReader, StreamWriter
+
+from async_adbc.plugins.minicap import MINICAP_BANNER, parse_banner
+from tests.fakeadb import FakeADBTestCase, okay
+
+PID = 4321
+
+
+def banner() -> bytes:
+    return MINICAP_BANNER.pack(1, MINICAP_BANNER.size, PID, 1080, 1920, 540, 960, 1, 0)
+
+
+def frame(index: int) -> bytes:
+    data = b"\xff\xd8" + bytes([index]) * 100 + b"\xff\xd9"
+    return struct.pack("<I", len(data)) + data
+
+
+class TestMinicapStream(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_shell("shell:[ -f", b"ok\n")
+        self.server.route_shell("shell:wm size", b"Physical size: 1080x1920\n")
+        self.server.route_shell(
+            "shell:dumpsys input|grep SurfaceOrientation", b"  SurfaceOrientation: 1\n"
+        )
+        self.server.route_shell("shell:kill", b"")
+
+        self.frames: "asyncio.Queue[bytes]" = asyncio.Queue()
+        self.daemon_started = 0
+
+        async def daemon(msg: str, reader: StreamReader, writer: StreamWriter):
+            self.daemon_started += 1
+            okay(writer)
+            await writer.drain()
+            # 一直运行到客户端断开
+            await reader.read()
+
+        async def socket(msg: str, reader: StreamReader, writer: StreamWriter):
+            if self.daemon_started == 0:
+                writer.write(b"FAIL0006closed")
+                return
+            okay(writer)
+            writer.write(banner())
+            while True:
+                data = await self.frames.get()
+                if not data:
+                    return
+                writer.write(data)
+                await writer.drain()
+
+        self.server.route("shell:LD_LIBRARY_PATH", daemon)
+        self.server.route("localabstract:minicap", socket)
+
+    def test_parse_banner(self):
+        parsed = parse_banner(banner())
+        self.assertEqual(parsed.pid, PID)
+        self.assertEqual(parsed.virtual_width, 540)
+        self.assertEqual(parsed.orientation, 90)
+
+    async def test_stream(self):
+        async with self.device.minicap.stream(size="540x960") as stream:
+            assert stream.banner is not None
+            self.assertEqual(stream.banner.real_height, 1920)
+
+            self.frames.put_nowait(frame(1))
+            self.assertEqual((await stream.frame())[2], 1)
+
+            # 消费者跟不上时只保留最新一帧
+            for index in (2, 3, 4):
+                self.frames.put_nowait(frame(index))
+            while stream.frames < 4:
+                await asyncio.sleep(0.01)
+            self.assertEqual((await stream.frame())[2], 4)
+            self.assertEqual(stream.dropped, 2)
+
+            self.frames.put_nowait(b"")
+            self.assertEqual([f async for f in stream], [])
+
+        daemon = [r for r in self.server.requests if r.startswith("shell:LD_")]
+        self.assertEqual(len(daemon), 1)
+        self.assertIn("-P 1080x1920@540x960/90", daemon[0])
+        self.assertIn(f"shell:kill {PID}", self.server.requests)
+
+    async def test_init_cached(self):
+        await self.device.minicap.init()
+        await self.device.minicap.init()
+        checks = [r for r in self.server.requests if r.startswith("shell:[ -f")]
+        self.assertEqual(len(checks), 1)
+        self.assertIn("/data/local/tmp/minicap.so", checks[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+from tests.fakeadb import FakeADBTestCase
+
+
+class TestConnectionPool(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_shell("shell:", b"hello\n")
+
+    async def test_prewarm_hit(self):
+        ret = await self.device.shell("echo", "hello")
+        self.assertEqual(ret, "hello")
+
+        # 等后台预热完成
+        await asyncio.sleep(0.1)
+        stats = self.adbc.pool.stats(self.device.serialno)
+        self.assertEqual(stats.misses, 1)
+        self.assertEqual(stats.idle, 1)
+
+        ret = await self.device.shell("echo", "hello")
+        self.assertEqual(ret, "hello")
+        stats = self.adbc.pool.stats(self.device.serialno)
+        self.assertEqual(stats.hits, 1)
+        # 每条连接都只做了一次转发切换
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.server.transports, self.server.connections)
+
+    async def test_idle_timeout(self):
+        self.adbc.pool.idle_timeout = 0
+        await self.device.shell("echo", "hello")
+        await asyncio.sleep(0.1)
+
+        await self.device.shell("echo", "hello")
+        stats = self.adbc.pool.stats(self.device.serialno)
+        self.assertEqual(stats.hits, 0)
+        self.assertEqual(stats.misses, 2)
+        self.assertGreaterEqual(stats.discarded, 1)
+
+    async def test_prune_timer(self):
+        self.adbc.pool.idle_timeout = 0.2
+        await self.device.shell("echo", "hello")
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.adbc.pool.stats(self.device.serialno).idle, 1)
+
+        # 不再有请求，预热连接也会在超时后被关闭
+        await asyncio.sleep(0.3)
+        stats = self.adbc.pool.stats(self.device.serialno)
+        self.assertEqual(stats.idle, 0)
+        self.assertEqual(stats.discarded, 1)
+        self.assertIsNone(self.adbc.pool._prune_handle)
+
+    async def test_max_size(self):
+        self.adbc.pool.warm(self.device.serialno, 10)
+        await asyncio.sleep(0.1)
+        stats = self.adbc.pool.stats(self.device.serialno)
+        self.assertEqual(stats.idle, self.adbc.pool.max_size)
+
+    async def test_transport_error(self):
+        await self.server.close()
+        self.adbc.pool.warm("gone")
+        await asyncio.sleep(0.1)
+        stats = self.adbc.pool.stats("gone")
+        self.assertEqual(stats.errors, 1)
+        self.assertEqual(stats.idle, 0)
@@ -0,0 +1,72 @@
+import os
+import unittest
+
+from async_adbc.processes import parse_processes
+from tests.fakeadb import FakeADBTestCase
+
+# arm64设备可能是16K页
+PAGE_SIZE = 16384
+
+
+def processes_output(total: int, processes) -> bytes:
+    lines = [f"cpu  {total} 0 0 0 0 0 0 0 0 0"]
+    for pid, name, jiffies, _ in processes:
+        lines.append(f"{pid} ({name}) S 1 2 3 4 5 6 7 8 9 10 {jiffies} 0 0 0 20 0")
+    for pid, _, _, rss in processes:
+        lines.append(f"/proc/{pid}/statm:1000 {rss} 10 1 0 100 0")
+    return ("\n".join(lines) + "\n").encode()
+
+
+class TestProcesses(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    def test_parse(self):
+        table = parse_processes(
+            processes_output(
+                1000, [(1, "init", 10, 100), (42, "com.demo) (x", 20, 200)]
+            ).decode(),
+            PAGE_SIZE,
+        )
+        self.assertEqual(len(table), 2)
+        self.assertIn(42, table)
+        stat = table.get(42)
+        assert stat is not None
+        self.assertEqual(stat.name, "com.demo) (x")
+        self.assertEqual(stat.rss, 200 * PAGE_SIZE)
+        self.assertEqual(table.find("com.demo) (x"), [42])
+
+    def test_diff(self):
+        before = parse_processes(
+            processes_output(1000, [(1, "init", 10, 100), (42, "app", 20, 200)]).decode(),
+            PAGE_SIZE,
+        )
+        after = parse_processes(
+            processes_output(
+                2000, [(1, "init", 60, 100), (42, "app", 220, 150), (43, "new", 5, 10)]
+            ).decode(),
+            PAGE_SIZE,
+        )
+        stats = after.diff(before)
+        self.assertEqual([s.pid for s in stats], [42, 1, 43])
+        self.assertEqual(stats[0].cpu, 20)
+        self.assertEqual(stats[0].rss_delta, -50 * PAGE_SIZE)
+        self.assertEqual(stats[1].cpu, 5)
+        self.assertEqual(stats[2].cpu, 0.5)
+        self.assertEqual(len(after.diff(before, top=1)), 1)
+
+    async def test_device_processes(self):
+        # 用本机的 /proc 代替设备
+        self.server.route_local_shell()
+        table = await self.device.processes()
+        self.assertIn(os.getpid(), table)
+        stat = table.get(os.getpid())
+        assert stat is not None
+        self.assertGreater(stat.rss, 0)
+
+        # 页大小只获取一次，之后每次快照只有一次shell
+        await self.device.processes()
+        self.assertEqual(
+            len([r for r in self.server.requests if r.startswith("shell")]), 3
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,15 @@
+import asyncio
 import unittest
-from async_adbc.protocol import create_connection
+from async_adbc.protocol import (
+    ConnectionClosedError,
+    Connection,
+    DeviceError,
+    ProtocolError,
+    Response,
+    create_connection,
+    decode_length,
+    pack,
+)
 
 
 class ProtocalTest(unittest.IsolatedAsyncioTestCase):
@@ -8,3 +18,81 @@ class ProtocalTest(unittest.IsolatedAsyncioTestCase):
         resp = await conn.request("host:version")
         ret = await resp.text()
         self.assertTrue(ret)
+
+
+class _NullWriter:
+    def write(self, data):
+        pass
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FramingTest(unittest.IsolatedAsyncioTestCase):
+    def reader(self, *chunks: bytes, eof: bool = True) -> asyncio.StreamReader:
+        reader = asyncio.StreamReader()
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        if eof:
+            reader.feed_eof()
+        return reader
+
+    def response(self, *chunks: bytes, eof: bool = True) -> Response:
+        return Response(self.reader(*chunks, eof=eof), _NullWriter())  # type: ignore
+
+    def connection(self, *chunks: bytes) -> Connection:
+        return Connection(self.reader(*chunks), _NullWriter())  # type: ignore
+
+    def test_length(self):
+        self.assertEqual(decode_length(b"0000"), 0)
+        self.assertEqual(decode_length(b"001a"), 26)
+        self.assertEqual(decode_length(b"FFFF"), 65535)
+        self.assertEqual(pack("中"), b"0003" + "中".encode())
+        for data in (b"00zz", b" 1_f", b"+01f", b"-001", b" 01f", b"01f", b"00001"):
+            with self.assertRaises(ProtocolError):
+                decode_length(data)
+
+    async def test_short_reads(self):
+        # 帧被拆成多次到达也能完整读取
+        reader = self.reader(eof=False)
+        response = Response(reader, _NullWriter())  # type: ignore
+        task = asyncio.ensure_future(response.byte())
+        for b in b"0005hello":
+            reader.feed_data(bytes([b]))
+            await asyncio.sleep(0)
+        self.assertEqual(await task, b"hello")
+
+    async def test_trace(self):
+        response = self.response(b"0003abc0000", b"0002de")
+        self.assertEqual([f async for f in response.trace()], [b"abc", b"", b"de"])
+
+    async def test_trace_truncated(self):
+        response = self.response(b"0003abc0005de")
+        frames = []
+        with self.assertRaises(ConnectionClosedError):
+            async for frame in response.trace():
+                frames.append(frame)
+        self.assertEqual(frames, [b"abc"])
+
+        with self.assertRaises(ConnectionClosedError):
+            await self.response(b"00").byte()
+
+        with self.assertRaises(ProtocolError):
+            await self.response(b"xyz!abc").byte()
+
+    async def test_status(self):
+        self.assertTrue(await self.connection(b"OKAY")._check_status())
+
+        with self.assertRaises(DeviceError) as ctx:
+            await self.connection(b"FAIL0010device not found")._check_status()
+        self.assertEqual(ctx.exception.reason, "device not found")
+        self.assertIsInstance(ctx.exception, RuntimeError)
+
+        with self.assertRaises(ProtocolError):
+            await self.connection(b"WHAT")._check_status()
+
+        with self.assertRaises(ConnectionClosedError):
+            await self.connection(b"OK")._check_status()
@@ -0,0 +1,130 @@
+import asyncio
+import unittest
+
+from asyncio import StreamReader, StreamWriter
+
+from async_adbc.device import Status
+from async_adbc.registry import DeviceEvent, DeviceEventType
+from tests.fakeadb import FakeADBTestCase, okay
+
+
+class TestDeviceRegistry(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.snapshots: "asyncio.Queue[str]" = asyncio.Queue()
+        self.tracks = 0
+
+        async def track(msg: str, reader: StreamReader, writer: StreamWriter):
+            self.tracks += 1
+            okay(writer)
+            while True:
+                snapshot = await self.snapshots.get()
+                if snapshot is None:
+                    return
+                data = snapshot.encode()
+                writer.write(f"{len(data):04X}".encode() + data)
+                await writer.drain()
+
+        self.server.route("host:track-devices", track)
+        self.server.route_text("host:devices-l", "")
+        self.server.route_shell("shell:getprop", b"[ro.product.model]: [Pixel]\n")
+
+    async def asyncTearDown(self):
+        await self.adbc.close()
+        # 结束track连接，不然server关闭时会一直等它
+        for _ in range(self.tracks):
+            await self.snapshots.put(None)
+        await super().asyncTearDown()
+
+    async def publish(self, snapshot: str):
+        await self.snapshots.put(snapshot)
+        await asyncio.sleep(0.05)
+
+    async def test_lookup(self):
+        await self.snapshots.put("dev-0\tdevice\ndev-1\toffline\n")
+        registry = await self.adbc.track()
+
+        self.assertIn("dev-0", registry)
+        self.assertNotIn("dev-1", registry)
+        self.assertEqual(len(registry), 1)
+        self.assertEqual(registry.status("dev-1"), Status.OFFLINE)
+
+        device = await self.adbc.device("dev-0")
+        self.assertIs(device, await self.adbc.device("dev-0"))
+        self.assertEqual([d.serialno for d in await self.adbc.devices()], ["dev-0"])
+        self.assertNotIn("host:devices-l", self.server.requests)
+
+    async def test_events(self):
+        await self.snapshots.put("")
+        registry = await self.adbc.track()
+
+        received = []
+        unsubscribe = registry.subscribe(received.append)
+
+        await self.publish("dev-0\tdevice\n")
+        await self.publish("dev-0\toffline\n")
+        await self.publish("dev-0\tunauthorized\n")
+        await self.publish("")
+        unsubscribe()
+        await self.publish("dev-0\tdevice\n")
+
+        self.assertEqual(
+            received,
+            [
+                DeviceEvent(
+                    serialno="dev-0",
+                    status=Status.DEVICE,
+                    event=DeviceEventType.CONNECTED,
+                ),
+                DeviceEvent(
+                    serialno="dev-0",
+                    status=Status.OFFLINE,
+                    event=DeviceEventType.DISCONNECTED,
+                ),
+            ],
+        )
+
+    async def test_reconnect_keeps_device(self):
+        await self.snapshots.put("dev-0\tdevice\n")
+        registry = await self.adbc.track()
+        device = registry.get("dev-0")
+        assert device is not None
+
+        self.assertEqual((await device.properties)["ro.product.model"], "Pixel")
+
+        self.server.route_shell("shell:getprop", b"[ro.product.model]: [Other]\n")
+        self.assertEqual((await device.properties)["ro.product.model"], "Pixel")
+
+        waiter = asyncio.ensure_future(registry.wait_for("dev-0", timeout=1))
+        await self.publish("")
+        self.assertIsNone(registry.get("dev-0"))
+        await self.publish("dev-0\tdevice\n")
+
+        self.assertIs(await waiter, device)
+        self.assertEqual((await device.properties)["ro.product.model"], "Other")
+
+    async def test_track_reconnect(self):
+        self.adbc.registry.reconnect_interval = 0.01
+        await self.snapshots.put("dev-0\tdevice\n")
+        registry = await self.adbc.track()
+
+        events = []
+
+        async def collect():
+            async for event in registry.events():
+                events.append(event.event)
+
+        task = asyncio.ensure_future(collect())
+        await asyncio.sleep(0)
+        await self.snapshots.put(None)
+        await self.publish("dev-0\tdevice\n")
+        task.cancel()
+
+        self.assertEqual(
+            events, [DeviceEventType.DISCONNECTED, DeviceEventType.CONNECTED]
+        )
+        self.assertEqual(self.tracks, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+
+from unittest import mock
+
+from async_adbc.plugins.cpu import CPUPlugin, CPUSampler
+from async_adbc.sampling import Metric
+from async_adbc.service.local import ShellResult
+from tests.fakeadb import FakeADBTestCase
+
+
+class FixedFactorCPUPlugin(CPUPlugin):
+    @property
+    async def normalize_factor(self) -> float:
+        return 1.0
+
+
+class TestSampler(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # 用本机的 /proc/stat 代替设备
+        self.server.route_local_shell()
+        self.device.cpu = FixedFactorCPUPlugin(self.device)
+
+    async def test_sample(self):
+        sampler = self.device.sampler(metrics=[Metric.CPU])
+
+        first = await sampler.sample()
+        # 和CPUSampler一样，第一次是开机以来的平均占用率
+        self.assertGreater(first.cpu.usage, 0)
+        self.assertTrue(first.cpu_cores)
+
+        second = await sampler.sample()
+        self.assertEqual(set(second.cpu_cores), set(first.cpu_cores))
+        self.assertGreaterEqual(second.cpu.usage, 0)
+        self.assertFalse(second.errors)
+
+        # 每次采样只读一次 /proc/stat
+        shells = [r for r in self.server.requests if r.startswith("shell")]
+        self.assertEqual(len(shells), 2)
+
+    async def test_app_cpu(self):
+        def proc_stat(total: int) -> ShellResult:
+            text = f"cpu  {total} 0 0 0 0 0 0 0 0 0\ncpu0 {total} 0 0 0\n"
+            return ShellResult(stdout=text.encode(), exit_code=0)
+
+        def pid_stat(utime: int) -> ShellResult:
+            text = f"1234 (demo) S 1 2 3 4 5 6 7 8 9 10 {utime} 0 0 0 20"
+            return ShellResult(stdout=text.encode(), exit_code=0)
+
+        reads = [
+            [proc_stat(1000), pid_stat(100)],
+            [proc_stat(1300), pid_stat(200)],
+            [proc_stat(1300), pid_stat(200)],
+        ]
+        self.device.read_files = mock.AsyncMock(side_effect=reads)
+        self.device.get_pid_by_pkgname = mock.AsyncMock(return_value=1234)
+
+        sampler = self.device.sampler(metrics=[Metric.CPU], package_name="com.demo")
+        expected = CPUSampler(self.device.cpu)
+        usages = []
+        for results in reads:
+            sample = await sampler.sample()
+            self.assertFalse(sample.errors)
+            self.assertEqual(
+                sample.app_cpu, expected.update(results, [1234], 1.0).processes[1234]
+            )
+            usages.append(sample.app_cpu.usage)
+
+        # 和get_pid_cpu_usage一致：第一次从开机算起，保留两位小数，总时间片没变化的时候是0
+        self.assertEqual(usages, [10.0, 33.33, 0])
+
+    async def test_traffic(self):
+        # 本机没有wlan0网卡，统计所有网卡
+        sampler = self.device.sampler(metrics=[Metric.TRAFFIC])
+        first = await sampler.sample()
+        self.assertFalse(first.errors)
+        self.assertEqual(first.traffic.receive, 0)
+
+        second = await sampler.sample()
+        self.assertGreaterEqual(second.traffic.receive, 0)
+
+    async def test_errors(self):
+        self.server.route_shell_v2("shell,v2,raw:", b"", exit_code=1)
+        sampler = self.device.sampler(metrics=[Metric.CPU])
+        sample = await sampler.sample()
+        self.assertIn("proc", sample.errors)
+        self.assertIsNone(sample.cpu)
+
+    async def test_stream(self):
+        samples = []
+        async for sample in self.device.sampler(0.05, metrics=[Metric.CPU]):
+            samples.append(sample)
+            if len(samples) == 3:
+                break
+
+        self.assertLess(samples[0].timestamp, samples[-1].timestamp)
@@ -0,0 +1,160 @@
+import asyncio
+import random
+import unittest
+
+from asyncio import StreamReader, StreamWriter
+from unittest import mock
+
+from async_adbc.protocol import Response
+from async_adbc.screenrecord import (
+    NAL_IDR,
+    NAL_PPS,
+    NAL_SPS,
+    NalSplitter,
+    nal_type,
+    screenrecord_command,
+)
+from tests.fakeadb import FakeADBTestCase, okay
+
+
+def nal(kind: int, size: int, long_start: bool = True) -> bytes:
+    start = b"\x00\x00\x00\x01" if long_start else b"\x00\x00\x01"
+    # 负载里不会出现起始码
+    return start + bytes([0x60 | kind]) + bytes([0x80 | (i % 0x7F) for i in range(size)])
+
+
+SEGMENT = [nal(NAL_SPS, 10), nal(NAL_PPS, 4, False), nal(NAL_IDR, 3000), nal(1, 500)]
+
+
+class TestNalSplitter(unittest.TestCase):
+    def test_split(self):
+        stream = b"".join(SEGMENT * 3)
+        rng = random.Random(0)
+        splitter = NalSplitter()
+        nals = []
+        offset = 0
+        while offset < len(stream):
+            size = rng.choice([1, 2, 3, 7, 100, 4096])
+            nals.extend(splitter.feed(stream[offset : offset + size]))
+            offset += size
+        last = splitter.flush()
+        assert last is not None
+        nals.append(last)
+
+        self.assertEqual(nals, SEGMENT * 3)
+        self.assertEqual([nal_type(n) for n in nals[:4]], [NAL_SPS, NAL_PPS, NAL_IDR, 1])
+
+    def test_garbage_before_start(self):
+        splitter = NalSplitter()
+        self.assertEqual(splitter.feed(b"\x12\x34" + SEGMENT[0][:5]), [])
+        self.assertEqual(splitter.feed(SEGMENT[0][5:] + SEGMENT[1]), [SEGMENT[0]])
+        self.assertEqual(splitter.flush(), SEGMENT[1])
+        self.assertIsNone(splitter.flush())
+
+    def test_command(self):
+        self.assertEqual(
+            screenrecord_command(4000000, "720x1280", 500),
+            "screenrecord --output-format=h264 --bit-rate 4000000 --size 720x1280"
+            " --time-limit 180 -",
+        )
+
+
+class TestScreenRecordStream(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_shell("shell:echo", b"\n")
+
+    async def test_segments(self):
+        segments = []
+
+        async def screenrecord(msg: str, reader: StreamReader, writer: StreamWriter):
+            segments.append(msg)
+            okay(writer)
+            writer.write(b"".join(SEGMENT))
+            await writer.drain()
+            await asyncio.sleep(1.2)
+
+        self.server.route("shell:screenrecord", screenrecord)
+        nals = [
+            n
+            async for n in self.device.screenrecord_stream(
+                size="720x1280", time_limit=2.5, segment_time=1.2, overlap=0.5
+            )
+        ]
+        # 第二段在第一段结束前启动，两段首尾相接
+        self.assertEqual(nals, SEGMENT * 2)
+        self.assertEqual(len(segments), 2)
+        self.assertIn("--size 720x1280", segments[0])
+
+    async def test_early_exit_after_next_started(self):
+        segments = []
+        second_started = asyncio.Event()
+        second_closed = asyncio.Event()
+
+        async def screenrecord(msg: str, reader: StreamReader, writer: StreamWriter):
+            segments.append(msg)
+            okay(writer)
+            await writer.drain()
+            if len(segments) == 1:
+                writer.write(b"".join(SEGMENT))
+                # 定时启动的下一段已经连上之后，这一段才提前结束
+                await second_started.wait()
+            elif len(segments) == 2:
+                second_started.set()
+                await reader.read()
+                second_closed.set()
+            else:
+                writer.write(b"".join(SEGMENT))
+                await writer.drain()
+                await asyncio.sleep(1)
+
+        class FrozenClock:
+            # 时间不走，每一段结束都算提前结束
+            def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+                self._loop = loop
+
+            def time(self) -> float:
+                return 0.0
+
+            def __getattr__(self, name: str):
+                return getattr(self._loop, name)
+
+        self.server.route("shell:screenrecord", screenrecord)
+        clock = FrozenClock(asyncio.get_running_loop())
+        nals = []
+        closed = []
+        close = Response.close
+
+        def spy_close(response: Response):
+            closed.append(response)
+            close(response)
+
+        with mock.patch("asyncio.get_event_loop", return_value=clock), mock.patch.object(
+            Response, "close", spy_close
+        ):
+            stream = self.device.screenrecord_stream(segment_time=1.1, overlap=1)
+            async for n in stream:
+                nals.append(n)
+                # 第三段最后一个NAL要等这一段结束才输出
+                if len(nals) == len(SEGMENT) * 2 - 1:
+                    break
+            await stream.aclose()
+
+        # 已经启动的第二段被关掉，由马上启动的第三段代替
+        await asyncio.wait_for(second_closed.wait(), 1)
+        self.assertEqual(len(segments), 3)
+        # 三段的连接都是显式关闭的，不靠GC
+        self.assertEqual(len(set(map(id, closed))), 3)
+        self.assertEqual(nals[: len(SEGMENT)], SEGMENT)
+
+    async def test_failure(self):
+        self.server.route_shell(
+            "shell:screenrecord", b"Unknown option --output-format\n"
+        )
+        with self.assertRaises(RuntimeError):
+            async for _ in self.device.screenrecord_stream():
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
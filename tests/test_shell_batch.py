@@ -0,0 +1,46 @@
+import unittest
+
+from tests.fakeadb import FakeADBTestCase
+
+
+class TestShellBatch(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_local_shell()
+
+    async def test_shell_batch(self):
+        results = await self.device.shell_batch(
+            ["echo hello", "printf 'no newline'", "echo oops >&2; false", "echo"]
+        )
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0].stdout, b"hello\n")
+        self.assertTrue(results[0].ok)
+        self.assertEqual(results[1].stdout, b"no newline")
+        self.assertEqual(results[2].exit_code, 1)
+        self.assertEqual(results[2].error, "oops")
+        self.assertEqual(results[3].stdout, b"\n")
+        # 所有命令只用了一次shell请求
+        shells = [r for r in self.server.requests if r.startswith("shell")]
+        self.assertEqual(len(shells), 1)
+
+    async def test_exit(self):
+        results = await self.device.shell_batch(["echo a", "exit 3", "echo b"])
+        self.assertEqual(results[0].output, "a")
+        self.assertEqual(results[1].exit_code, -1)
+        self.assertEqual(results[2].exit_code, -1)
+
+    async def test_empty(self):
+        self.assertEqual(await self.device.shell_batch([]), [])
+
+
+class TestShellBatchFallback(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    FEATURES = "cmd"
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_local_shell()
+
+    async def test_shell_batch(self):
+        results = await self.device.shell_batch(["echo hello", "false"])
+        self.assertEqual(results[0].output, "hello")
+        self.assertEqual(results[1].exit_code, 1)
@@ -0,0 +1,43 @@
+import unittest
+
+from tests.fakeadb import FakeADBTestCase
+
+
+class TestShellV2(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def test_shell_v2(self):
+        self.server.route_shell_v2(
+            "shell,v2,raw:ls /sdcard", stdout=b"a\nb\n", stderr=b"warn\n"
+        )
+        res = await self.device.shell_v2("ls", "/sdcard")
+        self.assertTrue(res.ok)
+        self.assertEqual(res.stdout, b"a\nb\n")
+        self.assertEqual(res.error, "warn")
+
+    async def test_file_exists(self):
+        self.server.route_shell_v2(
+            "shell,v2,raw:ls /not_exist",
+            stderr=b"ls: /not_exist: No such file or directory\n",
+            exit_code=1,
+        )
+        self.server.route_shell_v2("shell,v2,raw:ls /exist", stdout=b"/exist\n")
+
+        self.assertFalse(await self.device.file_exists("/not_exist"))
+        self.assertTrue(await self.device.file_exists("/exist"))
+
+    async def test_pid_cpu_stat(self):
+        self.server.route_shell_v2("shell,v2,raw:", exit_code=1)
+        stat = await self.device.cpu.get_pid_cpu_stat(1)
+        self.assertEqual(stat.utime, 0)
+
+
+class TestShellV2Fallback(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    FEATURES = "cmd"
+
+    async def test_fallback(self):
+        self.server.route_shell(
+            "shell:ls /sdcard", b"ls: /sdcard: Permission denied\n__ADBC_EXIT__1\n"
+        )
+        res = await self.device.shell_v2("ls", "/sdcard")
+        self.assertEqual(res.exit_code, 1)
+        self.assertEqual(res.output, "ls: /sdcard: Permission denied")
+        self.assertNotIn("shell,v2,raw:ls /sdcard", self.server.requests)
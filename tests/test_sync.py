@@ -0,0 +1,138 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+
+from tests.fakeadb import FakeADBTestCase
+
+
+class TestSync(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.remote = os.path.join(self.tmpdir.name, "remote")
+        self.local = os.path.join(self.tmpdir.name, "local")
+        os.makedirs(self.local)
+        self.server.route_sync(self.remote)
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.tmpdir.cleanup()
+
+    async def test_push_pull(self):
+        data = os.urandom(300 * 1024)
+        src = os.path.join(self.local, "src.bin")
+        with open(src, "wb") as f:
+            f.write(data)
+
+        progress = []
+        await self.device.push(
+            src, "/sdcard/src.bin", progress_cb=lambda *args: progress.append(args)
+        )
+        self.assertEqual(progress[-1], (src, len(data), len(data)))
+        with open(os.path.join(self.remote, "sdcard/src.bin"), "rb") as f:
+            self.assertEqual(f.read(), data)
+
+        dst = os.path.join(self.local, "dst.bin")
+        await self.device.pull("/sdcard/src.bin", dst)
+        with open(dst, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    async def test_push_stream(self):
+        async def chunks():
+            # 大于DATA_MAX_LENGTH的块会被切分
+            yield b"a" * 100000
+            yield b"b" * 10
+
+        await self.device.push_stream(chunks(), "/sdcard/stream.bin")
+        with open(os.path.join(self.remote, "sdcard/stream.bin"), "rb") as f:
+            self.assertEqual(f.read(), b"a" * 100000 + b"b" * 10)
+
+        await self.device.push_stream(io.BytesIO(b"hello"), "/sdcard/io.bin")
+        buffer = io.BytesIO()
+        await self.device.pull("/sdcard/io.bin", buffer)
+        self.assertEqual(buffer.getvalue(), b"hello")
+
+    async def test_pull_stream(self):
+        os.makedirs(os.path.join(self.remote, "sdcard"))
+        with open(os.path.join(self.remote, "sdcard/big.bin"), "wb") as f:
+            f.write(b"x" * 200000)
+
+        chunks = [chunk async for chunk in self.device.pull_stream("/sdcard/big.bin")]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(map(len, chunks)), 200000)
+
+    async def test_pull_not_exist(self):
+        with self.assertRaises(RuntimeError):
+            await self.device.pull("/sdcard/none", io.BytesIO())
+
+    def _make_tree(self, root: str, files: dict):
+        for rel_path, content in files.items():
+            path = os.path.join(root, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+
+    async def test_stat_list(self):
+        self._make_tree(self.remote, {"sdcard/a.txt": b"abc", "sdcard/d/b.txt": b""})
+
+        stat = await self.device.stat("/sdcard/a.txt")
+        self.assertTrue(stat.is_file)
+        self.assertEqual(stat.size, 3)
+
+        stat = await self.device.stat("/sdcard/none")
+        self.assertFalse(stat.exists)
+
+        entries = await self.device.list_dir("/sdcard")
+        self.assertEqual({e.name for e in entries}, {"a.txt", "d"})
+
+    async def test_push_dir(self):
+        src = os.path.join(self.local, "assets")
+        self._make_tree(src, {"a.bin": b"a" * 70000, "sub/b.bin": b"b", "sub/c.bin": b""})
+
+        result = await self.device.push_dir(src, "/sdcard/assets", concurrency=2)
+        self.assertEqual(sorted(result.transferred), ["a.bin", "sub/b.bin", "sub/c.bin"])
+
+        # 没有变化的文件不会再推送
+        result = await self.device.sync(src, "/sdcard/assets")
+        self.assertEqual(result.transferred, [])
+        self.assertEqual(len(result.skipped), 3)
+
+        self._make_tree(src, {"sub/b.bin": b"bb"})
+        result = await self.device.sync(src, "/sdcard/assets")
+        self.assertEqual(result.transferred, ["sub/b.bin"])
+
+        with open(os.path.join(self.remote, "sdcard/assets/sub/b.bin"), "rb") as f:
+            self.assertEqual(f.read(), b"bb")
+
+    async def test_workers_cancel_on_error(self):
+        started = []
+        finished = []
+
+        async def job(sync, rel_path: str):
+            started.append(rel_path)
+            if rel_path == "bad":
+                raise RuntimeError("boom")
+            await asyncio.sleep(10)
+            finished.append(rel_path)
+
+        with self.assertRaises(RuntimeError):
+            await asyncio.wait_for(
+                self.device._run_sync_workers(["slow-1", "bad", "slow-2"], job, 2), 5
+            )
+        # 另一条连接上的传输被取消，剩下的文件不会再被取走
+        self.assertEqual(finished, [])
+        self.assertEqual(started, ["slow-1", "bad"])
+
+    async def test_pull_dir(self):
+        self._make_tree(self.remote, {"sdcard/logs/1.log": b"1", "sdcard/logs/x/2.log": b"22"})
+        dst = os.path.join(self.local, "logs")
+
+        result = await self.device.pull_dir("/sdcard/logs", dst)
+        self.assertEqual(sorted(result.transferred), ["1.log", "x/2.log"])
+        with open(os.path.join(dst, "x", "2.log"), "rb") as f:
+            self.assertEqual(f.read(), b"22")
+
+        result = await self.device.pull_dir("/sdcard/logs", dst)
+        self.assertEqual(result.transferred, [])
@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from async_adbc.plugins import temp
+from async_adbc.plugins.temp import TempPlugin, parse_thermal_index
+from tests.fakeadb import FakeADBTestCase
+
+INDEX_OUTPUT = """0b1e6f3e-1111-2222-3333-444455556666
+/sys/devices/virtual/thermal/thermal_zone0/type:battery
+/sys/devices/virtual/thermal/thermal_zone10/type:cpu-0-0-us
+/sys/devices/virtual/thermal/thermal_zone2/type:gpuss-0-us
+/sys/devices/virtual/thermal/thermal_zone3/type:skin-therm
+/sys/devices/virtual/thermal/thermal_zone4/type:skin-therm
+"""
+
+
+def write(path: str, text: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+class TestThermalIndex(unittest.TestCase):
+    def test_parse(self):
+        index = parse_thermal_index(INDEX_OUTPUT)
+        self.assertEqual(index.boot_id, "0b1e6f3e-1111-2222-3333-444455556666")
+        # thermal_zone1读不出来，其他传感器不会错位
+        self.assertEqual([zone.index for zone in index.zones], [0, 2, 3, 4, 10])
+        self.assertEqual(
+            index.zones[-1].path, "/sys/devices/virtual/thermal/thermal_zone10/temp"
+        )
+        self.assertEqual(
+            [zone.name for zone in index.zones if zone.type == "skin-therm"],
+            ["skin-therm:thermal_zone3", "skin-therm:thermal_zone4"],
+        )
+
+    def test_find(self):
+        index = parse_thermal_index(INDEX_OUTPUT)
+        zone = index.find(TempPlugin.CPU_MARKS)
+        assert zone is not None
+        self.assertEqual(zone.index, 10)
+        self.assertIsNone(index.find(TempPlugin.NPU_MARKS))
+
+
+class TestTempPlugin(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # 用本机的临时目录代替设备的 /sys 和 boot_id
+        self.server.route_local_shell()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = self.tmpdir.name
+        self.boot_id = os.path.join(root, "boot_id")
+        write(self.boot_id, "boot-1\n")
+        for index, (zone_type, value) in enumerate(
+            [("cpu-0-0-us", "45000"), ("battery", "310"), ("skin", "29")]
+        ):
+            write(os.path.join(root, f"thermal_zone{index}", "type"), zone_type + "\n")
+            write(os.path.join(root, f"thermal_zone{index}", "temp"), value + "\n")
+
+        # 被关掉的传感器，temp读取失败
+        write(os.path.join(root, "thermal_zone3", "type"), "disabled\n")
+
+        self.device.temp.THERMAL_DIR = root
+        patcher = mock.patch.object(temp, "BOOT_ID_FILE", self.boot_id)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.tmpdir.cleanup()
+
+    def shells(self):
+        return [r for r in self.server.requests if r.startswith("shell")]
+
+    async def test_temps(self):
+        temps = await self.device.temp.temps()
+        self.assertEqual(temps, {"cpu-0-0-us": 45.0, "battery": 31.0, "skin": 29.0})
+        self.assertEqual(await self.device.temp.temps(["skin"]), {"skin": 29.0})
+        # 一次获取传感器表，之后每次采样一次读取
+        self.assertEqual(len(self.shells()), 3)
+
+    async def test_stat(self):
+        stat = await self.device.temp.stat()
+        self.assertEqual(stat.cpu, 45.0)
+        self.assertEqual(stat.battery, 31.0)
+        self.assertEqual(stat.zones["skin"], 29.0)
+        self.assertEqual(stat.gpu, 0)
+
+        # 找不到保底温度文件的结果也会缓存，不会每次都重新探测
+        await self.device.temp.stat()
+        self.assertEqual(len(self.shells()), 4)
+
+    async def test_reboot(self):
+        await self.device.temp.temps()
+        write(self.boot_id, "boot-2\n")
+        write(
+            os.path.join(self.device.temp.THERMAL_DIR, "thermal_zone2", "type"),
+            "npu\n",
+        )
+        temps = await self.device.temp.temps()
+        self.assertIn("npu", temps)
+        index = await self.device.temp.thermal_index()
+        self.assertEqual(index.boot_id, "boot-2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from async_adbc.plugins import traffic
+from async_adbc.plugins.traffic import (
+    TrafficBackend,
+    TrafficStat,
+    parse_net_dev,
+    parse_netstats_uid,
+    parse_qtaguid_stats,
+    traffic_delta,
+)
+from tests.fakeadb import FakeADBTestCase
+
+NET_DEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:    1000      10    0    0    0     0          0         0     1000      10    0    0    0     0       0          0
+rmnet0:     300       3    0    0    0     0          0         0      30       1    0    0    0     0       0          0
+"""
+
+PACKAGES = b"package:com.demo uid:10123\npackage:com.other uid:10200\n"
+
+
+def qtaguid_stats(demo_wlan: int, demo_rmnet: int) -> str:
+    return (
+        "idx iface acct_tag_hex uid_tag_int cnt_set rx_bytes rx_packets tx_bytes tx_packets\n"
+        f"2 wlan0 0x0 10123 0 {demo_wlan} 1 10 1\n"
+        f"3 wlan0 0x0 10123 1 {demo_wlan} 1 10 1\n"
+        "4 wlan0 0x3e800000000 10123 0 999999 1 999999 1\n"
+        f"5 rmnet0 0x0 10123 0 {demo_rmnet} 1 0 0\n"
+        "6 wlan0 0x0 10200 0 500 1 50 1\n"
+    )
+
+
+NETSTATS = """Dev stats:
+  ident=[{type=WIFI, ratType=COMBINED}] uid=-1 set=ALL tag=0x0
+      st=1600000000 rb=99999 rp=1 tb=99999 tp=1 op=0
+UID stats:
+  Complete history:
+  ident=[{type=WIFI, ratType=COMBINED, metered=false}] uid=10123 set=DEFAULT tag=0x0
+    NetworkStatsHistory: bucketDuration=7200
+      st=1600000000 rb=100 rp=1 tb=10 tp=1 op=0
+      st=1600007200 rb=50 rp=1 tb=5 tp=1 op=0
+  ident=[{type=WIFI, ratType=COMBINED, metered=false}] uid=10123 set=FOREGROUND tag=0x0
+    NetworkStatsHistory: bucketDuration=7200
+      st=1600000000 rb=20 rp=1 tb=2 tp=1 op=0
+  ident=[{type=MOBILE, ratType=COMBINED, metered=true}] uid=10200 set=DEFAULT tag=0x0
+    NetworkStatsHistory: bucketDuration=7200
+      st=1600000000 rb=7 rp=1 tb=3 tp=1 op=0
+UID tag stats:
+  ident=[{type=WIFI, ratType=COMBINED}] uid=10123 set=DEFAULT tag=0x3e8
+      st=1600000000 rb=88888 rp=1 tb=88888 tp=1 op=0
+"""
+
+
+class TestTrafficParse(unittest.TestCase):
+    def test_net_dev(self):
+        # 没有wlan0，总和不含回环网卡
+        self.assertEqual(parse_net_dev(NET_DEV).receive, 300)
+        self.assertEqual(parse_net_dev(NET_DEV, "wlan0:").receive, 0)
+        self.assertEqual(parse_net_dev(NET_DEV, "lo").send, 1000)
+
+    def test_qtaguid(self):
+        uids = parse_qtaguid_stats(qtaguid_stats(100, 7))
+        self.assertEqual(uids[10123]["wlan0"], TrafficStat(receive=200, send=20))
+        self.assertEqual(uids[10123]["rmnet0"].receive, 7)
+        self.assertEqual(uids[10200]["wlan0"].send, 50)
+
+    def test_netstats(self):
+        uids = parse_netstats_uid(NETSTATS)
+        self.assertEqual(uids[10123], {"WIFI": TrafficStat(receive=170, send=17)})
+        self.assertEqual(uids[10200]["MOBILE"].receive, 7)
+        self.assertNotIn(-1, uids)
+
+    def test_delta(self):
+        last = {"wlan0": TrafficStat(receive=100, send=10)}
+        self.assertEqual(traffic_delta(last, None).receive, 0)
+        current = {
+            "wlan0": TrafficStat(receive=150, send=10),
+            "rmnet0": TrafficStat(receive=5, send=1),
+        }
+        self.assertEqual(traffic_delta(current, last), TrafficStat(receive=55, send=1))
+        # 计数清零
+        reset = {"wlan0": TrafficStat(receive=30, send=3)}
+        self.assertEqual(traffic_delta(reset, last), TrafficStat(receive=30, send=3))
+        # netstats最早的时间桶过期，总和变小不是清零
+        self.assertEqual(
+            traffic_delta(reset, last, reset_as_new=False), TrafficStat(receive=0, send=0)
+        )
+
+
+class TestTrafficUid(FakeADBTestCase, unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.server.route_local_shell()
+        self.server.route_shell("shell:pm list packages -U", PACKAGES)
+
+    async def test_qtaguid_stats(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "stats")
+            with mock.patch.object(traffic, "QTAGUID_STATS", path):
+                with open(path, "w") as f:
+                    f.write(qtaguid_stats(100, 7))
+                first = await self.device.traffic.stats("com.demo", "com.other")
+                self.assertEqual(first["com.demo"].receive, 0)
+
+                with open(path, "w") as f:
+                    f.write(qtaguid_stats(150, 10))
+                second = await self.device.traffic.stats("com.demo", "com.other")
+                self.assertEqual(second["com.demo"].receive, 103)
+                self.assertEqual(second["com.other"].receive, 0)
+
+                # 每个包名单独保存状态，和其他包名混着调用不影响差值
+                with open(path, "w") as f:
+                    f.write(qtaguid_stats(160, 10))
+                third = await self.device.traffic.stat("com.demo")
+                self.assertEqual(third.receive, 20)
+
+        self.assertEqual(self.device.traffic._backend, TrafficBackend.QTAGUID)
+        pm = [r for r in self.server.requests if r.startswith("shell:pm")]
+        self.assertEqual(len(pm), 1)
+
+    async def test_netstats_fallback(self):
+        self.server.route_shell("shell:dumpsys netstats", NETSTATS.encode())
+        with mock.patch.object(traffic, "QTAGUID_STATS", "/nonexistent/stats"):
+            stats = await self.device.traffic.stats("com.other")
+        self.assertEqual(stats["com.other"].receive, 0)
+        self.assertEqual(self.device.traffic._backend, TrafficBackend.NETSTATS)
+
+    async def test_netstats_bucket_rolloff(self):
+        with mock.patch.object(traffic, "QTAGUID_STATS", "/nonexistent/stats"):
+            self.server.route_shell("shell:dumpsys netstats", NETSTATS.encode())
+            await self.device.traffic.stats("com.demo")
+
+            # 最早的桶（rb=100）过期，不能当成计数清零把剩下的流量全算一遍
+            rolled = NETSTATS.replace(
+                "      st=1600000000 rb=100 rp=1 tb=10 tp=1 op=0\n", ""
+            )
+            self.server.route_shell("shell:dumpsys netstats", rolled.encode())
+            stats = await self.device.traffic.stats("com.demo")
+
+        self.assertEqual(stats["com.demo"], TrafficStat(receive=0, send=0))
+
+    async def test_unknown_package(self):
+        self.server.route_shell("shell:dumpsys package", b"Unable to find package\n")
+        with self.assertRaises(ValueError):
+            await self.device.traffic.get_uid("com.missing")
+
+        self.server.route_shell("shell:dumpsys package", b"    userId=10999\n")
+        self.assertEqual(await self.device.traffic.get_uid("com.new"), 10999)
+
+    async def test_global(self):
+        first = await self.device.traffic.stat()
+        self.assertEqual(first.receive, 0)
+        second = await self.device.traffic.stat()
+        self.assertGreaterEqual(second.receive, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()